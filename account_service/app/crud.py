@@ -1,34 +1,410 @@
+from sqlalchemy import Date, delete, func, insert, select, union_all, update
 from sqlalchemy.orm import Session
+from datetime import datetime, time, timedelta
+from decimal import Decimal
 from . import models, schemas
+from .money import ZERO
+
+def select_account(account_id: int):
+    return select(models.Account).where(models.Account.id == account_id)
+
+def select_accounts(skip: int = 0, limit: int = 100, after_id: int = None, ids: list = None, user_id: int = None):
+    # Keyset pagination over the primary key; skip is only a legacy fallback
+    stmt = select(models.Account).order_by(models.Account.id).limit(limit)
+    if ids is not None:
+        # Bulk lookup: one IN (...) query instead of a GET per account
+        stmt = stmt.where(models.Account.id.in_(ids))
+    if user_id is not None:
+        stmt = stmt.where(models.Account.user_id == user_id)
+    if after_id is not None:
+        return stmt.where(models.Account.id > after_id)
+    return stmt.offset(skip)
 
 def get_account(db: Session, account_id: int):
-    return db.query(models.Account).filter(models.Account.id == account_id).first()
+    return db.scalars(select_account(account_id)).first()
+
+def get_accounts(db: Session, skip: int = 0, limit: int = 100, after_id: int = None):
+    return db.scalars(select_accounts(skip, limit, after_id)).all()
+
+def _account_row(db: Session, account_id: int):
+    # Id, owner and current balance, read after this transaction's own entries
+    return db.execute(
+        select(models.Account.id, models.Account.user_id, models.Account.account_type, models.Account.balance)
+        .where(models.Account.id == account_id)
+    ).first()
+
+def _lock_account(db: Session, account_id: int, debit: bool):
+    """Lock an account row for a ledger write; returns None if it does not exist.
 
-def get_accounts(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Account).offset(skip).limit(limit).all()
+    Credits take FOR KEY SHARE, so they never wait on one another. Debits take
+    FOR NO KEY UPDATE, so two debits of one account cannot both pass the
+    balance check. Both conflict with the FOR UPDATE the snapshotter takes.
+    """
+    stmt = select(models.Account.id).where(models.Account.id == account_id)
+    if debit:
+        stmt = stmt.with_for_update(key_share=True)
+    else:
+        stmt = stmt.with_for_update(read=True, key_share=True)
+    return db.execute(stmt).first()
+
+def _post_entry(db: Session, account_id: int, amount: Decimal, entry_type: str, counterparty_account_id: int = None):
+    """Append one ledger entry unless it would overdraw the account.
+
+    Returns the account row with its new balance, or None if the account does
+    not exist or a debit exceeds the balance. Does not commit.
+    """
+    if _lock_account(db, account_id, debit=amount < 0) is None:
+        return None
+    if amount < 0:
+        balance = db.scalar(select(models.Account.balance).where(models.Account.id == account_id))
+        if balance + amount < 0:
+            return None
+    db.execute(insert(models.LedgerEntry).values(
+        account_id=account_id,
+        amount=amount,
+        entry_type=entry_type,
+        counterparty_account_id=counterparty_account_id,
+        created_at=datetime.utcnow()
+    ))
+    return _account_row(db, account_id)
 
 def create_account(db: Session, account: schemas.AccountCreate):
     db_account = models.Account(
         user_id=account.user_id,
         account_type=account.account_type,
-        balance=account.balance
+        snapshot_balance=ZERO,
+        snapshot_entry_id=0
     )
     db.add(db_account)
+    db.flush()
+    if account.balance:
+        _post_entry(db, db_account.id, account.balance, "opening")
     db.commit()
     db.refresh(db_account)
     return db_account
 
-def update_account_balance(db: Session, account_id: int, new_balance: float):
-    db_account = db.query(models.Account).filter(models.Account.id == account_id).first()
-    if db_account:
-        db_account.balance = new_balance
+def update_account_balance(db: Session, account_id: int, new_balance: Decimal):
+    """Set a balance by appending an adjustment entry for the difference"""
+    try:
+        if _lock_account(db, account_id, debit=True) is None:
+            return None
+        balance = db.scalar(select(models.Account.balance).where(models.Account.id == account_id))
+        if new_balance != balance:
+            _post_entry(db, account_id, new_balance - balance, "adjustment")
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return get_account(db, account_id)
+
+def get_applied_operation(db: Session, key: str):
+    """Stored response body of a balance change already applied under key, if any"""
+    return db.scalar(
+        select(models.AppliedOperation.response_body)
+        .where(models.AppliedOperation.key == key, models.AppliedOperation.expires_at > datetime.utcnow())
+    )
+
+def get_applied_operations(db: Session, keys: list) -> dict:
+    """Stored response bodies, by key, of the balance changes already applied under keys"""
+    if not keys:
+        return {}
+    return dict(db.execute(
+        select(models.AppliedOperation.key, models.AppliedOperation.response_body)
+        .where(models.AppliedOperation.key.in_(keys), models.AppliedOperation.expires_at > datetime.utcnow())
+    ).all())
+
+def _record_operation(db: Session, key: str, response_body: str, ttl: float):
+    # Inserted in the balance change's own transaction: a concurrent copy of the
+    # same request conflicts on the primary key and rolls back its entries
+    now = datetime.utcnow()
+    db.execute(delete(models.AppliedOperation).where(
+        models.AppliedOperation.key == key, models.AppliedOperation.expires_at <= now
+    ))
+    db.execute(insert(models.AppliedOperation).values(
+        key=key, response_body=response_body, created_at=now, expires_at=now + timedelta(seconds=ttl)
+    ))
+
+def adjust_account_balance(db: Session, account_id: int, amount: Decimal, operation_key: str = None, operation_ttl: float = 0):
+    """Credit or debit (negative amount) an account with one ledger entry.
+
+    Returns the updated account row, or None if the account does not exist or
+    the balance would drop below zero. With an operation_key the response is
+    stored in the same commit; a concurrent request with the same key then
+    fails with IntegrityError instead of applying the change twice.
+    """
+    try:
+        db_account = _post_entry(db, account_id, amount, "deposit" if amount > 0 else "withdraw")
+        if db_account is not None and operation_key:
+            _record_operation(db, operation_key, schemas.AccountResponse(**db_account._mapping).json(), operation_ttl)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return db_account
+
+def _adjustment_result(account_id: int, amount: Decimal, applied: bool, row):
+    if applied:
+        return schemas.AccountAdjustBatchResult(account_id=account_id, status="applied", user_id=row.user_id, balance=row.balance)
+    if row is None:
+        return schemas.AccountAdjustBatchResult(account_id=account_id, status="not_found", detail=f"Account {account_id} not found")
+    return schemas.AccountAdjustBatchResult(
+        account_id=account_id,
+        status="insufficient_balance",
+        user_id=row.user_id,
+        balance=row.balance,
+        detail=f"Insufficient balance. Current balance: ${row.balance:.2f}, Requested: ${-amount:.2f}"
+    )
+
+def adjust_account_balances(db: Session, adjustments: list, operation_ttl: float = 0):
+    """Apply a list of (account_id, amount, operation_key) items in one DB transaction and one commit.
+
+    Every item gets its own ledger entry, checked like adjust_account_balance
+    against the balance left by the items before it, so an item that would
+    overdraw fails alone. Zero amounts write no entry. Items are applied in
+    account id order (keeping their order within an account) so concurrent
+    batches cannot deadlock. An item whose operation_key was already applied
+    is answered from its stored result instead; applied items with a key
+    store theirs in the same commit, so a concurrent copy fails with
+    IntegrityError. Returns (results, number replayed), one
+    AccountAdjustBatchResult per item in the order given; a rejected item
+    reports the balance it was checked against.
+    """
+    applied_operations = get_applied_operations(db, [key for _, _, key in adjustments if key])
+    results = [None] * len(adjustments)
+    replayed = 0
+    try:
+        for index in sorted(range(len(adjustments)), key=lambda index: adjustments[index][0]):
+            account_id, amount, operation_key = adjustments[index]
+            if operation_key in applied_operations:
+                results[index] = schemas.AccountAdjustBatchResult.parse_raw(applied_operations[operation_key])
+                replayed += 1
+                continue
+            row = None
+            if amount:
+                row = _post_entry(db, account_id, amount, "deposit" if amount > 0 else "withdraw")
+            if row is None:
+                # Zero amounts, missing accounts and overdrafts leave the balance as it stands
+                row = _account_row(db, account_id)
+                results[index] = _adjustment_result(account_id, amount, amount == 0 and row is not None, row)
+            else:
+                results[index] = _adjustment_result(account_id, amount, True, row)
+            if operation_key and results[index].status == "applied":
+                _record_operation(db, operation_key, results[index].json(), operation_ttl)
         db.commit()
-        db.refresh(db_account)
-        return db_account
-    return None
+    except Exception:
+        db.rollback()
+        raise
+    return results, replayed
+
+def transfer_between_accounts(db: Session, source_account_id: int, target_account_id: int, amount: Decimal,
+                              operation_key: str = None, operation_ttl: float = 0):
+    """Atomically move amount from source to target in a single DB transaction.
+
+    Writes a transfer_out and a transfer_in entry. Returns (source, target)
+    updated rows, or None if either account does not exist or the source has
+    insufficient balance. operation_key works as for adjust_account_balance.
+    """
+    legs = {
+        source_account_id: (-amount, "transfer_out", target_account_id),
+        target_account_id: (amount, "transfer_in", source_account_id)
+    }
+    updated = {}
+    try:
+        # Lock rows in id order so concurrent opposite transfers cannot deadlock
+        for account_id in sorted(legs):
+            leg_amount, entry_type, counterparty_account_id = legs[account_id]
+            db_account = _post_entry(db, account_id, leg_amount, entry_type, counterparty_account_id)
+            if db_account is None:
+                db.rollback()
+                return None
+            updated[account_id] = db_account
+        if operation_key:
+            response = schemas.AccountTransferResponse(
+                source=schemas.AccountResponse(**updated[source_account_id]._mapping),
+                target=schemas.AccountResponse(**updated[target_account_id]._mapping)
+            )
+            _record_operation(db, operation_key, response.json(), operation_ttl)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return updated[source_account_id], updated[target_account_id]
 
 def delete_account(db: Session, account_id: int):
     account = db.query(models.Account).filter(models.Account.id == account_id).first()
     if account:
+        db.query(models.LedgerEntry).filter(models.LedgerEntry.account_id == account_id).delete(synchronize_session=False)
+        db.query(models.BalanceSnapshot).filter(models.BalanceSnapshot.account_id == account_id).delete(synchronize_session=False)
+        db.query(models.LedgerDailyTotal).filter(models.LedgerDailyTotal.account_id == account_id).delete(synchronize_session=False)
         db.delete(account)
         db.commit()
+
+def purge_expired_operations(db: Session, limit: int = 1000) -> int:
+    expired_keys = (
+        select(models.AppliedOperation.key)
+        .where(models.AppliedOperation.expires_at < datetime.utcnow())
+        .limit(limit)
+    )
+    purged = db.query(models.AppliedOperation).filter(
+        models.AppliedOperation.key.in_(expired_keys)
+    ).delete(synchronize_session=False)
+    db.commit()
+    return purged
+
+def select_ledger_entries(account_id: int, limit: int = 100, after_id: int = None):
+    stmt = select(models.LedgerEntry).where(models.LedgerEntry.account_id == account_id)
+    if after_id is not None:
+        stmt = stmt.where(models.LedgerEntry.id > after_id)
+    return stmt.order_by(models.LedgerEntry.id).limit(limit)
+
+def get_balance_at(db: Session, account_id: int, at: datetime) -> Decimal:
+    """Rebuild a balance as of a point in time: nearest earlier snapshot plus replay"""
+    snapshot = db.execute(
+        select(models.BalanceSnapshot.balance, models.BalanceSnapshot.ledger_entry_id)
+        .where(models.BalanceSnapshot.account_id == account_id, models.BalanceSnapshot.as_of <= at)
+        .order_by(models.BalanceSnapshot.ledger_entry_id.desc())
+        .limit(1)
+    ).first()
+    balance, after_id = (snapshot.balance, snapshot.ledger_entry_id) if snapshot else (ZERO, 0)
+    replayed = db.scalar(
+        select(func.coalesce(func.sum(models.LedgerEntry.amount), ZERO))
+        .where(
+            models.LedgerEntry.account_id == account_id,
+            models.LedgerEntry.id > after_id,
+            models.LedgerEntry.created_at <= at
+        )
+    )
+    return balance + replayed
+
+def _entry_day():
+    # UTC day of a ledger entry; date() exists on both PostgreSQL and SQLite
+    return func.date(models.LedgerEntry.created_at, type_=Date)
+
+def get_daily_totals(db: Session, account_id: int, start_day, end_day):
+    """Per-day, per-type entry count and signed sum between two UTC days (inclusive).
+
+    Entries up to the account's snapshot come from ledger_daily_totals and the
+    tail after it is aggregated live. Both halves are one statement, so a
+    snapshot taken concurrently cannot count an entry twice or miss it.
+    """
+    totals = models.LedgerDailyTotal
+    day = _entry_day()
+    folded = select(
+        totals.day.label("day"),
+        totals.entry_type.label("entry_type"),
+        totals.entry_count.label("count"),
+        totals.total_amount.label("total")
+    ).where(totals.account_id == account_id, totals.day >= start_day, totals.day <= end_day)
+    tail = (
+        select(
+            day.label("day"),
+            models.LedgerEntry.entry_type.label("entry_type"),
+            func.count().label("count"),
+            func.sum(models.LedgerEntry.amount).label("total")
+        )
+        .join(models.Account, models.Account.id == models.LedgerEntry.account_id)
+        .where(
+            models.LedgerEntry.account_id == account_id,
+            models.LedgerEntry.id > models.Account.snapshot_entry_id,
+            models.LedgerEntry.created_at >= datetime.combine(start_day, time.min),
+            models.LedgerEntry.created_at < datetime.combine(end_day + timedelta(days=1), time.min)
+        )
+        .group_by(day, models.LedgerEntry.entry_type)
+    )
+    combined = union_all(folded, tail).subquery()
+    return db.execute(
+        select(
+            combined.c.day,
+            combined.c.entry_type,
+            func.sum(combined.c.count).label("count"),
+            func.sum(combined.c.total).label("total")
+        )
+        .group_by(combined.c.day, combined.c.entry_type)
+        .order_by(combined.c.day, combined.c.entry_type)
+    ).all()
+
+def _fold_into_daily_totals(db: Session, account_id: int, after_id: int, through_id: int):
+    # Only the snapshotter writes daily totals, under the account's FOR UPDATE lock
+    day = _entry_day()
+    tail = db.execute(
+        select(day.label("day"), models.LedgerEntry.entry_type, func.count().label("count"),
+               func.sum(models.LedgerEntry.amount).label("total"))
+        .where(
+            models.LedgerEntry.account_id == account_id,
+            models.LedgerEntry.id > after_id,
+            models.LedgerEntry.id <= through_id
+        )
+        .group_by(day, models.LedgerEntry.entry_type)
+    ).all()
+    totals = models.LedgerDailyTotal
+    for row in tail:
+        updated = (
+            db.query(totals)
+            .filter(totals.account_id == account_id, totals.day == row.day, totals.entry_type == row.entry_type)
+            .update({
+                totals.entry_count: totals.entry_count + row.count,
+                totals.total_amount: totals.total_amount + row.total
+            }, synchronize_session=False)
+        )
+        if not updated:
+            db.execute(insert(totals).values(
+                account_id=account_id, day=row.day, entry_type=row.entry_type,
+                entry_count=row.count, total_amount=row.total
+            ))
+
+def accounts_due_for_snapshot(db: Session, min_entries: int, limit: int = 100):
+    """Accounts with at least min_entries ledger entries since their last snapshot"""
+    return db.scalars(
+        select(models.LedgerEntry.account_id)
+        .join(models.Account, models.Account.id == models.LedgerEntry.account_id)
+        .where(models.LedgerEntry.id > models.Account.snapshot_entry_id)
+        .group_by(models.LedgerEntry.account_id)
+        .having(func.count() >= min_entries)
+        .limit(limit)
+    ).all()
+
+def snapshot_account_balance(db: Session, account_id: int):
+    """Fold an account's ledger tail into its stored snapshot and daily totals.
+
+    FOR UPDATE waits for in-flight ledger writes on the account, so every
+    entry below the new snapshot id is committed when the tail is summed.
+    """
+    try:
+        account = db.execute(
+            select(models.Account.snapshot_balance, models.Account.snapshot_entry_id)
+            .where(models.Account.id == account_id)
+            .with_for_update()
+        ).first()
+        if account is None:
+            db.rollback()
+            return None
+        tail = db.execute(
+            select(
+                func.sum(models.LedgerEntry.amount),
+                func.max(models.LedgerEntry.id),
+                func.max(models.LedgerEntry.created_at)
+            )
+            .where(models.LedgerEntry.account_id == account_id, models.LedgerEntry.id > account.snapshot_entry_id)
+        ).first()
+        if tail[1] is None:
+            db.rollback()
+            return None
+        balance = account.snapshot_balance + tail[0]
+        _fold_into_daily_totals(db, account_id, account.snapshot_entry_id, tail[1])
+        db.execute(
+            update(models.Account)
+            .where(models.Account.id == account_id)
+            .values(snapshot_balance=balance, snapshot_entry_id=tail[1])
+        )
+        db.execute(insert(models.BalanceSnapshot).values(
+            account_id=account_id,
+            ledger_entry_id=tail[1],
+            balance=balance,
+            as_of=tail[2],
+            created_at=datetime.utcnow()
+        ))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return balance
@@ -0,0 +1,105 @@
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+import asyncio
+import fcntl
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# Worker processes per pod; uvicorn --workers defaults to the same variable
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+# Connections each worker opens at startup, so first requests skip the connect
+DB_POOL_WARM_CONNECTIONS = int(os.getenv("DB_POOL_WARM_CONNECTIONS", "2"))
+# Where workers of one pod take the lock files that share out background jobs
+WORKER_LOCK_DIR = os.getenv("WORKER_LOCK_DIR", tempfile.gettempdir())
+
+_held_locks = []
+
+def claim_worker_slot(job: str, slots: int) -> bool:
+    """Whether this worker process runs job, which at most slots workers per pod may run.
+
+    Slots are lock files held for the life of the process. When a worker
+    dies its lock is released, and the worker started in its place takes
+    the slot over. A single-worker server always runs the job (if slots > 0).
+    """
+    if slots <= 0:
+        return False
+    if WEB_CONCURRENCY <= 1:
+        return True
+    for slot in range(slots):
+        lock_file = open(os.path.join(WORKER_LOCK_DIR, f"{job}-{slot}.lock"), "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            continue
+        _held_locks.append(lock_file)
+        logger.info(f"Worker {os.getpid()} runs {job} (slot {slot})")
+        return True
+    return False
+
+class PoolWarmup:
+    """Opens this worker's first DB connections and records when that is done"""
+
+    def __init__(self, engine, async_engine=None, connections: int = DB_POOL_WARM_CONNECTIONS):
+        self.engine = engine
+        self.async_engine = async_engine
+        self.connections = connections
+        self.done = False
+        self._task = None
+
+    def _warm_sync_pool(self):
+        opened = []
+        try:
+            for _ in range(self.connections):
+                connection = self.engine.connect()
+                connection.execute(text("SELECT 1"))
+                opened.append(connection)
+        finally:
+            # Closing hands the connections back to the pool, still open
+            for connection in opened:
+                connection.close()
+
+    async def _warm_async_pool(self):
+        opened = []
+        try:
+            for _ in range(self.connections):
+                connection = await self.async_engine.connect()
+                await connection.execute(text("SELECT 1"))
+                opened.append(connection)
+        finally:
+            for connection in opened:
+                await connection.close()
+
+    def start(self):
+        """Warm in the background on the running event loop; /ready reports when done"""
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def run(self, retry_interval: float = 5):
+        """Warm the pools, retrying until the database is reachable"""
+        while not self.done:
+            try:
+                await run_in_threadpool(self._warm_sync_pool)
+                if self.async_engine is not None:
+                    await self._warm_async_pool()
+                self.done = True
+            except Exception as e:
+                print(f"Failed to warm database pool, retrying: {e}")
+                await asyncio.sleep(retry_interval)
+
+def database_ready(engine) -> bool:
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        return True
+    except Exception:
+        return False
+
+def readiness(response, checks: dict, **details) -> dict:
+    """Body for GET /ready; every check must pass, or the status code is 503"""
+    ready = all(checks.values())
+    if not ready:
+        response.status_code = 503
+    return {"status": "ready" if ready else "not_ready", "checks": checks, **details}
@@ -1,17 +1,124 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Response
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from prometheus_fastapi_instrumentator import Instrumentator
+from prometheus_client import Gauge
+import json
 import requests
-from . import models, schemas, crud
-from .database import Base, engine, SessionLocal
+import threading
+from typing import Optional
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from . import models, schemas, crud, lifecycle, operations, resilience, user_client
+from .money import ZERO
+from .snapshots import BalanceSnapshotter
+from .user_cache import UserCache
+from .pagination import parse_ids, resolve_after_id, set_next_cursor
+from .database import engine, async_engine, SessionLocal, fetch_all, fetch_first, dispose_async_engine
+from .tracing import setup_tracing, shutdown_tracing
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rabbitmq_utils import RabbitMQPublisher, RabbitMQConsumer
+
+# Worker processes per pod that run the balance snapshotter and operation key purger
+MAINTENANCE_WORKERS = int(os.getenv("MAINTENANCE_WORKERS", "1"))
+
+# Longest date range, in days, accepted by GET /accounts/{id}/statement
+ACCOUNT_STATEMENT_MAX_DAYS = int(os.getenv("ACCOUNT_STATEMENT_MAX_DAYS", "366"))
 
 app = FastAPI(title="Account Service", version="1.0.0")
 
 # Prometheus metrics instrumentation
 Instrumentator().instrument(app).expose(app)
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# Spans for requests, User Service calls and DB queries (TRACING_EXPORTER)
+setup_tracing(app, [engine] + ([async_engine.sync_engine] if async_engine is not None else []))
+
+# Initialize RabbitMQ Publisher
+rabbitmq_publisher = RabbitMQPublisher()
+
+# Publisher queue depth and outcome counts, read at scrape time
+for stat, description in (
+    ('queue_depth', 'Events queued for RabbitMQ but not yet confirmed'),
+    ('published', 'Events confirmed by RabbitMQ'),
+    ('failed', 'Events dropped after exhausting publish retries'),
+    ('rejected', 'Events rejected because the publish queue was full'),
+):
+    Gauge(f"rabbitmq_publisher_{stat}", description).set_function(lambda stat=stat: rabbitmq_publisher.stats()[stat])
+
+# Folds ledger tails into balance snapshots so balance reads stay short
+balance_snapshotter = BalanceSnapshotter(SessionLocal)
+
+# Deletes operation keys whose replay window has passed
+operation_key_purger = operations.OperationKeyPurger(SessionLocal)
+
+# Existing user ids, kept current by user events from User Service, so
+# account creation only calls User Service for users it has not seen
+user_cache = UserCache()
+user_events_consumer = RabbitMQConsumer()
+
+def process_user_event(ch, method, properties, body):
+    """Keep the user cache in line with user.* events"""
+    try:
+        user_id = json.loads(body).get('user_id')
+        if user_id:
+            if method.routing_key == 'user.deleted':
+                user_cache.deleted(user_id)
+            else:
+                user_cache.created(user_id)
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+    except Exception as e:
+        print(f"Error processing user event: {e}")
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+
+def load_user_ids():
+    """Seed the user cache by paging through User Service"""
+    params = {'limit': 1000}
+    while True:
+        response = user_client.get("/users", params=params)
+        response.raise_for_status()
+        for user in response.json():
+            user_cache.remember(user['id'])
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            return
+        params = {'limit': 1000, 'cursor': cursor}
+
+def start_user_events_consumer():
+    """Consume user events on a queue private to this replica.
+
+    The queue is bound before the cache is seeded, so users created or
+    deleted meanwhile wait in it and are applied on top of the snapshot.
+    """
+    try:
+        queue_name = user_events_consumer.setup_exclusive_queue(['user.created', 'user.deleted'])
+        try:
+            load_user_ids()
+        except Exception as e:
+            print(f"Failed to load user ids, cache starts empty: {e}")
+        user_cache.set_live(True)
+        user_events_consumer.start_consuming(queue_name, process_user_event)
+    except Exception as e:
+        print(f"Error in user events consumer: {e}")
+    finally:
+        # Events may be missed from here on; fall back to asking User Service
+        user_cache.set_live(False)
+
+# Connections opened at startup; GET /ready waits for them
+pool_warmup = lifecycle.PoolWarmup(engine, async_engine)
+runs_maintenance = False
+
+@app.on_event("startup")
+async def startup_event():
+    global runs_maintenance
+    # Every worker has its own user cache, so every worker consumes user events
+    threading.Thread(target=start_user_events_consumer, daemon=True).start()
+    runs_maintenance = lifecycle.claim_worker_slot("account-maintenance", MAINTENANCE_WORKERS)
+    if runs_maintenance:
+        balance_snapshotter.start()
+        operation_key_purger.start()
+    pool_warmup.start()
 
 # Dependency to get DB session
 def get_db():
@@ -25,18 +132,47 @@ def get_db():
 def read_root():
     return {"message": "Account Service is running"}
 
+@app.get("/ready")
+def read_ready(response: Response):
+    """Readiness probe: 200 once this worker's database pool is warm and reachable"""
+    return lifecycle.readiness(
+        response,
+        {"database": lifecycle.database_ready(engine), "pool_warm": pool_warmup.done},
+        user_cache_live=user_cache.is_live(),
+        maintenance=runs_maintenance
+    )
+
+def publish_account_event(routing_key: str, account_id: int, user_id: int, account_type: str):
+    """Publish account lifecycle event so other services can invalidate caches"""
+    try:
+        event_data = {
+            'account_id': account_id,
+            'user_id': user_id,
+            'account_type': account_type
+        }
+        rabbitmq_publisher.publish_message(routing_key, event_data)
+    except Exception as e:
+        print(f"Failed to publish account event: {e}")  # Don't fail the request for event errors
+
 # CRUD Endpoints
 @app.post("/accounts", response_model=schemas.AccountResponse)
 def create_account(account: schemas.AccountCreate, db: Session = Depends(get_db)):
     try:
-        # Validate user_id by calling User Service
-        user_service_url = f"http://user-service:8001/users/{account.user_id}"
-        try:
-            response = requests.get(user_service_url, timeout=5)
-            if response.status_code != 200:
-                raise HTTPException(status_code=400, detail="User ID does not exist")
-        except requests.exceptions.RequestException as e:
-            raise HTTPException(status_code=500, detail=f"Cannot connect to User Service: {str(e)}")
+        # Validate user_id from the user cache, calling User Service on a miss
+        user_exists = user_cache.lookup(account.user_id)
+        if user_exists is None:
+            try:
+                response = user_client.get(f"/users/{account.user_id}")
+            except resilience.CircuitOpenError:
+                # Shed load instead of queueing calls behind a failing User Service
+                raise HTTPException(status_code=503, detail="User Service unavailable: circuit open")
+            except requests.exceptions.RequestException as e:
+                raise HTTPException(status_code=500, detail=f"Cannot connect to User Service: {str(e)}")
+            user_exists = response.status_code == 200
+            if user_exists:
+                user_cache.remember(account.user_id)
+        if not user_exists:
+            raise HTTPException(status_code=400, detail="User ID does not exist")
 
         # Validate account type
         if account.account_type not in ["checking", "savings", "business"]:
@@ -47,6 +183,7 @@ def create_account(account: schemas.AccountCreate, db: Session = Depends(get_db)
             raise HTTPException(status_code=400, detail="Initial balance cannot be negative")
 
         db_account = crud.create_account(db, account)
+        publish_account_event('account.created', db_account.id, db_account.user_id, db_account.account_type)
         return db_account
     except HTTPException:
         raise
@@ -54,19 +191,42 @@ def create_account(account: schemas.AccountCreate, db: Session = Depends(get_db)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.get("/accounts", response_model=list[schemas.AccountResponse])
-def read_accounts(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+async def read_accounts(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    ids: Optional[str] = None,
+    user_id: Optional[int] = None
+):
     try:
-        return crud.get_accounts(db, skip=skip, limit=limit)
+        if skip < 0:
+            raise HTTPException(status_code=400, detail="Skip parameter must be non-negative")
+        if limit <= 0 or limit > 1000:
+            raise HTTPException(status_code=400, detail="Limit must be between 1 and 1000")
+
+        if user_id is not None and user_id <= 0:
+            raise HTTPException(status_code=400, detail="User ID must be a positive integer")
+
+        # ?ids=1,2,3 and ?user_id= narrow the listing; unknown ids are left out
+        accounts = await fetch_all(crud.select_accounts(
+            skip=skip, limit=limit, after_id=resolve_after_id(after_id, cursor), ids=parse_ids(ids), user_id=user_id
+        ))
+        set_next_cursor(response, accounts, limit)
+        return accounts
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve accounts: {str(e)}")
 
 @app.get("/accounts/{account_id}", response_model=schemas.AccountResponse)
-def read_account(account_id: int, db: Session = Depends(get_db)):
+async def read_account(account_id: int):
     try:
         if account_id <= 0:
             raise HTTPException(status_code=400, detail="Account ID must be a positive integer")
         
-        db_account = crud.get_account(db, account_id)
+        db_account = await fetch_first(crud.select_account(account_id))
         if db_account is None:
             raise HTTPException(status_code=404, detail="Account not found")
         return db_account
@@ -75,6 +235,89 @@ def read_account(account_id: int, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve account: {str(e)}")
 
+@app.get("/accounts/{account_id}/ledger", response_model=list[schemas.LedgerEntryResponse])
+async def read_account_ledger(response: Response, account_id: int, limit: int = 100, after_id: Optional[int] = None, cursor: Optional[str] = None):
+    try:
+        if account_id <= 0:
+            raise HTTPException(status_code=400, detail="Account ID must be a positive integer")
+        if limit <= 0 or limit > 1000:
+            raise HTTPException(status_code=400, detail="Limit must be between 1 and 1000")
+
+        entries = await fetch_all(crud.select_ledger_entries(account_id, limit=limit, after_id=resolve_after_id(after_id, cursor)))
+        set_next_cursor(response, entries, limit)
+        return entries
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve account ledger: {str(e)}")
+
+@app.get("/accounts/{account_id}/balance", response_model=schemas.AccountBalanceResponse)
+def read_account_balance(account_id: int, at: Optional[datetime] = None, db: Session = Depends(get_db)):
+    """Current balance, or the balance rebuilt from the ledger as of a point in time"""
+    try:
+        if account_id <= 0:
+            raise HTTPException(status_code=400, detail="Account ID must be a positive integer")
+
+        db_account = crud.get_account(db, account_id)
+        if db_account is None:
+            raise HTTPException(status_code=404, detail="Account not found")
+        if at is None:
+            return {"account_id": account_id, "balance": db_account.balance, "as_of": datetime.utcnow()}
+        return {"account_id": account_id, "balance": crud.get_balance_at(db, account_id, at), "as_of": at}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve account balance: {str(e)}")
+
+@app.get("/accounts/{account_id}/statement", response_model=schemas.AccountStatementResponse)
+def read_account_statement(
+    account_id: int,
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+    db: Session = Depends(get_db)
+):
+    """Balances and per-type, per-day totals for a range of UTC days, served from the daily rollup"""
+    try:
+        if account_id <= 0:
+            raise HTTPException(status_code=400, detail="Account ID must be a positive integer")
+        end = end or datetime.utcnow().date()
+        start = start or end - timedelta(days=29)
+        if start > end:
+            raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+        if (end - start).days >= ACCOUNT_STATEMENT_MAX_DAYS:
+            raise HTTPException(status_code=400, detail=f"Date range cannot exceed {ACCOUNT_STATEMENT_MAX_DAYS} days")
+
+        if crud.get_account(db, account_id) is None:
+            raise HTTPException(status_code=404, detail="Account not found")
+
+        daily = crud.get_daily_totals(db, account_id, start, end)
+        by_type = {}
+        for bucket in daily:
+            count, total = by_type.get(bucket.entry_type, (0, ZERO))
+            by_type[bucket.entry_type] = (count + bucket.count, total + bucket.total)
+        closing_balance = crud.get_balance_at(db, account_id, datetime.combine(end, time.max))
+        net = sum((total for _, total in by_type.values()), ZERO)
+        return {
+            "account_id": account_id,
+            "start": start,
+            "end": end,
+            "opening_balance": closing_balance - net,
+            "closing_balance": closing_balance,
+            "count": sum(count for count, _ in by_type.values()),
+            "by_type": [
+                {"entry_type": entry_type, "count": count, "total": total}
+                for entry_type, (count, total) in sorted(by_type.items())
+            ],
+            "daily": [
+                {"day": bucket.day, "entry_type": bucket.entry_type, "count": bucket.count, "total": bucket.total}
+                for bucket in daily
+            ]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve account statement: {str(e)}")
+
 @app.put("/accounts/{account_id}", response_model=schemas.AccountResponse)
 def update_account_balance(account_id: int, account_update: schemas.AccountUpdate, db: Session = Depends(get_db)):
     try:
@@ -87,12 +330,119 @@ def update_account_balance(account_id: int, account_update: schemas.AccountUpdat
         db_account = crud.update_account_balance(db, account_id, account_update.balance)
         if db_account is None:
             raise HTTPException(status_code=404, detail="Account not found")
+        publish_account_event('account.updated', db_account.id, db_account.user_id, db_account.account_type)
         return db_account
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update account balance: {str(e)}")
 
+def raise_balance_change_error(db: Session, account_id: int, amount: Decimal):
+    """Work out why a conditional balance update matched no row"""
+    db_account = crud.get_account(db, account_id)
+    if db_account is None:
+        raise HTTPException(status_code=404, detail=f"Account {account_id} not found")
+    raise HTTPException(
+        status_code=400,
+        detail=f"Insufficient balance. Current balance: ${db_account.balance:.2f}, Requested: ${amount:.2f}"
+    )
+
+def check_operation_key(key: Optional[str]):
+    if key is not None and not operations.valid_key(key):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Idempotency-Key must be between 1 and {operations.OPERATION_KEY_MAX_LENGTH} characters"
+        )
+
+def replay_applied_operation(db: Session, key: Optional[str], operation: str):
+    """Stored response of a balance change already applied under key, or None"""
+    if not key:
+        return None
+    applied = crud.get_applied_operation(db, key)
+    return None if applied is None else operations.replay(applied, operation)
+
+@app.post("/accounts/transfer", response_model=schemas.AccountTransferResponse)
+def transfer_between_accounts(transfer: schemas.AccountTransfer, idempotency_key: Optional[str] = Header(None),
+                              db: Session = Depends(get_db)):
+    """Move money between accounts; a retry with the same Idempotency-Key gets the stored response"""
+    try:
+        check_operation_key(idempotency_key)
+        replayed = replay_applied_operation(db, idempotency_key, "transfer")
+        if replayed is not None:
+            return replayed
+        try:
+            result = crud.transfer_between_accounts(
+                db, transfer.source_account_id, transfer.target_account_id, transfer.amount,
+                idempotency_key, operations.OPERATION_KEY_TTL
+            )
+        except IntegrityError:
+            # A concurrent copy of this request committed first
+            replayed = replay_applied_operation(db, idempotency_key, "transfer")
+            if replayed is not None:
+                return replayed
+            raise
+        if result is None:
+            if crud.get_account(db, transfer.target_account_id) is None:
+                raise HTTPException(status_code=404, detail=f"Account {transfer.target_account_id} not found")
+            raise_balance_change_error(db, transfer.source_account_id, transfer.amount)
+        source, target = result
+        return {"source": source, "target": target}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to transfer between accounts: {str(e)}")
+
+@app.post("/accounts/batch-adjust", response_model=list[schemas.AccountAdjustBatchResult])
+def adjust_account_balances(batch: schemas.AccountAdjustBatch, db: Session = Depends(get_db)):
+    """Apply one ledger entry per item; an item resent with its operation_key gets the stored result"""
+    try:
+        for item in batch.adjustments:
+            check_operation_key(item.operation_key)
+        # One ledger entry per item, in request order within each account
+        adjustments = [(item.account_id, item.amount, item.operation_key) for item in batch.adjustments]
+        try:
+            results, replayed = crud.adjust_account_balances(db, adjustments, operations.OPERATION_KEY_TTL)
+        except IntegrityError:
+            # A concurrent copy of some items committed first; they are replayed now
+            results, replayed = crud.adjust_account_balances(db, adjustments, operations.OPERATION_KEY_TTL)
+        if replayed:
+            operations.OPERATION_REPLAYS.labels(operation="batch_adjust").inc(replayed)
+        return results
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to adjust account balances: {str(e)}")
+
+@app.post("/accounts/{account_id}/adjust", response_model=schemas.AccountResponse)
+def adjust_account_balance(account_id: int, adjustment: schemas.AccountAdjust, idempotency_key: Optional[str] = Header(None),
+                           db: Session = Depends(get_db)):
+    """Credit or debit an account; a retry with the same Idempotency-Key gets the stored response"""
+    try:
+        if account_id <= 0:
+            raise HTTPException(status_code=400, detail="Account ID must be a positive integer")
+        check_operation_key(idempotency_key)
+        replayed = replay_applied_operation(db, idempotency_key, "adjust")
+        if replayed is not None:
+            return replayed
+
+        try:
+            db_account = crud.adjust_account_balance(
+                db, account_id, adjustment.amount, idempotency_key, operations.OPERATION_KEY_TTL
+            )
+        except IntegrityError:
+            # A concurrent copy of this request committed first
+            replayed = replay_applied_operation(db, idempotency_key, "adjust")
+            if replayed is not None:
+                return replayed
+            raise
+        if db_account is None:
+            raise_balance_change_error(db, account_id, -adjustment.amount)
+        return db_account
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to adjust account balance: {str(e)}")
+
 @app.delete("/accounts/{account_id}")
 def delete_account(account_id: int, db: Session = Depends(get_db)):
     try:
@@ -107,9 +457,22 @@ def delete_account(account_id: int, db: Session = Depends(get_db)):
         if account.balance > 0:
             raise HTTPException(status_code=400, detail="Cannot delete account with remaining balance")
         
+        user_id, account_type = account.user_id, account.account_type
         crud.delete_account(db, account_id)
+        publish_account_event('account.deleted', account_id, user_id, account_type)
         return {"message": f"Account {account_id} deleted successfully"}
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to delete account: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to delete account: {str(e)}")
+
+# Graceful shutdown
+@app.on_event("shutdown")
+async def shutdown_event():
+    balance_snapshotter.stop()
+    operation_key_purger.stop()
+    user_events_consumer.stop_consuming()
+    user_events_consumer.close()
+    rabbitmq_publisher.close()
+    await dispose_async_engine()
+    shutdown_tracing()
@@ -1,9 +1,77 @@
-from sqlalchemy import Column, Integer, Float, String
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, Index, func, select
+from sqlalchemy.orm import column_property
+from datetime import datetime
 from .database import Base
+from .money import Money, ZERO
+
+class LedgerEntry(Base):
+    """Append-only balance change; an account's balance is the sum of its entries"""
+    __tablename__ = "ledger_entries"
+    id = Column(Integer, primary_key=True)
+    account_id = Column(Integer, nullable=False)
+    amount = Column(Money(), nullable=False)  # positive credits, negative debits
+    entry_type = Column(String, nullable=False)  # opening, deposit, withdraw, transfer_in, transfer_out, adjustment
+    counterparty_account_id = Column(Integer, nullable=True)  # other leg of a transfer
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_ledger_entries_account_id_id", "account_id", "id"),
+        Index("ix_ledger_entries_account_id_created_at", "account_id", "created_at"),
+    )
+
+class BalanceSnapshot(Base):
+    """Balance of an account over all entries up to ledger_entry_id"""
+    __tablename__ = "balance_snapshots"
+    id = Column(Integer, primary_key=True)
+    account_id = Column(Integer, nullable=False)
+    ledger_entry_id = Column(Integer, nullable=False)
+    balance = Column(Money(), nullable=False)
+    as_of = Column(DateTime, nullable=False)  # created_at of the newest entry included
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_balance_snapshots_account_id_as_of", "account_id", "as_of"),
+    )
+
+class LedgerDailyTotal(Base):
+    """Count and sum of an account's ledger entries of one type on one UTC day.
+
+    Covers entries up to the account's snapshot_entry_id; the snapshotter
+    folds the ledger tail in when it takes a snapshot.
+    """
+    __tablename__ = "ledger_daily_totals"
+    account_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    entry_type = Column(String, primary_key=True)
+    entry_count = Column(Integer, nullable=False)
+    total_amount = Column(Money(), nullable=False)
+
+class AppliedOperation(Base):
+    """Response to a balance change sent with an Idempotency-Key, replayed to retries"""
+    __tablename__ = "applied_operations"
+    key = Column(String(255), primary_key=True)
+    response_body = Column(Text, nullable=False)  # JSON response body
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
 
 class Account(Base):
     __tablename__ = "accounts"
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer)
+    user_id = Column(Integer, index=True)
     account_type = Column(String)
-    balance = Column(Float, default=0.0)
+    # Latest snapshot: the balance over all ledger entries up to snapshot_entry_id.
+    # Only the snapshotter writes these; balance changes are ledger inserts.
+    snapshot_balance = Column("balance", Money(), default=ZERO)
+    snapshot_entry_id = Column(Integer, nullable=False, default=0)
+
+# Current balance: snapshot plus the ledger entries written since, read
+# through the (account_id, id) index
+Account.balance = column_property(
+    Account.snapshot_balance + func.coalesce(
+        select(func.sum(LedgerEntry.amount))
+        .where(LedgerEntry.account_id == Account.id, LedgerEntry.id > Account.snapshot_entry_id)
+        .correlate_except(LedgerEntry)
+        .scalar_subquery(),
+        ZERO
+    )
+)
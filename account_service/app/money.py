@@ -0,0 +1,35 @@
+from decimal import Decimal
+from sqlalchemy import Numeric
+import os
+
+# Money is stored as NUMERIC(18, 2) and handled as Decimal, never as binary float
+MONEY_PRECISION = 18
+MONEY_SCALE = 2
+CENT = Decimal("0.01")
+ZERO = Decimal("0.00")
+MONEY_LIMIT = Decimal(10) ** (MONEY_PRECISION - MONEY_SCALE)
+
+# Responses send amounts as two-place decimal strings ("10.50"), so no amount
+# passes through a binary float. MONEY_JSON_FLOAT=true sends plain JSON
+# numbers instead, for clients that cannot read strings yet.
+MONEY_JSON_FLOAT = os.getenv("MONEY_JSON_FLOAT", "false").lower() == "true"
+
+def money_json(value: Decimal):
+    """JSON form of an amount"""
+    return float(value) if MONEY_JSON_FLOAT else str(value.quantize(CENT))
+
+MONEY_JSON_ENCODERS = {Decimal: money_json}
+
+def Money():
+    """Column type for amounts and balances"""
+    return Numeric(MONEY_PRECISION, MONEY_SCALE, asdecimal=True)
+
+def validate_money(value: Decimal) -> Decimal:
+    """Pydantic validator body: reject sub-cent precision instead of rounding it away"""
+    if not value.is_finite():
+        raise ValueError('Amount must be a finite number')
+    if value != value.quantize(CENT):
+        raise ValueError('Amount cannot have more than 2 decimal places')
+    if abs(value) >= MONEY_LIMIT:
+        raise ValueError('Amount is too large')
+    return value.quantize(CENT)
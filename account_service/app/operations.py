@@ -0,0 +1,69 @@
+from fastapi.responses import JSONResponse
+from prometheus_client import Counter
+from . import crud
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Seconds a balance change's response is replayed to retries with the same
+# Idempotency-Key; outlives the Transaction Service keys that send them
+OPERATION_KEY_TTL = float(os.getenv("OPERATION_KEY_TTL", "172800"))
+# Seconds between sweeps that delete expired operation keys
+OPERATION_PURGE_INTERVAL = float(os.getenv("OPERATION_PURGE_INTERVAL", "300"))
+
+OPERATION_PURGE_BATCH_SIZE = 1000
+OPERATION_KEY_MAX_LENGTH = 255
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+OPERATION_REPLAYS = Counter("account_operation_replays_total", "Balance changes answered from a stored response", ["operation"])
+
+def valid_key(key) -> bool:
+    return key is not None and 0 < len(key) <= OPERATION_KEY_MAX_LENGTH
+
+def replay(response_body: str, operation: str):
+    """Answer a retried balance change without applying it again"""
+    OPERATION_REPLAYS.labels(operation=operation).inc()
+    return JSONResponse(content=json.loads(response_body), headers={REPLAYED_HEADER: "true"})
+
+class OperationKeyPurger:
+    """Background thread that deletes expired operation keys in batches"""
+
+    def __init__(self, session_factory, interval: float = OPERATION_PURGE_INTERVAL):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='operation-key-purger', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def purge_once(self) -> int:
+        db = self.session_factory()
+        try:
+            purged = 0
+            while not self._stopping.is_set():
+                batch = crud.purge_expired_operations(db, limit=OPERATION_PURGE_BATCH_SIZE)
+                purged += batch
+                if batch < OPERATION_PURGE_BATCH_SIZE:
+                    return purged
+            return purged
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.purge_once()
+            except Exception as e:
+                logger.error(f"Operation key purge failed: {e}")
@@ -0,0 +1,50 @@
+from fastapi import HTTPException, Response
+from typing import Optional
+import base64
+
+# Response header carrying the opaque cursor for the next page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Most ids accepted by one ?ids= lookup, the same as the largest page
+MAX_LOOKUP_IDS = 1000
+
+def encode_cursor(last_id: int) -> str:
+    """Encode the id of the last row on a page as an opaque cursor"""
+    return base64.urlsafe_b64encode(f"id:{last_id}".encode()).decode()
+
+def decode_cursor(cursor: str) -> int:
+    """Decode a cursor produced by encode_cursor back into a row id"""
+    try:
+        prefix, value = base64.urlsafe_b64decode(cursor.encode()).decode().split(":", 1)
+        if prefix != "id":
+            raise ValueError(prefix)
+        return int(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def resolve_after_id(after_id: Optional[int], cursor: Optional[str]) -> Optional[int]:
+    """Keyset position from either ?cursor= or ?after_id= (cursor wins)"""
+    if cursor:
+        return decode_cursor(cursor)
+    if after_id is not None and after_id < 0:
+        raise HTTPException(status_code=400, detail="after_id must be non-negative")
+    return after_id
+
+def parse_ids(ids: Optional[str]) -> Optional[list]:
+    """Row ids from a comma-separated ?ids=1,2,3 lookup, deduplicated and sorted"""
+    if ids is None:
+        return None
+    try:
+        values = sorted({int(value) for value in ids.split(",") if value.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+    if not values or values[0] <= 0:
+        raise HTTPException(status_code=400, detail="ids must be positive integers")
+    if len(values) > MAX_LOOKUP_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_LOOKUP_IDS} ids can be looked up at once")
+    return values
+
+def set_next_cursor(response: Response, items: list, limit: int):
+    """Advertise the next page only when this page came back full"""
+    if items and len(items) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(items[-1].id)
@@ -1,18 +1,129 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, validator
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Optional
+from .money import ZERO, MONEY_JSON_ENCODERS, validate_money
 
 class AccountCreate(BaseModel):
     user_id: int
     account_type: str
-    balance: float = 0.0
+    balance: Decimal = ZERO
+
+    _validate_balance = validator('balance', allow_reuse=True)(validate_money)
 
 class AccountUpdate(BaseModel):
-    balance: float
+    balance: Decimal
+
+    _validate_balance = validator('balance', allow_reuse=True)(validate_money)
+
+class AccountAdjust(BaseModel):
+    amount: Decimal  # positive to credit, negative to debit
+
+    @validator('amount')
+    def validate_amount(cls, v):
+        v = validate_money(v)
+        if v == 0:
+            raise ValueError('Amount must be non-zero')
+        return v
+
+class AccountAdjustBatchItem(BaseModel):
+    account_id: int
+    amount: Decimal
+    operation_key: Optional[str] = None  # applied at most once, like an Idempotency-Key
+
+    _validate_amount = validator('amount', allow_reuse=True)(validate_money)
+
+class AccountAdjustBatch(BaseModel):
+    adjustments: list[AccountAdjustBatchItem]
+
+class AccountTransfer(BaseModel):
+    source_account_id: int
+    target_account_id: int
+    amount: Decimal
+
+    @validator('amount')
+    def validate_amount(cls, v):
+        v = validate_money(v)
+        if v <= 0:
+            raise ValueError('Amount must be greater than 0')
+        return v
+
+    @validator('target_account_id')
+    def validate_target_account(cls, v, values):
+        if v == values.get('source_account_id'):
+            raise ValueError('Source and target accounts must be different')
+        return v
 
 class AccountResponse(BaseModel):
     id: int
     user_id: int
     account_type: str
-    balance: float
+    balance: Decimal
+
+    class Config:
+        orm_mode = True
+        json_encoders = MONEY_JSON_ENCODERS
+
+class LedgerEntryResponse(BaseModel):
+    id: int
+    account_id: int
+    amount: Decimal
+    entry_type: str
+    counterparty_account_id: Optional[int]
+    created_at: datetime
 
     class Config:
         orm_mode = True
+        json_encoders = MONEY_JSON_ENCODERS
+
+class AccountBalanceResponse(BaseModel):
+    account_id: int
+    balance: Decimal
+    as_of: datetime
+
+    class Config:
+        json_encoders = MONEY_JSON_ENCODERS
+
+class AccountTransferResponse(BaseModel):
+    source: AccountResponse
+    target: AccountResponse
+
+class AccountAdjustBatchResult(BaseModel):
+    account_id: int
+    status: str  # applied, not_found, insufficient_balance
+    user_id: Optional[int] = None
+    balance: Optional[Decimal] = None
+    detail: Optional[str] = None
+
+    class Config:
+        json_encoders = MONEY_JSON_ENCODERS
+
+class StatementTypeTotal(BaseModel):
+    entry_type: str
+    count: int
+    total: Decimal  # signed: debits are negative
+
+    class Config:
+        json_encoders = MONEY_JSON_ENCODERS
+
+class StatementDailyBucket(BaseModel):
+    day: date
+    entry_type: str
+    count: int
+    total: Decimal
+
+    class Config:
+        json_encoders = MONEY_JSON_ENCODERS
+
+class AccountStatementResponse(BaseModel):
+    account_id: int
+    start: date
+    end: date
+    opening_balance: Decimal
+    closing_balance: Decimal
+    count: int
+    by_type: list[StatementTypeTotal]
+    daily: list[StatementDailyBucket]
+
+    class Config:
+        json_encoders = MONEY_JSON_ENCODERS
@@ -0,0 +1,65 @@
+from prometheus_client import Counter, Gauge
+from typing import Optional
+import threading
+
+# Replica of the user ids that exist in User Service, fed by user.created
+# and user.deleted events. It is only trusted while the event consumer is
+# running: a replica that may have missed a deletion answers "unknown" and
+# the caller asks User Service instead.
+
+USER_CACHE_LOOKUPS = Counter("user_cache_lookups_total", "User existence checks by result", ["result"])
+USER_CACHE_SIZE = Gauge("user_cache_size", "User ids known to exist")
+
+class UserCache:
+    """Thread-safe set of existing user ids plus the ids seen deleted"""
+
+    def __init__(self):
+        self._existing = set()
+        self._deleted = set()
+        self._live = False
+        self._lock = threading.Lock()
+
+    def lookup(self, user_id: int) -> Optional[bool]:
+        """True if the user exists, False if it was deleted, None if unknown"""
+        with self._lock:
+            if not self._live:
+                result, known = "offline", None
+            elif user_id in self._existing:
+                result, known = "hit", True
+            elif user_id in self._deleted:
+                result, known = "deleted", False
+            else:
+                result, known = "miss", None
+        USER_CACHE_LOOKUPS.labels(result=result).inc()
+        return known
+
+    def created(self, user_id: int):
+        with self._lock:
+            self._existing.add(user_id)
+            self._deleted.discard(user_id)
+            USER_CACHE_SIZE.set(len(self._existing))
+
+    def deleted(self, user_id: int):
+        with self._lock:
+            self._existing.discard(user_id)
+            self._deleted.add(user_id)
+            USER_CACHE_SIZE.set(len(self._existing))
+
+    def remember(self, user_id: int):
+        """Record a user User Service confirmed exists, unless its deletion has since arrived"""
+        with self._lock:
+            if user_id not in self._deleted:
+                self._existing.add(user_id)
+                USER_CACHE_SIZE.set(len(self._existing))
+
+    def is_live(self) -> bool:
+        return self._live
+
+    def set_live(self, live: bool):
+        """Start trusting the replica once events flow; forget it when they stop"""
+        with self._lock:
+            self._live = live
+            if not live:
+                self._existing.clear()
+                self._deleted.clear()
+                USER_CACHE_SIZE.set(0)
@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import os
+import requests
+import time
+from typing import Optional
+from . import resilience
+
+# User Service connection settings
+USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://user-service:8001")
+USER_SERVICE_TIMEOUT = float(os.getenv("USER_SERVICE_TIMEOUT", "5"))
+
+# Responses worth sending again
+RETRYABLE_STATUSES = {502, 503, 504}
+
+# Keeps connections to User Service open between calls
+session = requests.Session()
+
+# Circuit breaker, retry budget and adaptive timeout for User Service
+user_service = resilience.Dependency("user_service", USER_SERVICE_TIMEOUT)
+
+# Runs the original and hedged copies of a GET side by side (HEDGE_GETS)
+_hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="user-service-hedge")
+
+def _send(path: str, params: Optional[dict], timeout: float) -> requests.Response:
+    """GET with retries while the retry budget allows"""
+    for attempt in range(1, resilience.RETRY_MAX_ATTEMPTS + 1):
+        last = attempt == resilience.RETRY_MAX_ATTEMPTS
+        try:
+            response = session.get(f"{USER_SERVICE_URL}{path}", params=params, timeout=timeout)
+        except requests.exceptions.RequestException:
+            if last or not user_service.try_retry():
+                raise
+        else:
+            if last or response.status_code not in RETRYABLE_STATUSES or not user_service.try_retry():
+                return response
+        time.sleep(user_service.retry_delay(attempt))
+
+def _send_hedged(path: str, params: Optional[dict], timeout: float) -> requests.Response:
+    """GET, sending a second copy if the first is slower than the recent p95"""
+    delay = user_service.hedge_delay()
+    if delay is None:
+        return _send(path, params, timeout)
+    primary = _hedge_executor.submit(_send, path, params, timeout)
+    done, _ = wait([primary], timeout=delay)
+    if done or not user_service.try_retry("hedge"):
+        return primary.result()
+    hedge = _hedge_executor.submit(_send, path, params, timeout)
+    done, pending = wait([primary, hedge], return_when=FIRST_COMPLETED)
+    winner = done.pop()
+    if winner.exception() is not None and pending:
+        # The first to finish failed; the other copy may still succeed
+        winner = pending.pop()
+    if winner is hedge:
+        resilience.HEDGE_WINS.labels(target=user_service.name).inc()
+    # The slower copy finishes in the background and is ignored
+    return winner.result()
+
+def get(path: str, params: Optional[dict] = None) -> requests.Response:
+    """GET from User Service through its circuit breaker, retry budget and adaptive timeout.
+
+    Raises resilience.CircuitOpenError without calling while the circuit
+    is open. 5xx responses, request errors and calls slower than the
+    adaptive timeout count as failures towards opening it.
+    """
+    user_service.acquire()
+    timeout = user_service.timeout()
+    started = time.perf_counter()
+    try:
+        response = _send_hedged(path, params, timeout)
+    except BaseException:
+        user_service.record_failure()
+        raise
+    elapsed = time.perf_counter() - started
+    if response.status_code >= 500 or elapsed > timeout:
+        user_service.record_failure()
+    else:
+        user_service.record_success(elapsed)
+    return response
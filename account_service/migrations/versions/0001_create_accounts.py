@@ -0,0 +1,32 @@
+"""create accounts table
+
+Revision ID: 0001
+Revises:
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases bootstrapped by the old import-time create_all already have
+    # this table; adopt it as-is instead of failing
+    if sa.inspect(op.get_bind()).has_table('accounts'):
+        return
+    op.create_table(
+        'accounts',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer()),
+        sa.Column('account_type', sa.String()),
+        sa.Column('balance', sa.Float())
+    )
+    op.create_index('ix_accounts_id', 'accounts', ['id'])
+
+
+def downgrade():
+    op.drop_index('ix_accounts_id', table_name='accounts')
+    op.drop_table('accounts')
@@ -0,0 +1,65 @@
+"""add ledger entries and balance snapshots
+
+Revision ID: 0002
+Revises: 0001
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'ledger_entries',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('account_id', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('entry_type', sa.String(), nullable=False),
+        sa.Column('counterparty_account_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False)
+    )
+    op.create_index('ix_ledger_entries_account_id_id', 'ledger_entries', ['account_id', 'id'])
+    op.create_index('ix_ledger_entries_account_id_created_at', 'ledger_entries', ['account_id', 'created_at'])
+    op.create_table(
+        'balance_snapshots',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('account_id', sa.Integer(), nullable=False),
+        sa.Column('ledger_entry_id', sa.Integer(), nullable=False),
+        sa.Column('balance', sa.Float(), nullable=False),
+        sa.Column('as_of', sa.DateTime(), nullable=False),
+        sa.Column('created_at', sa.DateTime())
+    )
+    op.create_index('ix_balance_snapshots_account_id_as_of', 'balance_snapshots', ['account_id', 'as_of'])
+    with op.batch_alter_table('accounts') as batch_op:
+        batch_op.add_column(sa.Column('snapshot_entry_id', sa.Integer(), nullable=False, server_default='0'))
+
+    # Existing balances become opening entries, and the accounts row becomes
+    # the snapshot that covers them
+    op.execute(
+        "INSERT INTO ledger_entries (account_id, amount, entry_type, created_at) "
+        "SELECT id, balance, 'opening', CURRENT_TIMESTAMP FROM accounts WHERE balance IS NOT NULL AND balance <> 0"
+    )
+    op.execute(
+        "UPDATE accounts SET balance = COALESCE(balance, 0), snapshot_entry_id = COALESCE("
+        "(SELECT MAX(ledger_entries.id) FROM ledger_entries WHERE ledger_entries.account_id = accounts.id), 0)"
+    )
+
+
+def downgrade():
+    # Fold the ledger tail back into the stored balance before dropping it
+    op.execute(
+        "UPDATE accounts SET balance = balance + COALESCE("
+        "(SELECT SUM(ledger_entries.amount) FROM ledger_entries "
+        "WHERE ledger_entries.account_id = accounts.id AND ledger_entries.id > accounts.snapshot_entry_id), 0)"
+    )
+    with op.batch_alter_table('accounts') as batch_op:
+        batch_op.drop_column('snapshot_entry_id')
+    op.drop_index('ix_balance_snapshots_account_id_as_of', table_name='balance_snapshots')
+    op.drop_table('balance_snapshots')
+    op.drop_index('ix_ledger_entries_account_id_created_at', table_name='ledger_entries')
+    op.drop_index('ix_ledger_entries_account_id_id', table_name='ledger_entries')
+    op.drop_table('ledger_entries')
@@ -0,0 +1,35 @@
+"""store money as NUMERIC(18, 2)
+
+Revision ID: 0003
+Revises: 0002
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+MONEY_COLUMNS = [
+    ('accounts', 'balance'),
+    ('ledger_entries', 'amount'),
+    ('balance_snapshots', 'balance'),
+]
+
+
+def upgrade():
+    for table, column in MONEY_COLUMNS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(
+                column,
+                type_=sa.Numeric(18, 2),
+                existing_type=sa.Float(),
+                postgresql_using=f'round({column}::numeric, 2)'
+            )
+
+
+def downgrade():
+    for table, column in MONEY_COLUMNS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(column, type_=sa.Float(), existing_type=sa.Numeric(18, 2))
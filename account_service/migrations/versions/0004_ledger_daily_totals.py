@@ -0,0 +1,37 @@
+"""add ledger_daily_totals rollup
+
+Revision ID: 0004
+Revises: 0003
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'ledger_daily_totals',
+        sa.Column('account_id', sa.Integer(), primary_key=True),
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('entry_type', sa.String(), primary_key=True),
+        sa.Column('entry_count', sa.Integer(), nullable=False),
+        sa.Column('total_amount', sa.Numeric(18, 2), nullable=False)
+    )
+    # Roll up every entry already covered by a snapshot; the tail after it
+    # is folded in by the next snapshot
+    op.execute(
+        "INSERT INTO ledger_daily_totals (account_id, day, entry_type, entry_count, total_amount) "
+        "SELECT ledger_entries.account_id, date(ledger_entries.created_at), ledger_entries.entry_type, "
+        "COUNT(*), SUM(ledger_entries.amount) "
+        "FROM ledger_entries JOIN accounts ON accounts.id = ledger_entries.account_id "
+        "WHERE ledger_entries.id <= accounts.snapshot_entry_id "
+        "GROUP BY ledger_entries.account_id, date(ledger_entries.created_at), ledger_entries.entry_type"
+    )
+
+
+def downgrade():
+    op.drop_table('ledger_daily_totals')
@@ -0,0 +1,20 @@
+"""index accounts by owner
+
+Revision ID: 0005
+Revises: 0004
+"""
+from alembic import op
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Serves GET /accounts?user_id= without a full table scan
+    op.create_index('ix_accounts_user_id', 'accounts', ['user_id'])
+
+
+def downgrade():
+    op.drop_index('ix_accounts_user_id', table_name='accounts')
@@ -0,0 +1,28 @@
+"""create applied operations table
+
+Revision ID: 0006
+Revises: 0005
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'applied_operations',
+        sa.Column('key', sa.String(255), primary_key=True),
+        sa.Column('response_body', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False)
+    )
+    op.create_index('ix_applied_operations_expires_at', 'applied_operations', ['expires_at'])
+
+
+def downgrade():
+    op.drop_index('ix_applied_operations_expires_at', table_name='applied_operations')
+    op.drop_table('applied_operations')
@@ -0,0 +1,441 @@
+import pika
+import json
+from concurrent.futures import Future
+from contextlib import contextmanager
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
+from opentelemetry import propagate, trace
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# No-op unless the service configured a tracer provider
+tracer = trace.get_tracer(__name__)
+
+def inject_trace_headers(headers: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Return message headers carrying the current trace context (W3C traceparent)"""
+    headers = dict(headers or {})
+    propagate.inject(headers)
+    return headers
+
+def _message_attributes(routing_key: str) -> Dict[str, str]:
+    return {
+        'messaging.system': 'rabbitmq',
+        'messaging.destination.name': 'banking_events',
+        'messaging.rabbitmq.destination.routing_key': routing_key
+    }
+
+@contextmanager
+def consume_span(method, properties):
+    """Span for handling one message, continuing the trace of whoever published it"""
+    parent = propagate.extract(getattr(properties, 'headers', None) or {})
+    routing_key = getattr(method, 'routing_key', '') or ''
+    with tracer.start_as_current_span(f"{routing_key} process", context=parent, kind=trace.SpanKind.CONSUMER,
+                                      attributes=_message_attributes(routing_key)) as span:
+        yield span
+
+@contextmanager
+def consume_batch_span(messages):
+    """Span for handling a batch of messages, linked to the trace of each message"""
+    links = []
+    for _, properties, _ in messages:
+        span_context = trace.get_current_span(
+            propagate.extract(getattr(properties, 'headers', None) or {})
+        ).get_span_context()
+        if span_context.is_valid:
+            links.append(trace.Link(span_context))
+    with tracer.start_as_current_span("batch process", kind=trace.SpanKind.CONSUMER, links=links,
+                                      attributes={'messaging.system': 'rabbitmq',
+                                                  'messaging.batch.message_count': len(messages)}) as span:
+        yield span
+
+class PublisherBackpressureError(Exception):
+    """Raised when the publish queue is full and cannot accept more messages"""
+
+class PublisherClosedError(Exception):
+    """Raised when publishing on a publisher that has been closed"""
+
+class RabbitMQPublisher:
+    """Publisher that owns its connection on a dedicated I/O thread.
+
+    publish_message only puts the message on a bounded in-memory queue and
+    returns, so callers never wait on broker I/O. The I/O thread drains the
+    queue in batches and has the broker confirm each batch with one channel
+    transaction commit. (On a BlockingConnection, confirm mode waits for
+    each message's confirm in turn, one round trip per message.) Futures
+    resolve once their batch is committed. A batch that fails is retried
+    on a fresh connection, so delivery is at-least-once. Once closed, the
+    publisher rejects new messages.
+    """
+
+    def __init__(self, host='rabbitmq', port=5672, username='admin', password='changeme',
+                 max_queue_size=None, batch_size=None, enqueue_timeout=None, max_retries=3):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.connection = None
+        self.channel = None
+        self.max_queue_size = max_queue_size or int(os.getenv("RABBITMQ_PUBLISH_QUEUE_SIZE", "10000"))
+        self.batch_size = batch_size or int(os.getenv("RABBITMQ_PUBLISH_BATCH_SIZE", "100"))
+        # Seconds publish_message may wait for queue space before raising; 0 fails immediately
+        self.enqueue_timeout = enqueue_timeout if enqueue_timeout is not None else float(os.getenv("RABBITMQ_PUBLISH_ENQUEUE_TIMEOUT", "0"))
+        self.max_retries = max_retries
+        self.published_count = 0
+        self.failed_count = 0
+        self.rejected_count = 0
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._closed = False
+
+    def connect(self):
+        """Establish connection to RabbitMQ (called on the I/O thread)"""
+        try:
+            credentials = pika.PlainCredentials(self.username, self.password)
+            parameters = pika.ConnectionParameters(
+                host=self.host,
+                port=self.port,
+                credentials=credentials
+            )
+            self.connection = pika.BlockingConnection(parameters)
+            self.channel = self.connection.channel()
+            
+            # Declare exchange
+            self.channel.exchange_declare(
+                exchange='banking_events',
+                exchange_type='topic',
+                durable=True
+            )
+            # Every batch is published inside a transaction and confirmed by tx_commit
+            self.channel.tx_select()
+            logger.info("Connected to RabbitMQ successfully")
+        except Exception as e:
+            logger.error(f"Failed to connect to RabbitMQ: {e}")
+            raise
+
+    def start(self):
+        """Start the I/O thread if it is not already running"""
+        with self._thread_lock:
+            if self._closed:
+                raise PublisherClosedError("Publisher is closed")
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name='rabbitmq-publisher', daemon=True)
+                self._thread.start()
+
+    def publish_message(self, routing_key: str, message: Dict[Any, Any], future: Future = None,
+                        headers: Optional[Dict[str, Any]] = None):
+        """Queue a message for publishing without waiting for the broker.
+
+        If a future is given it is resolved once the broker has confirmed the
+        message, or failed if the message is dropped. headers, if given, are
+        sent as-is (e.g. trace context captured when an outbox row was
+        written); otherwise the message carries the caller's trace context.
+        Raises PublisherClosedError after close().
+        """
+        # Add timestamp to a copy of the message unless the producer already stamped it
+        message = {'timestamp': datetime.utcnow().isoformat(), **message}
+        if headers is None:
+            with tracer.start_as_current_span(f"{routing_key} publish", kind=trace.SpanKind.PRODUCER,
+                                              attributes=_message_attributes(routing_key)):
+                headers = inject_trace_headers()
+        self.start()
+        item = (routing_key, json.dumps(message), future, headers or None)
+        try:
+            if self.enqueue_timeout > 0:
+                self._queue.put(item, timeout=self.enqueue_timeout)
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full:
+            with self._thread_lock:
+                self.rejected_count += 1
+            raise PublisherBackpressureError(f"Publish queue is full ({self.max_queue_size} messages)")
+
+    def publish_messages(self, messages: List[Tuple]) -> List[Future]:
+        """Queue several messages and return one confirmation future per message.
+
+        Each message is (routing_key, message) or (routing_key, message,
+        headers). Stops at the first message the queue cannot take, so the
+        returned list may be shorter than messages; callers retry the
+        remainder later.
+        """
+        futures = []
+        for routing_key, message, *headers in messages:
+            future = Future()
+            try:
+                self.publish_message(routing_key, message, future, headers[0] if headers else None)
+            except PublisherBackpressureError:
+                break
+            futures.append(future)
+        return futures
+
+    @property
+    def queue_depth(self) -> int:
+        """Messages accepted by publish_message but not yet confirmed by the broker"""
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, int]:
+        with self._thread_lock:
+            return {
+                'queue_depth': self.queue_depth,
+                'max_queue_size': self.max_queue_size,
+                'published': self.published_count,
+                'failed': self.failed_count,
+                'rejected': self.rejected_count
+            }
+
+    def _next_batch(self):
+        # Wait briefly for the first message, then take whatever else is
+        # already queued; batches grow with load without adding idle latency
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _publish_batch(self, batch):
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                if not self.connection or self.connection.is_closed:
+                    self.connect()
+                for routing_key, body, _, headers in batch:
+                    self.channel.basic_publish(
+                        exchange='banking_events',
+                        routing_key=routing_key,
+                        body=body,
+                        properties=pika.BasicProperties(
+                            delivery_mode=2,  # Make message persistent
+                            headers=headers
+                        )
+                    )
+                self.channel.tx_commit()
+                with self._thread_lock:
+                    self.published_count += len(batch)
+                for _, _, future, _ in batch:
+                    if future is not None:
+                        future.set_result(None)
+                logger.debug(f"Published batch of {len(batch)} messages")
+                return
+            except Exception as e:
+                logger.warning(f"Failed to publish batch of {len(batch)} messages (attempt {attempt}/{self.max_retries}): {e}")
+                self._disconnect()
+                if attempt < self.max_retries:
+                    self._stopping.wait(min(0.2 * 2 ** attempt, 5))
+        with self._thread_lock:
+            self.failed_count += len(batch)
+        for _, _, future, _ in batch:
+            if future is not None:
+                future.set_exception(RuntimeError(f"Message dropped after {self.max_retries} publish attempts"))
+        logger.error(f"Dropped batch of {len(batch)} messages after {self.max_retries} attempts")
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._publish_batch(batch)
+            elif self.connection and self.connection.is_open:
+                # Keep heartbeats flowing while idle
+                try:
+                    self.connection.process_data_events(time_limit=0)
+                except Exception as e:
+                    logger.warning(f"RabbitMQ connection lost while idle: {e}")
+                    self._disconnect()
+        self._disconnect()
+
+    def _disconnect(self):
+        try:
+            if self.connection and not self.connection.is_closed:
+                self.connection.close()
+                logger.info("RabbitMQ connection closed")
+        except Exception as e:
+            logger.warning(f"Error closing RabbitMQ connection: {e}")
+        self.connection = None
+        self.channel = None
+
+    def close(self, timeout: float = 10.0):
+        """Flush queued messages (up to timeout seconds) and close the connection.
+
+        Publishing afterwards raises PublisherClosedError instead of starting
+        the I/O thread again.
+        """
+        with self._thread_lock:
+            self._closed = True
+            self._stopping.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        else:
+            self._disconnect()
+
+class RabbitMQConsumer:
+    def __init__(self, host='rabbitmq', port=5672, username='admin', password='changeme'):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.connection = None
+        self.channel = None
+        self._consuming_batches = False
+
+    def connect(self):
+        """Establish connection to RabbitMQ"""
+        try:
+            credentials = pika.PlainCredentials(self.username, self.password)
+            parameters = pika.ConnectionParameters(
+                host=self.host,
+                port=self.port,
+                credentials=credentials
+            )
+            self.connection = pika.BlockingConnection(parameters)
+            self.channel = self.connection.channel()
+            
+            # Declare exchange
+            self.channel.exchange_declare(
+                exchange='banking_events',
+                exchange_type='topic',
+                durable=True
+            )
+            logger.info("Connected to RabbitMQ successfully")
+        except Exception as e:
+            logger.error(f"Failed to connect to RabbitMQ: {e}")
+            raise
+
+    def setup_queue(self, queue_name: str, routing_key: str):
+        """Setup a queue and bind it to the exchange"""
+        try:
+            if not self.connection or self.connection.is_closed:
+                self.connect()
+            
+            # Declare queue
+            self.channel.queue_declare(queue=queue_name, durable=True)
+            
+            # Bind queue to exchange
+            self.channel.queue_bind(
+                exchange='banking_events',
+                queue=queue_name,
+                routing_key=routing_key
+            )
+            logger.info(f"Queue {queue_name} setup with routing key {routing_key}")
+        except Exception as e:
+            logger.error(f"Failed to setup queue: {e}")
+            raise
+
+    def setup_exclusive_queue(self, routing_keys: list) -> str:
+        """Setup a private, auto-deleted queue bound to several routing keys.
+
+        Every consumer gets its own copy of each matching event, which is what
+        per-replica cache invalidation needs. Returns the generated queue name.
+        """
+        try:
+            if not self.connection or self.connection.is_closed:
+                self.connect()
+
+            result = self.channel.queue_declare(queue='', exclusive=True, auto_delete=True)
+            queue_name = result.method.queue
+            for routing_key in routing_keys:
+                self.channel.queue_bind(
+                    exchange='banking_events',
+                    queue=queue_name,
+                    routing_key=routing_key
+                )
+            logger.info(f"Exclusive queue {queue_name} setup with routing keys {routing_keys}")
+            return queue_name
+        except Exception as e:
+            logger.error(f"Failed to setup exclusive queue: {e}")
+            raise
+
+    def start_consuming(self, queue_name: str, callback):
+        """Start consuming messages from the queue"""
+        try:
+            if not self.connection or self.connection.is_closed:
+                self.connect()
+            
+            def traced_callback(ch, method, properties, body):
+                with consume_span(method, properties):
+                    callback(ch, method, properties, body)
+
+            self.channel.basic_qos(prefetch_count=1)
+            self.channel.basic_consume(
+                queue=queue_name,
+                on_message_callback=traced_callback
+            )
+            
+            logger.info(f"Started consuming from queue: {queue_name}")
+            self.channel.start_consuming()
+        except Exception as e:
+            logger.error(f"Failed to start consuming: {e}")
+            raise
+
+    def consume_batches(self, queue_name: str, handler, batch_size: int = 100, flush_interval: float = 0.2):
+        """Consume messages in batches and acknowledge each batch at once.
+
+        Up to batch_size messages are prefetched and collected for at most
+        flush_interval seconds after the first one arrives, then passed to
+        handler(messages) as a list of (method, properties, body). When the
+        handler returns, the batch is acked with multiple=True; if it raises,
+        the batch is requeued. Messages the handler skips are acked (dropped)
+        with the rest of the batch.
+        """
+        try:
+            if not self.connection or self.connection.is_closed:
+                self.connect()
+
+            self.channel.basic_qos(prefetch_count=batch_size)
+            self._consuming_batches = True
+            logger.info(f"Started batch consuming from queue: {queue_name} (batch size {batch_size})")
+
+            batch = []
+            deadline = None
+            for method, properties, body in self.channel.consume(queue_name, inactivity_timeout=flush_interval / 2):
+                if not self._consuming_batches:
+                    break
+                if method is not None:
+                    batch.append((method, properties, body))
+                    if deadline is None:
+                        deadline = time.monotonic() + flush_interval
+                if batch and (len(batch) >= batch_size or time.monotonic() >= deadline):
+                    self._flush_batch(batch, handler)
+                    batch = []
+                    deadline = None
+            self.channel.cancel()
+        except Exception as e:
+            logger.error(f"Failed to consume batches: {e}")
+            raise
+
+    def _flush_batch(self, batch, handler):
+        last_delivery_tag = batch[-1][0].delivery_tag
+        try:
+            with consume_batch_span(batch):
+                handler(batch)
+        except Exception as e:
+            logger.error(f"Failed to process batch of {len(batch)} messages, requeueing: {e}")
+            self.channel.basic_nack(delivery_tag=last_delivery_tag, multiple=True, requeue=True)
+            # Back off so a failing dependency does not turn into a redelivery loop
+            self.connection.sleep(1)
+            return
+        self.channel.basic_ack(delivery_tag=last_delivery_tag, multiple=True)
+
+    def stop_consuming(self):
+        """Stop consuming messages"""
+        self._consuming_batches = False
+        if self.channel:
+            self.channel.stop_consuming()
+
+    def close(self):
+        """Close the connection"""
+        if self.connection and not self.connection.is_closed:
+            self.connection.close()
+            logger.info("RabbitMQ connection closed")
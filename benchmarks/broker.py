@@ -0,0 +1,221 @@
+"""In-memory stand-in for RabbitMQ, shaped like the parts of pika that rabbitmq_utils uses.
+
+Patch pika.BlockingConnection with InMemoryBroker.connect and every
+RabbitMQPublisher / RabbitMQConsumer in the process talks to one shared
+broker: a topic exchange, durable and exclusive queues, channel
+transactions, basic_consume/start_consuming, the consume() generator and
+ack/nack with multiple=True. Each delivery is timed from broker commit to
+ack, so the broker also reports per routing key how long events wait
+before a consumer finishes with them.
+"""
+from collections import deque
+import itertools
+import re
+import threading
+import time
+
+
+class _Method:
+    def __init__(self, delivery_tag, routing_key, redelivered=False):
+        self.delivery_tag = delivery_tag
+        self.routing_key = routing_key
+        self.redelivered = redelivered
+
+
+class _DeclareOk:
+    def __init__(self, queue):
+        self.method = type("QueueDeclareOk", (), {"queue": queue})()
+
+
+class _Message:
+    __slots__ = ("routing_key", "body", "properties", "published_at", "redelivered")
+
+    def __init__(self, routing_key, body, properties):
+        self.routing_key = routing_key
+        self.body = body
+        self.properties = properties
+        self.published_at = time.perf_counter()
+        self.redelivered = False
+
+
+def _binding_pattern(routing_key: str):
+    # Topic exchange rules: "*" matches one word, "#" any number of words
+    pattern = re.escape(routing_key).replace(r"\*", r"[^.]+").replace(r"\#", r".*")
+    return re.compile(pattern + r"\Z")
+
+
+class InMemoryBroker:
+    def __init__(self):
+        self._lock = threading.Condition()
+        self._queues = {}  # name -> deque of _Message
+        self._bindings = []  # (compiled pattern, queue name)
+        self._names = itertools.count(1)
+        self.published = 0
+        self.unacked = 0
+        self.delivery_seconds = {}  # routing key -> list of commit-to-ack seconds
+
+    def connect(self, parameters=None):
+        """Drop-in for pika.BlockingConnection"""
+        return _Connection(self)
+
+    def declare_queue(self, name: str) -> str:
+        with self._lock:
+            if not name:
+                name = f"amq.gen-{next(self._names)}"
+            self._queues.setdefault(name, deque())
+            return name
+
+    def bind(self, queue: str, routing_key: str):
+        with self._lock:
+            self._bindings.append((_binding_pattern(routing_key), queue))
+
+    def route(self, messages):
+        with self._lock:
+            for message in messages:
+                self.published += 1
+                message.published_at = time.perf_counter()
+                for pattern, queue in self._bindings:
+                    if pattern.match(message.routing_key):
+                        self._queues[queue].append(message)
+            self._lock.notify_all()
+
+    def get(self, queue: str, timeout: float):
+        with self._lock:
+            deadline = time.monotonic() + timeout
+            while not self._queues[queue]:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._lock.wait(remaining)
+            self.unacked += 1
+            return self._queues[queue].popleft()
+
+    def requeue(self, queue: str, messages):
+        with self._lock:
+            self.unacked -= len(messages)
+            for message in reversed(messages):
+                message.redelivered = True
+                self._queues[queue].appendleft(message)
+            self._lock.notify_all()
+
+    def record_ack(self, messages):
+        now = time.perf_counter()
+        with self._lock:
+            self.unacked -= len(messages)
+            for message in messages:
+                self.delivery_seconds.setdefault(message.routing_key, []).append(now - message.published_at)
+
+    def discard(self, messages):
+        with self._lock:
+            self.unacked -= len(messages)
+
+    def pending(self) -> int:
+        """Messages queued or delivered but not yet acked, across all queues"""
+        with self._lock:
+            return self.unacked + sum(len(messages) for messages in self._queues.values())
+
+
+class _Connection:
+    def __init__(self, broker):
+        self.broker = broker
+        self.is_closed = False
+        self.is_open = True
+
+    def channel(self):
+        return _Channel(self.broker)
+
+    def process_data_events(self, time_limit=0):
+        pass
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def close(self):
+        self.is_closed = True
+        self.is_open = False
+
+
+class _Channel:
+    def __init__(self, broker):
+        self.broker = broker
+        self._transactional = False
+        self._pending = []
+        self._tags = itertools.count(1)
+        self._unacked = {}  # delivery tag -> (queue, _Message)
+        self._consumers = []  # (queue, callback)
+        self._consuming = False
+
+    # Declarations
+    def exchange_declare(self, exchange, exchange_type="topic", durable=False):
+        pass
+
+    def queue_declare(self, queue="", durable=False, exclusive=False, auto_delete=False):
+        return _DeclareOk(self.broker.declare_queue(queue))
+
+    def queue_bind(self, exchange, queue, routing_key):
+        self.broker.bind(queue, routing_key)
+
+    def basic_qos(self, prefetch_count=0):
+        pass
+
+    # Publishing
+    def tx_select(self):
+        self._transactional = True
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        message = _Message(routing_key, body, properties)
+        if self._transactional:
+            self._pending.append(message)
+        else:
+            self.broker.route([message])
+
+    def tx_commit(self):
+        pending, self._pending = self._pending, []
+        self.broker.route(pending)
+
+    # Consuming
+    def _deliver(self, queue, timeout):
+        message = self.broker.get(queue, timeout)
+        if message is None:
+            return None
+        tag = next(self._tags)
+        self._unacked[tag] = (queue, message)
+        return _Method(tag, message.routing_key, message.redelivered), message.properties, message.body
+
+    def basic_consume(self, queue, on_message_callback):
+        self._consumers.append((queue, on_message_callback))
+
+    def start_consuming(self):
+        self._consuming = True
+        while self._consuming:
+            for queue, callback in self._consumers:
+                delivery = self._deliver(queue, timeout=0.1)
+                if delivery is not None:
+                    callback(self, *delivery)
+
+    def stop_consuming(self):
+        self._consuming = False
+
+    def consume(self, queue, inactivity_timeout=None):
+        self._consuming = True
+        while self._consuming:
+            delivery = self._deliver(queue, timeout=inactivity_timeout or 0.1)
+            yield delivery if delivery is not None else (None, None, None)
+
+    def cancel(self):
+        self._consuming = False
+
+    def _settle(self, delivery_tag, multiple):
+        tags = [tag for tag in self._unacked if tag <= delivery_tag] if multiple else [delivery_tag]
+        return [self._unacked.pop(tag) for tag in sorted(tags) if tag in self._unacked]
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.broker.record_ack([message for _, message in self._settle(delivery_tag, multiple)])
+
+    def basic_nack(self, delivery_tag, multiple=False, requeue=True):
+        settled = self._settle(delivery_tag, multiple)
+        if not requeue:
+            self.broker.discard(settled)
+            return
+        for queue in {queue for queue, _ in settled}:
+            self.broker.requeue(queue, [message for q, message in settled if q == queue])
@@ -0,0 +1,203 @@
+"""Drive a transaction workload through the in-process stack and report latencies.
+
+    python -m benchmarks.run --concurrency 32 --duration 30 \\
+        --mix deposit=40,withdraw=25,transfer=20,account_read=15
+
+Reports throughput and p50/p95/p99 per operation as seen by the client,
+per internal hop from the services' own Prometheus histograms (Account
+Service calls, DB commit, outbox publish, lane wait), and for
+notification consumption (event committed to the broker until the
+notification consumer acked it). --output also writes the report as
+JSON so runs can be compared.
+
+All four services share one process and one GIL, so absolute numbers are
+lower than on the cluster; compare runs against each other.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+
+from . import stats
+from .stack import Stack
+
+DEFAULT_MIX = "deposit=40,withdraw=25,transfer=20,account_read=15"
+OPERATIONS = ("deposit", "withdraw", "transfer", "account_read")
+
+# Internal hops: (service, histogram name)
+HOP_HISTOGRAMS = (
+    ("transaction_service", "account_service_call_duration_seconds"),
+    ("transaction_service", "transaction_stage_duration_seconds"),
+    ("transaction_service", "transaction_lane_wait_seconds"),
+    ("transaction_service", "transaction_duration_seconds"),
+)
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        operation, _, weight = part.partition("=")
+        operation = operation.strip()
+        if operation not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation {operation!r}; choose from {', '.join(OPERATIONS)}")
+        weights[operation] = float(weight or 1)
+    return weights
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--database", choices=("sqlite", "env"), default="sqlite",
+                        help="sqlite: fresh SQLite files; env: use the *_DATABASE_URL variables (e.g. local Postgres)")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--accounts", type=int, default=50)
+    parser.add_argument("--initial-balance", type=float, default=10000)
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to run the workload")
+    parser.add_argument("--requests", type=int, default=None, help="Stop after this many requests instead")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Weighted operation mix (default {DEFAULT_MIX})")
+    parser.add_argument("--max-amount", type=float, default=100)
+    parser.add_argument("--drain-timeout", type=float, default=30,
+                        help="Seconds to wait for queued events to be consumed after the workload")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="Also write the report as JSON to this path")
+    return parser.parse_args(argv)
+
+
+async def seed_accounts(stack: Stack, users: int, accounts: int, initial_balance: float) -> list:
+    user_ids, account_ids = [], []
+    async with stack["user_service"].client() as client:
+        for i in range(users):
+            response = await client.post("/users", json={
+                "name": f"Bench User {i}", "email": f"bench{i}@example.com", "phone": f"555000{i:04d}"
+            })
+            response.raise_for_status()
+            user_ids.append(response.json()["id"])
+    async with stack["account_service"].client() as client:
+        for i in range(accounts):
+            response = await client.post("/accounts", json={
+                "user_id": user_ids[i % len(user_ids)], "account_type": "checking", "balance": initial_balance
+            })
+            response.raise_for_status()
+            account_ids.append(response.json()["id"])
+    return account_ids
+
+
+def build_request(operation: str, rng: random.Random, account_ids: list, max_amount: float):
+    amount = round(rng.uniform(1, max_amount), 2)
+    account_id = rng.choice(account_ids)
+    if operation == "account_read":
+        return "account_service", "GET", f"/accounts/{account_id}", None
+    body = {"account_id": account_id, "type": operation, "amount": amount}
+    if operation == "transfer":
+        body["target_account_id"] = rng.choice([other for other in account_ids if other != account_id])
+    return "transaction_service", "POST", "/transactions", body
+
+
+async def run_workload(stack: Stack, args, account_ids: list) -> dict:
+    rng = random.Random(args.seed)
+    operations, weights = zip(*args.mix.items())
+    latencies = {operation: [] for operation in operations}
+    statuses = {operation: {} for operation in operations}
+    clients = {name: stack[name].client() for name in ("account_service", "transaction_service")}
+    issued = 0
+    deadline = time.perf_counter() + args.duration
+
+    def more():
+        nonlocal issued
+        if args.requests is not None:
+            issued += 1
+            return issued <= args.requests
+        return time.perf_counter() < deadline
+
+    async def worker():
+        while more():
+            operation = rng.choices(operations, weights)[0]
+            service, method, path, body = build_request(operation, rng, account_ids, args.max_amount)
+            started = time.perf_counter()
+            try:
+                response = await clients[service].request(method, path, json=body)
+                status = str(response.status_code)
+            except Exception as e:
+                status = type(e).__name__
+            latencies[operation].append(time.perf_counter() - started)
+            statuses[operation][status] = statuses[operation].get(status, 0) + 1
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    finally:
+        for client in clients.values():
+            await client.aclose()
+    elapsed = time.perf_counter() - started
+
+    endpoints = {}
+    for operation in operations:
+        summary = stats.summarize(latencies[operation], elapsed)
+        summary["errors"] = sum(count for status, count in statuses[operation].items() if not status.startswith(("2", "4")))
+        summary["statuses"] = statuses[operation]
+        endpoints[operation] = summary
+    total = sum(len(samples) for samples in latencies.values())
+    return {"elapsed_seconds": elapsed, "requests": total, "throughput_per_second": total / elapsed, "endpoints": endpoints}
+
+
+async def drain_events(stack: Stack, timeout: float) -> float:
+    """Wait until the outbox and the broker are empty; returns seconds waited"""
+    transaction = stack["transaction_service"]
+    session_factory = transaction.modules["app.database"].SessionLocal
+    outbox_model = transaction.modules["app.models"].OutboxEvent
+    transaction.modules["app.main"].outbox_relay.notify()
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        with session_factory() as db:
+            outbox_depth = db.query(outbox_model).count()
+        if outbox_depth == 0 and stack.broker.pending() == 0:
+            break
+        await asyncio.sleep(0.05)
+    return time.perf_counter() - started
+
+
+def internal_hops(stack: Stack) -> dict:
+    hops = {}
+    for service, metric in HOP_HISTOGRAMS:
+        for labels, summary in stats.registry_histograms(stack[service].registry, metric).items():
+            hops[f"{metric}{{{labels}}}" if labels != metric else metric] = summary
+    return hops
+
+
+async def main(args):
+    # One INFO line per in-process request would drown the report
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    stack = Stack(database=args.database).load()
+    await stack.start()
+    try:
+        account_ids = await seed_accounts(stack, args.users, args.accounts, args.initial_balance)
+        report = await run_workload(stack, args, account_ids)
+        report["drain_seconds"] = await drain_events(stack, args.drain_timeout)
+        report["internal_hops"] = internal_hops(stack)
+        report["event_consumption"] = {
+            routing_key: stats.summarize(samples)
+            for routing_key, samples in sorted(stack.broker.delivery_seconds.items())
+        }
+    finally:
+        await stack.stop()
+
+    print(f"{report['requests']} requests in {report['elapsed_seconds']:.2f}s "
+          f"({report['throughput_per_second']:.1f}/s), concurrency {args.concurrency}")
+    print()
+    print(stats.format_table("operation", report["endpoints"]))
+    print()
+    print(stats.format_table("internal hop", report["internal_hops"]))
+    print()
+    print(stats.format_table("event (commit -> ack)", report["event_consumption"]))
+    print(f"\nEvents drained {report['drain_seconds']:.2f}s after the workload ended")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
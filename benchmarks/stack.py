@@ -0,0 +1,161 @@
+"""Boot the four FastAPI services in one process, wired to each other in memory.
+
+Every service is a package named "app", so each one is imported on its
+own with its directory at the front of sys.path, migrated with Alembic
+if it has migrations, and then removed from sys.modules before the next
+one is imported. The app objects and their modules stay alive through
+the references kept here.
+
+Each service also registers its Prometheus metrics on the default
+registry, and several services use the same metric names. After a
+service is imported, its collectors are moved to a CollectorRegistry of
+its own. That avoids duplicate-name errors and lets the harness read
+each service's histograms separately.
+
+Cross-service calls stay in process:
+- Account Service -> User Service goes through a TestClient that stands
+  in for its requests session.
+- Transaction Service -> Account Service goes through an httpx client
+  with an ASGITransport.
+- RabbitMQ is replaced by benchmarks.broker.InMemoryBroker.
+"""
+from contextlib import AsyncExitStack
+from urllib.parse import urlsplit
+import importlib
+import os
+import sys
+import tempfile
+
+import httpx
+import pika
+from alembic import command
+from alembic.config import Config
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY, CollectorRegistry
+
+from .broker import InMemoryBroker
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVICES = ("user_service", "account_service", "transaction_service", "notification_service")
+
+DATABASE_URL_VARIABLES = {
+    "user_service": "USER_SERVICE_DATABASE_URL",
+    "account_service": "ACCOUNT_SERVICE_DATABASE_URL",
+    "transaction_service": "TRANSACTION_SERVICE_DATABASE_URL",
+    "notification_service": "NOTIFICATION_SERVICE_DATABASE_URL",
+}
+
+
+class Service:
+    def __init__(self, name, modules, registry):
+        self.name = name
+        self.modules = modules  # "app.main", "app.crud", ... and "rabbitmq_utils"
+        self.registry = registry  # this service's Prometheus collectors
+        self.app = modules["app.main"].app
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=self.app), base_url=f"http://{self.name}")
+
+
+class _UserServiceSession:
+    """Stands in for Account Service's requests session, answering from User Service in process"""
+
+    def __init__(self, client: TestClient):
+        self.client = client
+
+    def get(self, url, timeout=None, **kwargs):
+        return self.client.get(urlsplit(url).path, **kwargs)
+
+
+def _service_module_names():
+    return [name for name in sys.modules if name == "app" or name.startswith("app.") or name == "rabbitmq_utils"]
+
+
+def _forget_service_modules():
+    for name in _service_module_names():
+        del sys.modules[name]
+
+
+class Stack:
+    """The four services and the broker they share.
+
+    database="sqlite" gives every service a fresh SQLite file in a
+    temporary directory. database="env" keeps the *_DATABASE_URL
+    variables as they are, e.g. pointing at a local Postgres.
+    """
+
+    def __init__(self, database: str = "sqlite"):
+        self.database = database
+        self.broker = InMemoryBroker()
+        self.services = {}
+        self._exit_stack = AsyncExitStack()
+        self._user_client = None
+        self._real_blocking_connection = None
+
+    def _configure_databases(self):
+        if self.database == "env":
+            return
+        directory = tempfile.mkdtemp(prefix="microbank-bench-")
+        for service, variable in DATABASE_URL_VARIABLES.items():
+            os.environ[variable] = f"sqlite:///{os.path.join(directory, service)}.db"
+
+    def _load(self, service: str) -> Service:
+        directory = os.path.join(REPO_ROOT, service)
+        _forget_service_modules()
+        before = set(REGISTRY._collector_to_names)
+        sys.path.insert(0, directory)
+        try:
+            alembic_ini = os.path.join(directory, "alembic.ini")
+            if os.path.exists(alembic_ini):
+                config = Config(alembic_ini)
+                config.set_main_option("script_location", os.path.join(directory, "migrations"))
+                command.upgrade(config, "head")
+            importlib.import_module("app.main")
+            modules = {name: sys.modules[name] for name in _service_module_names()}
+        finally:
+            sys.path.remove(directory)
+            _forget_service_modules()
+
+        registry = CollectorRegistry(auto_describe=True)
+        for collector in set(REGISTRY._collector_to_names) - before:
+            REGISTRY.unregister(collector)
+            registry.register(collector)
+        return Service(service, modules, registry)
+
+    def load(self):
+        """Import, migrate and wire every service; call before start()"""
+        self._configure_databases()
+        # rabbitmq_utils looks pika.BlockingConnection up on every connect,
+        # including the consumer threads some services start on import
+        self._real_blocking_connection = pika.BlockingConnection
+        pika.BlockingConnection = self.broker.connect
+        for service in SERVICES:
+            self.services[service] = self._load(service)
+
+        user = self.services["user_service"]
+        account = self.services["account_service"]
+        transaction = self.services["transaction_service"]
+        self._user_client = TestClient(user.app)
+        account.modules["app.user_client"].session = _UserServiceSession(self._user_client)
+        account_client = transaction.modules["app.account_client"]
+        account_client._client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=account.app),
+            base_url=account_client.ACCOUNT_SERVICE_URL
+        )
+        return self
+
+    async def start(self):
+        """Run every service's startup handlers on the running event loop"""
+        self._exit_stack.enter_context(self._user_client)
+        for service in SERVICES[1:]:
+            app = self.services[service].app
+            await self._exit_stack.enter_async_context(app.router.lifespan_context(app))
+
+    async def stop(self):
+        await self._exit_stack.aclose()
+        if self._real_blocking_connection is not None:
+            pika.BlockingConnection = self._real_blocking_connection
+
+    def __getitem__(self, service: str) -> Service:
+        return self.services[service]
@@ -0,0 +1,85 @@
+"""Latency summaries for the benchmark report"""
+import math
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def percentile(samples, q: float):
+    """Nearest-rank percentile of raw samples"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def summarize(samples, elapsed: float = None) -> dict:
+    summary = {"count": len(samples)}
+    if elapsed:
+        summary["throughput_per_second"] = len(samples) / elapsed
+    for q in QUANTILES:
+        summary[f"p{int(q * 100)}_ms"] = _ms(percentile(samples, q))
+    return summary
+
+
+def histogram_quantile(q: float, buckets):
+    """Quantile of a Prometheus histogram from (upper bound, cumulative count) pairs.
+
+    Interpolates linearly inside the bucket like PromQL's histogram_quantile,
+    so the result is only as precise as the bucket layout.
+    """
+    buckets = sorted(buckets)
+    if not buckets or buckets[-1][1] == 0:
+        return None
+    rank = q * buckets[-1][1]
+    lower_bound, lower_count = 0.0, 0.0
+    for upper_bound, count in buckets:
+        if count >= rank:
+            if math.isinf(upper_bound):
+                return lower_bound
+            if count == lower_count:
+                return upper_bound
+            return lower_bound + (upper_bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+        lower_bound, lower_count = upper_bound, count
+    return lower_bound
+
+
+def registry_histograms(registry, metric_name: str) -> dict:
+    """Summaries of one histogram in a registry, keyed by its label values (without le)"""
+    series = {}
+    for family in registry.collect():
+        if family.name != metric_name:
+            continue
+        for sample in family.samples:
+            if not sample.name.endswith("_bucket"):
+                continue
+            labels = tuple(sorted((key, value) for key, value in sample.labels.items() if key != "le"))
+            series.setdefault(labels, []).append((float(sample.labels["le"]), sample.value))
+    summaries = {}
+    for labels, buckets in series.items():
+        summary = {"count": int(max(count for _, count in buckets))}
+        if summary["count"] == 0:
+            continue
+        for q in QUANTILES:
+            summary[f"p{int(q * 100)}_ms"] = _ms(histogram_quantile(q, buckets))
+        summaries[",".join(f"{key}={value}" for key, value in labels) or metric_name] = summary
+    return summaries
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def format_table(title: str, rows: dict) -> str:
+    """Render {name: summary} as a fixed-width table"""
+    columns = ["count", "throughput_per_second", "errors", "p50_ms", "p95_ms", "p99_ms"]
+    columns = [column for column in columns if any(column in summary for summary in rows.values())]
+    width = max([len(name) for name in rows] + [len(title)]) + 2
+    widths = [max(len(column), 10) + 2 for column in columns]
+    lines = [title.ljust(width) + "".join(column.rjust(w) for column, w in zip(columns, widths))]
+    for name, summary in rows.items():
+        cells = []
+        for column, w in zip(columns, widths):
+            value = summary.get(column)
+            cells.append(("-" if value is None else f"{value:.2f}" if isinstance(value, float) else str(value)).rjust(w))
+        lines.append(name.ljust(width) + "".join(cells))
+    return "\n".join(lines)
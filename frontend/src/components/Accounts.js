@@ -232,7 +232,7 @@ function Accounts() {
                     {a.account_type}
                   </td>
                   <td style={{ border: '1px solid #ddd', padding: '12px' }}>
-                    ${a.balance.toFixed(2)}
+                    ${Number(a.balance).toFixed(2)}
                   </td>
                   <td style={{ border: '1px solid #ddd', padding: '12px' }}>
                     <button
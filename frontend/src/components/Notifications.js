@@ -1,42 +1,134 @@
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import axios from "axios";
 
 const API_URL = '/api/notifications';
+const USERS_API_URL = '/api/users';
 
 function Notifications() {
+  const [userIdInput, setUserIdInput] = useState('');
+  const [userId, setUserId] = useState(null);
   const [notifications, setNotifications] = useState([]);
+  const [unreadCount, setUnreadCount] = useState(0);
   const [error, setError] = useState('');
   const [loading, setLoading] = useState(false);
+  // Ids already shown, so a pushed notification is never added twice
+  const knownIds = useRef(new Set());
 
-  const fetchNotifications = async () => {
+  // Loads the first page and returns the newest id in it (or null)
+  const fetchNotifications = async (id) => {
     try {
       setLoading(true);
-      const res = await axios.get(API_URL);
-      setNotifications(res.data);
+      // The user's own inbox and unread count, both served from per-user indexes
+      const [inbox, unread] = await Promise.all([
+        axios.get(`${USERS_API_URL}/${id}/notifications`),
+        axios.get(`${USERS_API_URL}/${id}/notifications/unread-count`),
+      ]);
+      knownIds.current = new Set(inbox.data.map((n) => n.id));
+      setNotifications(inbox.data);
+      setUnreadCount(unread.data.unread_count);
       setError('');
+      return inbox.data.length > 0
+        ? Math.max(...inbox.data.map((n) => n.id))
+        : null;
     } catch (error) {
       setError(
         `Failed to load notifications: ${
           error.response?.data?.detail || error.message
         }`,
       );
+      return null;
     } finally {
       setLoading(false);
     }
   };
 
+  const handlePushed = (event) => {
+    const notification = JSON.parse(event.data);
+    if (knownIds.current.has(notification.id)) {
+      return;
+    }
+    knownIds.current.add(notification.id);
+    setNotifications((current) => [notification, ...current]);
+    if (!notification.is_read) {
+      setUnreadCount((count) => count + 1);
+    }
+  };
+
   useEffect(() => {
-    fetchNotifications();
-    const interval = setInterval(fetchNotifications, 5000); // auto-refresh every 5 seconds
-    return () => clearInterval(interval);
-  }, []);
+    if (!userId) {
+      return undefined;
+    }
+    let stream = null;
+    let closed = false;
+    // Load the inbox once, then have new notifications pushed instead of
+    // polling. The stream starts after the newest loaded id, so nothing
+    // stored in between is missed; EventSource reconnects by itself.
+    fetchNotifications(userId).then((latestId) => {
+      if (closed) {
+        return;
+      }
+      const query = latestId ? `?last_event_id=${latestId}` : '';
+      stream = new EventSource(
+        `${USERS_API_URL}/${userId}/notifications/stream${query}`,
+      );
+      stream.addEventListener('notification', handlePushed);
+      stream.onopen = () => setError('');
+      stream.onerror = () =>
+        setError('Live notification updates interrupted, reconnecting...');
+    });
+    return () => {
+      closed = true;
+      if (stream) {
+        stream.close();
+      }
+    };
+  }, [userId]);
+
+  const handleShow = (e) => {
+    e.preventDefault();
+    if (isNaN(userIdInput) || parseInt(userIdInput) <= 0) {
+      setError('User ID must be a positive number');
+      return;
+    }
+    setNotifications([]);
+    setUnreadCount(0);
+    setUserId(parseInt(userIdInput));
+  };
 
-  const handleDelete = async (id) => {
+  // Mark the given notifications as read, or every unread one if ids is omitted
+  const handleMarkRead = async (ids) => {
+    try {
+      setLoading(true);
+      const res = await axios.post(
+        `${USERS_API_URL}/${userId}/notifications/read`,
+        ids ? { notification_ids: ids } : {},
+      );
+      setNotifications((current) =>
+        current.map((n) =>
+          !ids || ids.includes(n.id) ? { ...n, is_read: true } : n,
+        ),
+      );
+      setUnreadCount(res.data.unread_count);
+    } catch (error) {
+      const errorMessage = error.response?.data?.detail || error.message;
+      setError(`Error marking notifications as read: ${errorMessage}`);
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  const handleDelete = async (notification) => {
     if (window.confirm('Are you sure you want to delete this notification?')) {
       try {
         setLoading(true);
-        await axios.delete(`${API_URL}/${id}`);
-        fetchNotifications();
+        await axios.delete(`${API_URL}/${notification.id}`);
+        knownIds.current.delete(notification.id);
+        setNotifications((current) =>
+          current.filter((n) => n.id !== notification.id),
+        );
+        if (!notification.is_read) {
+          setUnreadCount((count) => Math.max(0, count - 1));
+        }
       } catch (error) {
         const errorMessage = error.response?.data?.detail || error.message;
         setError(`Error deleting notification: ${errorMessage}`);
@@ -48,7 +140,9 @@ function Notifications() {
 
   return (
     <div>
-      <h2>Notifications</h2>
+      <h2>
+        Notifications{userId ? ` for User ${userId} (${unreadCount} unread)` : ''}
+      </h2>
 
       {error && (
         <div
@@ -65,7 +159,29 @@ function Notifications() {
         </div>
       )}
 
-      {loading && notifications.length === 0 ? (
+      <form onSubmit={handleShow}>
+        <input
+          placeholder="User ID"
+          type="number"
+          value={userIdInput}
+          onChange={(e) => setUserIdInput(e.target.value)}
+          required
+        />
+        <button type="submit">Show Notifications</button>
+        {userId && unreadCount > 0 && (
+          <button
+            type="button"
+            onClick={() => handleMarkRead()}
+            disabled={loading}
+          >
+            Mark all as read
+          </button>
+        )}
+      </form>
+
+      {!userId ? (
+        <p>Enter a user ID to see their notifications.</p>
+      ) : loading && notifications.length === 0 ? (
         <p>Loading notifications...</p>
       ) : notifications.length === 0 ? (
         <p>No notifications yet.</p>
@@ -79,7 +195,7 @@ function Notifications() {
                 padding: '15px',
                 backgroundColor: '#2c2c2c',
                 color: '#ffffff',
-                border: '1px solid #444',
+                border: n.is_read ? '1px solid #444' : '1px solid #4CAF50',
                 borderRadius: '8px',
                 boxShadow: '0 2px 4px rgba(0,0,0,0.3)',
               }}
@@ -91,7 +207,7 @@ function Notifications() {
                   color: '#4CAF50',
                 }}
               >
-                User {n.user_id}
+                {n.is_read ? 'Read' : 'Unread'}
               </div>
               <div style={{ marginBottom: '8px', fontSize: '16px' }}>
                 {n.message}
@@ -105,8 +221,26 @@ function Notifications() {
               >
                 {new Date(n.timestamp).toLocaleString()}
               </div>
+              {!n.is_read && (
+                <button
+                  onClick={() => handleMarkRead([n.id])}
+                  style={{
+                    backgroundColor: '#4CAF50',
+                    color: 'white',
+                    border: 'none',
+                    padding: '8px 12px',
+                    borderRadius: '4px',
+                    cursor: 'pointer',
+                    fontSize: '14px',
+                    marginRight: '8px',
+                  }}
+                  disabled={loading}
+                >
+                  Mark as read
+                </button>
+              )}
               <button
-                onClick={() => handleDelete(n.id)}
+                onClick={() => handleDelete(n)}
                 style={{
                   backgroundColor: '#b00020',
                   color: 'white',
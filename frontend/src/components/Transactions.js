@@ -287,7 +287,7 @@ function Transactions() {
                     </strong>
                   </td>
                   <td style={{ border: '1px solid #ddd', padding: '12px' }}>
-                    ${t.amount.toFixed(2)}
+                    ${Number(t.amount).toFixed(2)}
                   </td>
                   <td style={{ border: '1px solid #ddd', padding: '12px' }}>
                     {t.account_id}
@@ -1,11 +1,92 @@
+from sqlalchemy import insert, select, or_, and_
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
+from collections import Counter
+from datetime import datetime
 from . import models, schemas
 
+def select_notification(notification_id: int):
+    return select(models.Notification).where(models.Notification.id == notification_id)
+
+def select_notifications(skip: int = 0, limit: int = 100, after_id: int = None):
+    # Keyset pagination over the primary key; skip is only a legacy fallback
+    stmt = select(models.Notification).order_by(models.Notification.id).limit(limit)
+    if after_id is not None:
+        return stmt.where(models.Notification.id > after_id)
+    return stmt.offset(skip)
+
+def select_user_notifications(user_id: int, unread_only: bool = False, before=None, limit: int = 100):
+    """A user's inbox, newest first, served from the (user_id, timestamp) indexes"""
+    stmt = select(models.Notification).where(models.Notification.user_id == user_id)
+    if unread_only:
+        stmt = stmt.where(models.Notification.is_read == False)  # noqa: E712 - SQL expression
+    if before:
+        before_timestamp, before_id = before
+        stmt = stmt.where(or_(
+            models.Notification.timestamp < before_timestamp,
+            and_(models.Notification.timestamp == before_timestamp, models.Notification.id < before_id)
+        ))
+    return stmt.order_by(models.Notification.timestamp.desc(), models.Notification.id.desc()).limit(limit)
+
+def select_unread_count(user_id: int):
+    return select(models.NotificationUnreadCount.unread_count).where(models.NotificationUnreadCount.user_id == user_id)
+
 def get_notification(db: Session, notification_id: int):
-    return db.query(models.Notification).filter(models.Notification.id == notification_id).first()
+    return db.scalars(select_notification(notification_id)).first()
+
+def get_notifications(db: Session, skip: int = 0, limit: int = 100, after_id: int = None):
+    return db.scalars(select_notifications(skip, limit, after_id)).all()
+
+def get_user_notifications(db: Session, user_id: int, unread_only: bool = False, before=None, limit: int = 100):
+    return db.scalars(select_user_notifications(user_id, unread_only, before, limit)).all()
+
+def get_user_notifications_after(db: Session, user_id: int, after_id: int, limit: int = 100):
+    """Notifications created after after_id, oldest first, for stream catch-up"""
+    return (
+        db.query(models.Notification)
+        .filter(models.Notification.user_id == user_id, models.Notification.id > after_id)
+        .order_by(models.Notification.id)
+        .limit(limit)
+        .all()
+    )
+
+def get_unread_count(db: Session, user_id: int) -> int:
+    return db.scalar(select_unread_count(user_id)) or 0
 
-def get_notifications(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Notification).offset(skip).limit(limit).all()
+def _increment_unread_counts(db: Session, counts: dict):
+    # Upsert one counter row per user; users are sorted so concurrent batches
+    # lock counter rows in the same order
+    if not counts:
+        return
+    dialect = db.get_bind().dialect.name
+    rows = [{"user_id": user_id, "unread_count": counts[user_id]} for user_id in sorted(counts)]
+    if dialect in ("postgresql", "sqlite"):
+        upsert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = upsert(models.NotificationUnreadCount).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id"],
+            set_={"unread_count": models.NotificationUnreadCount.unread_count + stmt.excluded.unread_count}
+        )
+        db.execute(stmt)
+        return
+    for row in rows:
+        updated = (
+            db.query(models.NotificationUnreadCount)
+            .filter(models.NotificationUnreadCount.user_id == row["user_id"])
+            .update({models.NotificationUnreadCount.unread_count: models.NotificationUnreadCount.unread_count + row["unread_count"]},
+                    synchronize_session=False)
+        )
+        if not updated:
+            db.add(models.NotificationUnreadCount(**row))
+
+def _decrement_unread_count(db: Session, user_id: int, amount: int):
+    if amount:
+        (
+            db.query(models.NotificationUnreadCount)
+            .filter(models.NotificationUnreadCount.user_id == user_id)
+            .update({models.NotificationUnreadCount.unread_count: models.NotificationUnreadCount.unread_count - amount},
+                    synchronize_session=False)
+        )
 
 def create_notification(db: Session, notification: schemas.NotificationCreate):
     db_notification = models.Notification(
@@ -13,11 +94,48 @@ def create_notification(db: Session, notification: schemas.NotificationCreate):
         message=notification.message
     )
     db.add(db_notification)
+    _increment_unread_counts(db, {notification.user_id: 1})
     db.commit()
     db.refresh(db_notification)
     return db_notification
+
+def create_notifications_bulk(db: Session, notifications: list):
+    """Insert many notifications with one multi-row INSERT and one commit"""
+    if not notifications:
+        return []
+    # Plain rows, so nothing is expired and re-fetched after the commit
+    db_notifications = db.execute(
+        insert(models.Notification).returning(*models.Notification.__table__.c, sort_by_parameter_order=True),
+        [{"user_id": n.user_id, "message": n.message} for n in notifications]
+    ).all()
+    _increment_unread_counts(db, Counter(n.user_id for n in notifications))
+    db.commit()
+    return db_notifications
+
+def mark_notifications_read(db: Session, user_id: int, notification_ids: list = None) -> int:
+    """Mark a user's unread notifications (all, or the given ids) as read.
+
+    Returns how many notifications changed state; the unread counter is
+    adjusted by exactly that amount in the same commit.
+    """
+    query = db.query(models.Notification).filter(
+        models.Notification.user_id == user_id,
+        models.Notification.is_read == False  # noqa: E712 - SQL expression
+    )
+    if notification_ids is not None:
+        query = query.filter(models.Notification.id.in_(notification_ids))
+    marked = query.update(
+        {models.Notification.is_read: True, models.Notification.read_at: datetime.utcnow()},
+        synchronize_session=False
+    )
+    _decrement_unread_count(db, user_id, marked)
+    db.commit()
+    return marked
+
 def delete_notification(db: Session, notification_id: int):
     notification = db.query(models.Notification).filter(models.Notification.id == notification_id).first()
     if notification:
+        if not notification.is_read:
+            _decrement_unread_count(db, notification.user_id, 1)
         db.delete(notification)
         db.commit()
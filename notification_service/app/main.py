@@ -1,26 +1,67 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from prometheus_fastapi_instrumentator import Instrumentator
-from . import models, schemas, crud
-from .database import Base, engine, SessionLocal
+from typing import Optional
+from . import models, schemas, crud, lifecycle
+from .pagination import resolve_after_id, set_next_cursor, encode_history_cursor, decode_history_cursor, NEXT_CURSOR_HEADER
+from .database import engine, async_engine, SessionLocal, fetch_all, fetch_first, dispose_async_engine
+from .tracing import setup_tracing, shutdown_tracing
+from .push import NotificationHub, notification_payload, format_sse, NOTIFICATION_PUSH_HEARTBEAT
+import asyncio
 import threading
 import json
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from rabbitmq_utils import RabbitMQConsumer
+from rabbitmq_utils import RabbitMQPublisher, RabbitMQConsumer
+
+# "batch" buffers messages and bulk-inserts them; "single" handles one message per commit
+NOTIFICATION_CONSUMER_MODE = os.getenv("NOTIFICATION_CONSUMER_MODE", "batch")
+# Messages prefetched and written per bulk insert in batch mode
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "100"))
+# Longest a partially filled batch waits before it is flushed
+NOTIFICATION_FLUSH_INTERVAL_MS = int(os.getenv("NOTIFICATION_FLUSH_INTERVAL_MS", "200"))
+# Worker processes per pod that consume the shared notifications queue and
+# store notifications (0 disables); push streams are fed in every worker
+NOTIFICATION_CONSUMER_WORKERS = int(os.getenv("NOTIFICATION_CONSUMER_WORKERS", "1"))
 
 app = FastAPI(title="Notification Service", version="1.0.0")
 
 # Prometheus metrics instrumentation
 Instrumentator().instrument(app).expose(app)
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# Spans for requests, message handling and DB queries (TRACING_EXPORTER)
+setup_tracing(app, [engine] + ([async_engine.sync_engine] if async_engine is not None else []))
 
 # Initialize RabbitMQ Consumer
 rabbitmq_consumer = RabbitMQConsumer()
 
+# Announces stored notifications so every worker can push them to its streams
+rabbitmq_publisher = RabbitMQPublisher()
+
+# Fan-out of newly stored notifications to this worker's open push streams,
+# fed by notification.created events on a queue private to this worker
+notification_hub = NotificationHub()
+push_consumer = RabbitMQConsumer()
+
+# Connections opened at startup; GET /ready waits for them
+pool_warmup = lifecycle.PoolWarmup(engine, async_engine)
+runs_consumer = False
+push_consuming = False
+
+@app.on_event("startup")
+async def startup_event():
+    global runs_consumer
+    notification_hub.bind_loop(asyncio.get_running_loop())
+    # Streams can connect to any worker, so every worker receives pushes
+    threading.Thread(target=start_push_consumer, daemon=True).start()
+    runs_consumer = lifecycle.claim_worker_slot("notification-consumer", NOTIFICATION_CONSUMER_WORKERS)
+    if runs_consumer:
+        threading.Thread(target=start_rabbitmq_consumer, daemon=True).start()
+    pool_warmup.start()
+
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
@@ -33,6 +74,47 @@ def get_db():
 def read_root():
     return {"message": "Notification Service is running"}
 
+@app.get("/ready")
+def read_ready(response: Response):
+    """Readiness probe: 200 once this worker's database pool is warm and reachable"""
+    return lifecycle.readiness(
+        response,
+        {"database": lifecycle.database_ready(engine), "pool_warm": pool_warmup.done},
+        consumer=runs_consumer,
+        push_consumer=push_consuming
+    )
+
+def announce_notifications(notifications):
+    """Publish notification.created for stored notifications; pushing is best effort"""
+    try:
+        rabbitmq_publisher.publish_messages([
+            ('notification.created', notification_payload(notification)) for notification in notifications
+        ])
+    except Exception as e:
+        print(f"Failed to announce notifications: {e}")  # Streams catch up with Last-Event-ID
+
+def process_push_event(ch, method, properties, body):
+    """Push a notification.created event to this worker's open streams"""
+    try:
+        notification_hub.publish([json.loads(body)])
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+    except Exception as e:
+        print(f"Error processing push event: {e}")
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+
+def start_push_consumer():
+    """Consume notification.created on an exclusive, auto-delete queue private to this worker"""
+    global push_consuming
+    try:
+        queue_name = push_consumer.setup_exclusive_queue(['notification.created'])
+        push_consuming = True
+        push_consumer.start_consuming(queue_name, process_push_event)
+    except Exception as e:
+        print(f"Error in push consumer: {e}")
+    finally:
+        # Streams on this worker get no pushes from here on; /ready reports it
+        push_consuming = False
+
 def process_notification_message(ch, method, properties, body):
     """Process incoming notification messages from RabbitMQ"""
     try:
@@ -49,7 +131,8 @@ def process_notification_message(ch, method, properties, body):
                     user_id=user_id,
                     message=message
                 )
-                crud.create_notification(db, notification_data)
+                db_notification = crud.create_notification(db, notification_data)
+                announce_notifications([db_notification])
                 print(f"Created notification for user {user_id}: {message}")
             finally:
                 db.close()
@@ -62,48 +145,178 @@ def process_notification_message(ch, method, properties, body):
         # Reject the message and don't requeue it
         ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
 
+def process_notification_batch(messages):
+    """Write a batch of notification messages with a single bulk insert.
+
+    Malformed messages are logged and skipped (dropped with the batch ack);
+    a database error propagates so the whole batch is requeued.
+    """
+    notifications = []
+    for method, properties, body in messages:
+        try:
+            data = json.loads(body)
+            notifications.append(schemas.NotificationCreate(
+                user_id=data.get('user_id'),
+                message=data.get('message')
+            ))
+        except Exception as e:
+            print(f"Dropping invalid notification message: {e}")
+
+    db = SessionLocal()
+    try:
+        db_notifications = crud.create_notifications_bulk(db, notifications)
+        announce_notifications(db_notifications)
+        print(f"Created {len(notifications)} notifications from batch of {len(messages)} messages")
+    finally:
+        db.close()
+
 def start_rabbitmq_consumer():
     """Start consuming messages from RabbitMQ in a separate thread"""
     try:
         rabbitmq_consumer.setup_queue('notifications', 'transaction.completed')
-        rabbitmq_consumer.start_consuming('notifications', process_notification_message)
+        if NOTIFICATION_CONSUMER_MODE == "batch":
+            rabbitmq_consumer.consume_batches(
+                'notifications',
+                process_notification_batch,
+                batch_size=NOTIFICATION_BATCH_SIZE,
+                flush_interval=NOTIFICATION_FLUSH_INTERVAL_MS / 1000
+            )
+        else:
+            rabbitmq_consumer.start_consuming('notifications', process_notification_message)
     except Exception as e:
         print(f"Error in RabbitMQ consumer: {e}")
 
-# Start RabbitMQ consumer in background thread
-consumer_thread = threading.Thread(target=start_rabbitmq_consumer, daemon=True)
-consumer_thread.start()
-
 # CRUD Endpoints
 @app.post("/notifications", response_model=schemas.NotificationResponse)
 def create_notification(notification: schemas.NotificationCreate, db: Session = Depends(get_db)):
     try:
         db_notification = crud.create_notification(db, notification)
+        announce_notifications([db_notification])
         return db_notification
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create notification: {str(e)}")
 
 @app.get("/notifications", response_model=list[schemas.NotificationResponse])
-def read_notifications(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+async def read_notifications(response: Response, skip: int = 0, limit: int = 100, after_id: Optional[int] = None, cursor: Optional[str] = None):
     try:
         if skip < 0:
             raise HTTPException(status_code=400, detail="Skip parameter must be non-negative")
         if limit <= 0 or limit > 1000:
             raise HTTPException(status_code=400, detail="Limit must be between 1 and 1000")
         
-        return crud.get_notifications(db, skip=skip, limit=limit)
+        notifications = await fetch_all(crud.select_notifications(skip=skip, limit=limit, after_id=resolve_after_id(after_id, cursor)))
+        set_next_cursor(response, notifications, limit)
+        return notifications
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve notifications: {str(e)}")
 
+@app.get("/users/{user_id}/notifications", response_model=list[schemas.NotificationResponse])
+async def read_user_notifications(response: Response, user_id: int, unread_only: bool = False, limit: int = 100, cursor: Optional[str] = None):
+    try:
+        if user_id <= 0:
+            raise HTTPException(status_code=400, detail="User ID must be a positive integer")
+        if limit <= 0 or limit > 1000:
+            raise HTTPException(status_code=400, detail="Limit must be between 1 and 1000")
+
+        before = decode_history_cursor(cursor) if cursor else None
+        notifications = await fetch_all(crud.select_user_notifications(user_id, unread_only=unread_only, before=before, limit=limit))
+        if len(notifications) == limit:
+            last = notifications[-1]
+            response.headers[NEXT_CURSOR_HEADER] = encode_history_cursor(last.timestamp, last.id)
+        return notifications
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve notifications: {str(e)}")
+
+async def notification_stream(request: Request, user_id: int, last_event_id: Optional[int]):
+    subscriber = notification_hub.subscribe(user_id)
+    try:
+        yield f"retry: {int(NOTIFICATION_PUSH_HEARTBEAT * 1000)}\n\n"
+        # Subscribe first, then replay what a reconnecting client missed, so
+        # nothing committed in between is lost; duplicates are skipped by id
+        if last_event_id is not None:
+            def load_missed():
+                db = SessionLocal()
+                try:
+                    return crud.get_user_notifications_after(db, user_id, last_event_id, limit=1000)
+                finally:
+                    db.close()
+            for notification in await run_in_threadpool(load_missed):
+                last_event_id = notification.id
+                yield format_sse(notification_payload(notification))
+        while not await request.is_disconnected():
+            try:
+                payload = await asyncio.wait_for(subscriber.get(), timeout=NOTIFICATION_PUSH_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if last_event_id is not None and payload['id'] <= last_event_id:
+                continue
+            yield format_sse(payload)
+    finally:
+        notification_hub.unsubscribe(user_id, subscriber)
+
+@app.get("/users/{user_id}/notifications/stream")
+async def stream_user_notifications(request: Request, user_id: int, last_event_id: Optional[int] = None):
+    """Server-Sent Events stream of a user's new notifications.
+
+    Clients send last_event_id (e.g. the newest id of the inbox page they
+    loaded) or, when reconnecting, the Last-Event-ID header, and first
+    receive whatever was stored after that id. The header wins: EventSource
+    keeps it current while the query string stays as first opened.
+    """
+    if user_id <= 0:
+        raise HTTPException(status_code=400, detail="User ID must be a positive integer")
+    header_event_id = request.headers.get("last-event-id")
+    if header_event_id:
+        if not header_event_id.isdigit():
+            raise HTTPException(status_code=400, detail="Last-Event-ID must be a notification id")
+        last_event_id = int(header_event_id)
+
+    return StreamingResponse(
+        notification_stream(request, user_id, last_event_id),
+        media_type="text/event-stream",
+        # Stop nginx and other proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/users/{user_id}/notifications/unread-count", response_model=schemas.UnreadCountResponse)
+async def read_unread_count(user_id: int):
+    try:
+        if user_id <= 0:
+            raise HTTPException(status_code=400, detail="User ID must be a positive integer")
+        unread_count = await fetch_first(crud.select_unread_count(user_id))
+        return {"user_id": user_id, "unread_count": unread_count or 0}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve unread count: {str(e)}")
+
+@app.post("/users/{user_id}/notifications/read", response_model=schemas.NotificationMarkReadResponse)
+def mark_notifications_read(user_id: int, mark_read: schemas.NotificationMarkRead, db: Session = Depends(get_db)):
+    try:
+        if user_id <= 0:
+            raise HTTPException(status_code=400, detail="User ID must be a positive integer")
+        if mark_read.notification_ids is not None and len(mark_read.notification_ids) > 1000:
+            raise HTTPException(status_code=400, detail="Cannot mark more than 1000 notifications at once")
+
+        marked = crud.mark_notifications_read(db, user_id, mark_read.notification_ids)
+        return {"user_id": user_id, "marked_read": marked, "unread_count": crud.get_unread_count(db, user_id)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to mark notifications as read: {str(e)}")
+
 @app.get("/notifications/{notification_id}", response_model=schemas.NotificationResponse)
-def read_notification(notification_id: int, db: Session = Depends(get_db)):
+async def read_notification(notification_id: int):
     try:
         if notification_id <= 0:
             raise HTTPException(status_code=400, detail="Notification ID must be a positive integer")
         
-        db_notification = crud.get_notification(db, notification_id)
+        db_notification = await fetch_first(crud.select_notification(notification_id))
         if db_notification is None:
             raise HTTPException(status_code=404, detail="Notification not found")
         return db_notification
@@ -131,6 +344,11 @@ def delete_notification(notification_id: int, db: Session = Depends(get_db)):
 
 # Graceful shutdown
 @app.on_event("shutdown")
-def shutdown_event():
+async def shutdown_event():
     rabbitmq_consumer.stop_consuming()
-    rabbitmq_consumer.close()
\ No newline at end of file
+    rabbitmq_consumer.close()
+    push_consumer.stop_consuming()
+    push_consumer.close()
+    rabbitmq_publisher.close()
+    await dispose_async_engine()
+    shutdown_tracing()
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Index, false, text
 from datetime import datetime
 from .database import Base
 
@@ -8,3 +8,20 @@ class Notification(Base):
     user_id = Column(Integer)
     message = Column(String)
     timestamp = Column(DateTime, default=datetime.utcnow)
+    is_read = Column(Boolean, nullable=False, default=False, server_default=false())
+    read_at = Column(DateTime, nullable=True)
+
+    # Per-user inbox, newest first; the partial index covers unread-only views
+    __table_args__ = (
+        Index("ix_notifications_user_id_timestamp", "user_id", "timestamp"),
+        Index(
+            "ix_notifications_user_id_unread", "user_id", "timestamp",
+            postgresql_where=text("NOT is_read"), sqlite_where=text("NOT is_read")
+        ),
+    )
+
+class NotificationUnreadCount(Base):
+    """Unread notifications per user, kept in step with every insert and read"""
+    __tablename__ = "notification_unread_counts"
+    user_id = Column(Integer, primary_key=True)
+    unread_count = Column(Integer, nullable=False, default=0, server_default="0")
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, validator
 from datetime import datetime
+from typing import Optional
 
 class NotificationCreate(BaseModel):
     user_id: int
@@ -22,6 +23,20 @@ class NotificationResponse(BaseModel):
     user_id: int
     message: str
     timestamp: datetime
+    is_read: bool = False
+    read_at: Optional[datetime] = None
 
     class Config:
         orm_mode = True
+
+class NotificationMarkRead(BaseModel):
+    notification_ids: Optional[list[int]] = None  # omit to mark every unread notification
+
+class NotificationMarkReadResponse(BaseModel):
+    user_id: int
+    marked_read: int
+    unread_count: int
+
+class UnreadCountResponse(BaseModel):
+    user_id: int
+    unread_count: int
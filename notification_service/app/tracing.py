@@ -0,0 +1,59 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# "otlp" sends spans to the collector at OTEL_EXPORTER_OTLP_ENDPOINT, "file"
+# appends them as JSON lines to TRACING_FILE_PATH, "none" leaves tracing off
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none")
+TRACING_FILE_PATH = os.getenv("TRACING_FILE_PATH", "/tmp/notification-service-traces.jsonl")
+
+SERVICE_NAME = "notification-service"
+
+_provider = None
+
+def _span_exporter():
+    if TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    if TRACING_EXPORTER == "file":
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+        return ConsoleSpanExporter(
+            out=open(TRACING_FILE_PATH, "a"),
+            formatter=lambda span: span.to_json(indent=None) + "\n"
+        )
+    if TRACING_EXPORTER != "none":
+        logger.warning(f"Unknown TRACING_EXPORTER {TRACING_EXPORTER!r}; tracing is off")
+    return None
+
+def setup_tracing(app, engines=()):
+    """Trace incoming requests and every DB query.
+
+    Message handling spans come from rabbitmq_utils and continue the trace
+    of the request that published the event.
+
+    The SDK and instrumentations are only imported when an exporter is
+    configured; without one the OpenTelemetry API stays a no-op.
+    """
+    global _provider
+    exporter = _span_exporter()
+    if exporter is None:
+        return
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+    from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+
+    _provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(_provider)
+
+    FastAPIInstrumentor.instrument_app(app, excluded_urls="/metrics,/ready")
+    SQLAlchemyInstrumentor().instrument(engines=list(engines))
+
+def shutdown_tracing():
+    """Flush spans still buffered by the batch processor"""
+    if _provider is not None:
+        _provider.shutdown()
@@ -0,0 +1,32 @@
+"""create notifications table
+
+Revision ID: 0001
+Revises:
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases bootstrapped by the old import-time create_all already have
+    # this table; adopt it as-is instead of failing
+    if sa.inspect(op.get_bind()).has_table('notifications'):
+        return
+    op.create_table(
+        'notifications',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer()),
+        sa.Column('message', sa.String()),
+        sa.Column('timestamp', sa.DateTime())
+    )
+    op.create_index('ix_notifications_id', 'notifications', ['id'])
+
+
+def downgrade():
+    op.drop_index('ix_notifications_id', table_name='notifications')
+    op.drop_table('notifications')
@@ -0,0 +1,42 @@
+"""add read state, inbox indexes and unread counters
+
+Revision ID: 0002
+Revises: 0001
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notifications') as batch_op:
+        batch_op.add_column(sa.Column('is_read', sa.Boolean(), nullable=False, server_default=sa.false()))
+        batch_op.add_column(sa.Column('read_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_notifications_user_id_timestamp', 'notifications', ['user_id', 'timestamp'])
+    op.create_index(
+        'ix_notifications_user_id_unread', 'notifications', ['user_id', 'timestamp'],
+        postgresql_where=sa.text('NOT is_read'), sqlite_where=sa.text('NOT is_read')
+    )
+    op.create_table(
+        'notification_unread_counts',
+        sa.Column('user_id', sa.Integer(), primary_key=True),
+        sa.Column('unread_count', sa.Integer(), nullable=False, server_default='0')
+    )
+    # Seed counters for notifications that already exist
+    op.execute(
+        "INSERT INTO notification_unread_counts (user_id, unread_count) "
+        "SELECT user_id, COUNT(*) FROM notifications WHERE user_id IS NOT NULL GROUP BY user_id"
+    )
+
+
+def downgrade():
+    op.drop_table('notification_unread_counts')
+    op.drop_index('ix_notifications_user_id_unread', table_name='notifications')
+    op.drop_index('ix_notifications_user_id_timestamp', table_name='notifications')
+    with op.batch_alter_table('notifications') as batch_op:
+        batch_op.drop_column('read_at')
+        batch_op.drop_column('is_read')
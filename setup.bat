@@ -40,9 +40,9 @@ echo    cd notification_service ^&^& pip install -r requirements.txt
 echo.
 echo 2. Start the microservices:
 echo    cd user_service ^&^& python -m uvicorn app.main:app --host 0.0.0.0 --port 8001 --reload
-echo    cd account_service ^&^& python -m uvicorn app.main:app --host 0.0.0.0 --port 8002 --reload
-echo    cd transaction_service ^&^& python -m uvicorn app.main:app --host 0.0.0.0 --port 8003 --reload
-echo    cd notification_service ^&^& python -m uvicorn app.main:app --host 0.0.0.0 --port 8004 --reload
+echo    cd account_service ^&^& alembic upgrade head ^&^& python -m uvicorn app.main:app --host 0.0.0.0 --port 8002 --reload
+echo    cd transaction_service ^&^& alembic upgrade head ^&^& python -m uvicorn app.main:app --host 0.0.0.0 --port 8003 --reload
+echo    cd notification_service ^&^& alembic upgrade head ^&^& python -m uvicorn app.main:app --host 0.0.0.0 --port 8004 --reload
 echo.
 echo 3. Start the frontend:
 echo    cd frontend ^&^& npm start
@@ -0,0 +1,72 @@
+"""A batch cut short by an Account Service failure records what it applied,
+and a retry with the same Idempotency-Key finishes it without applying or
+recording any item twice.
+
+Runs against the in-process stack from benchmarks (SQLite, in-memory broker):
+
+    python -m pytest tests
+"""
+import asyncio
+from decimal import Decimal
+
+from fastapi import HTTPException
+
+from benchmarks.stack import Stack
+
+
+async def run_interrupted_batch_and_retry():
+    stack = Stack().load()
+    await stack.start()
+    transaction_main = stack["transaction_service"].modules["app.main"]
+    call_account_service = transaction_main.call_account_service
+    failing = {"batch_adjust": True}
+
+    async def lose_batch_adjust_replies(method, path, payload, operation, idempotency_key=None, idempotent=False):
+        response = await call_account_service(method, path, payload, operation, idempotency_key, idempotent)
+        if operation == "batch_adjust" and failing["batch_adjust"]:
+            # Applied by Account Service, but the reply never arrives
+            raise HTTPException(status_code=500, detail="Cannot connect to Account Service: reply lost")
+        return response
+
+    transaction_main.call_account_service = lose_batch_adjust_replies
+    try:
+        async with stack["user_service"].client() as users, \
+                stack["account_service"].client() as accounts, \
+                stack["transaction_service"].client() as transactions:
+            response = await users.post("/users", json={"name": "Retry User", "email": "retry@example.com", "phone": "5550002222"})
+            user_id = response.json()["id"]
+            source = (await accounts.post("/accounts", json={"user_id": user_id, "account_type": "checking", "balance": 100})).json()["id"]
+            target = (await accounts.post("/accounts", json={"user_id": user_id, "account_type": "savings", "balance": 0})).json()["id"]
+
+            body = [
+                {"account_id": source, "type": "transfer", "amount": 40, "target_account_id": target},
+                {"account_id": source, "type": "deposit", "amount": 1},
+                {"account_id": target, "type": "transfer", "amount": 5, "target_account_id": source},
+            ]
+            headers = {"Idempotency-Key": "batch-retry-test"}
+            first = (await transactions.post("/transactions/batch", json=body, headers=headers)).json()
+            recorded_after_first = len((await transactions.get("/transactions")).json())
+
+            failing["batch_adjust"] = False
+            retry = (await transactions.post("/transactions/batch", json=body, headers=headers)).json()
+            balances = [
+                (await accounts.get(f"/accounts/{account_id}")).json()["balance"] for account_id in (source, target)
+            ]
+            recorded = (await transactions.get("/transactions")).json()
+        return first, recorded_after_first, retry, balances, recorded
+    finally:
+        transaction_main.call_account_service = call_account_service
+        await stack.stop()
+
+
+def test_retried_batch_applies_and_records_every_item_once():
+    first, recorded_after_first, retry, balances, recorded = asyncio.run(run_interrupted_batch_and_retry())
+
+    # The transfer is recorded, the lost deposit is unknown and the rest never sent
+    assert [result["status"] for result in first["results"]] == ["completed", "unknown", "failed"]
+    assert recorded_after_first == 1
+
+    assert [result["status"] for result in retry["results"]] == ["completed", "completed", "completed"]
+    assert retry["results"][0]["transaction"]["id"] == first["results"][0]["transaction"]["id"]
+    assert [Decimal(str(balance)) for balance in balances] == [Decimal("66"), Decimal("35")]
+    assert sorted(transaction["type"] for transaction in recorded) == ["deposit", "transfer", "transfer"]
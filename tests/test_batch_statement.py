@@ -0,0 +1,69 @@
+"""A mixed transaction batch must show up the same in the account statement
+and in the service-wide transaction stats: one ledger entry per applied item.
+
+Runs against the in-process stack from benchmarks (SQLite, in-memory broker):
+
+    python -m pytest tests
+"""
+import asyncio
+from decimal import Decimal
+
+from benchmarks.stack import Stack
+
+# Statement entry types that come from each transaction type
+ENTRY_TYPES = {"deposit": "deposit", "withdraw": "withdraw", "transfer": "transfer_out"}
+
+
+async def run_batch_and_read_totals():
+    stack = Stack().load()
+    await stack.start()
+    try:
+        async with stack["user_service"].client() as users, \
+                stack["account_service"].client() as accounts, \
+                stack["transaction_service"].client() as transactions:
+            response = await users.post("/users", json={"name": "Batch User", "email": "batch@example.com", "phone": "5550001111"})
+            user_id = response.json()["id"]
+            source = (await accounts.post("/accounts", json={"user_id": user_id, "account_type": "checking", "balance": 0})).json()["id"]
+            target = (await accounts.post("/accounts", json={"user_id": user_id, "account_type": "savings", "balance": 0})).json()["id"]
+
+            response = await transactions.post("/transactions/batch", json=[
+                {"account_id": source, "type": "withdraw", "amount": 60},
+                {"account_id": source, "type": "deposit", "amount": 50},
+                {"account_id": source, "type": "withdraw", "amount": 30},
+                {"account_id": source, "type": "withdraw", "amount": 20},
+                {"account_id": source, "type": "deposit", "amount": 40},
+                {"account_id": source, "type": "transfer", "amount": 15, "target_account_id": target},
+                {"account_id": source, "type": "withdraw", "amount": 100},
+            ])
+            batch = response.json()
+            statement = (await accounts.get(f"/accounts/{source}/statement")).json()
+            stats = (await transactions.get("/transactions/stats")).json()
+            balance = (await accounts.get(f"/accounts/{source}")).json()["balance"]
+        return batch, statement, stats, balance
+    finally:
+        await stack.stop()
+
+
+def test_mixed_batch_statement_matches_transaction_stats():
+    batch, statement, stats, balance = asyncio.run(run_batch_and_read_totals())
+
+    # Only the overdrafts fail, each reporting its own amount
+    assert [result["status"] for result in batch["results"]] == [
+        "failed", "completed", "completed", "completed", "completed", "completed", "failed"
+    ]
+    assert "Requested: $60.00" in batch["results"][0]["error"]
+    assert "Requested: $100.00" in batch["results"][6]["error"]
+
+    statement_by_type = {row["entry_type"]: row for row in statement["by_type"]}
+    stats_by_type = {row["type"]: row for row in stats["by_type"]}
+    assert set(statement_by_type) == {ENTRY_TYPES[transaction_type] for transaction_type in stats_by_type}
+    for transaction_type, totals in stats_by_type.items():
+        entries = statement_by_type[ENTRY_TYPES[transaction_type]]
+        assert entries["count"] == totals["count"]
+        assert abs(Decimal(str(entries["total"]))) == Decimal(str(totals["total"]))
+    assert statement["count"] == stats["count"] == 5
+    assert stats_by_type["deposit"]["count"] == 2
+    assert stats_by_type["withdraw"]["count"] == 2
+
+    assert Decimal(str(statement["closing_balance"])) == Decimal(str(balance)) == Decimal("25")
+    assert Decimal(str(statement["opening_balance"])) == 0
@@ -0,0 +1,65 @@
+from collections import OrderedDict
+from prometheus_client import Counter, Gauge
+import os
+import threading
+import time
+
+# Negative cache: only "account does not exist" is remembered, so requests for
+# missing accounts fail without a round trip. Transaction Service no longer
+# reads accounts before changing them (Account Service validates them in the
+# same call that applies the change), so there is no account metadata left
+# to cache; hits and misses count only lookups of known-missing ids.
+ACCOUNT_CACHE_MAX_SIZE = int(os.getenv("ACCOUNT_CACHE_MAX_SIZE", "10000"))
+# Entries expire quickly: an id looked up before its account was created is
+# cleared by the account.created event, but this worker may miss that event
+# (e.g. while its consumer reconnects)
+ACCOUNT_CACHE_NEGATIVE_TTL = float(os.getenv("ACCOUNT_CACHE_NEGATIVE_TTL", "5"))
+
+CACHE_HITS = Counter("account_cache_hits_total", "Lookups answered by a known-missing account entry")
+CACHE_MISSES = Counter("account_cache_misses_total", "Lookups with no known-missing account entry")
+CACHE_EVICTIONS = Counter("account_cache_evictions_total", "Known-missing account entries evicted by the LRU")
+CACHE_INVALIDATIONS = Counter("account_cache_invalidations_total", "Known-missing account entries invalidated", ["reason"])
+CACHE_SIZE = Gauge("account_cache_size", "Known-missing account entries")
+
+class AccountCache:
+    """Thread-safe TTL + LRU set of account ids known not to exist"""
+
+    def __init__(self, max_size: int = ACCOUNT_CACHE_MAX_SIZE, ttl: float = ACCOUNT_CACHE_NEGATIVE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # account_id -> expires_at
+        self._lock = threading.Lock()
+
+    def is_missing(self, account_id: int) -> bool:
+        """Whether account_id was recently found not to exist"""
+        with self._lock:
+            expires_at = self._entries.get(account_id)
+            if expires_at is None or expires_at < time.monotonic():
+                if expires_at is not None:
+                    del self._entries[account_id]
+                    CACHE_SIZE.set(len(self._entries))
+                CACHE_MISSES.inc()
+                return False
+            self._entries.move_to_end(account_id)
+            CACHE_HITS.inc()
+            return True
+
+    def mark_missing(self, account_id: int):
+        with self._lock:
+            self._entries[account_id] = time.monotonic() + self.ttl
+            self._entries.move_to_end(account_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                CACHE_EVICTIONS.inc()
+            CACHE_SIZE.set(len(self._entries))
+
+    def invalidate(self, account_id: int, reason: str = "event"):
+        with self._lock:
+            if self._entries.pop(account_id, None) is not None:
+                CACHE_INVALIDATIONS.labels(reason=reason).inc()
+                CACHE_SIZE.set(len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            CACHE_SIZE.set(0)
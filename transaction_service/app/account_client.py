@@ -0,0 +1,102 @@
+import asyncio
+import httpx
+import os
+import time
+from typing import Optional
+from . import resilience
+
+# Account Service connection settings
+ACCOUNT_SERVICE_URL = os.getenv("ACCOUNT_SERVICE_URL", "http://account-service:8002")
+ACCOUNT_SERVICE_TIMEOUT = float(os.getenv("ACCOUNT_SERVICE_TIMEOUT", "5"))
+
+# Connection pool limits for the shared keep-alive client
+ACCOUNT_SERVICE_MAX_CONNECTIONS = int(os.getenv("ACCOUNT_SERVICE_MAX_CONNECTIONS", "100"))
+ACCOUNT_SERVICE_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("ACCOUNT_SERVICE_MAX_KEEPALIVE_CONNECTIONS", "20"))
+ACCOUNT_SERVICE_KEEPALIVE_EXPIRY = float(os.getenv("ACCOUNT_SERVICE_KEEPALIVE_EXPIRY", "30"))
+
+# Responses to an idempotent call that are worth sending again
+RETRYABLE_STATUSES = {502, 503, 504}
+
+_client: Optional[httpx.AsyncClient] = None
+
+# Circuit breaker, retry budget and adaptive timeout for Account Service
+account_service = resilience.Dependency("account_service", ACCOUNT_SERVICE_TIMEOUT)
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared Account Service client, creating it on first use"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=ACCOUNT_SERVICE_URL,
+            timeout=ACCOUNT_SERVICE_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=ACCOUNT_SERVICE_MAX_CONNECTIONS,
+                max_keepalive_connections=ACCOUNT_SERVICE_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=ACCOUNT_SERVICE_KEEPALIVE_EXPIRY
+            )
+        )
+    return _client
+
+async def close_client():
+    """Close the shared client and release pooled connections"""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+def _request_timeout(timeout: float, idempotent: bool) -> httpx.Timeout:
+    if idempotent:
+        return httpx.Timeout(timeout)
+    # A balance change that timed out after it was sent may still have been
+    # applied, so only the wait for a connection follows the adaptive timeout
+    return httpx.Timeout(ACCOUNT_SERVICE_TIMEOUT, connect=timeout, pool=timeout)
+
+def _retryable(error: httpx.TransportError, idempotent: bool) -> bool:
+    # Connection failures happen before the request reaches Account Service,
+    # so resending is safe even for balance changes
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    return idempotent
+
+async def _send(method: str, path: str, payload: Optional[dict], timeout: float, idempotent: bool,
+                headers: Optional[dict] = None) -> httpx.Response:
+    """Send with retries while the retry budget allows"""
+    for attempt in range(1, resilience.RETRY_MAX_ATTEMPTS + 1):
+        last = attempt == resilience.RETRY_MAX_ATTEMPTS
+        try:
+            response = await get_client().request(method, path, json=payload, headers=headers,
+                                                  timeout=_request_timeout(timeout, idempotent))
+        except httpx.TransportError as e:
+            if last or not _retryable(e, idempotent) or not account_service.try_retry():
+                raise
+        else:
+            if last or not idempotent or response.status_code not in RETRYABLE_STATUSES or not account_service.try_retry():
+                return response
+        await asyncio.sleep(account_service.retry_delay(attempt))
+
+async def request(method: str, path: str, payload: Optional[dict] = None,
+                  idempotency_key: Optional[str] = None, idempotent: bool = False) -> httpx.Response:
+    """Call Account Service through its circuit breaker, retry budget and adaptive timeout.
+
+    A balance change sent with an idempotency_key, or marked idempotent
+    because every item of its payload carries an operation key, is applied
+    at most once by Account Service, so it is retried. Raises
+    resilience.CircuitOpenError without calling while the circuit is open.
+    5xx responses, transport errors and calls slower than the adaptive
+    timeout count as failures towards opening it.
+    """
+    account_service.acquire()
+    timeout = account_service.timeout()
+    started = time.perf_counter()
+    try:
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        response = await _send(method, path, payload, timeout, idempotent or idempotency_key is not None, headers)
+    except BaseException:
+        account_service.record_failure()
+        raise
+    elapsed = time.perf_counter() - started
+    if response.status_code >= 500 or elapsed > timeout:
+        account_service.record_failure()
+    else:
+        account_service.record_success(elapsed)
+    return response
@@ -1,16 +1,190 @@
+from sqlalchemy import insert, select, func, or_, and_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+import heapq
+import json
+import os
+import uuid
 from . import models, schemas
+from .money import ZERO
+from .tracing import current_trace_headers
 
-def get_transaction(db: Session, transaction_id: int):
-    return db.query(models.Transaction).filter(models.Transaction.id == transaction_id).first()
+# Rows each (day, type) daily total is spread over; more shards mean less
+# contention between concurrent inserts and more rows for stats to add up
+TRANSACTION_STATS_SHARDS = int(os.getenv("TRANSACTION_STATS_SHARDS", "16"))
+
+def select_transaction(transaction_id: int):
+    return select(models.Transaction).where(models.Transaction.id == transaction_id)
 
-def get_transactions(db: Session, account_id: int = None, skip: int = 0, limit: int = 100):
-    query = db.query(models.Transaction)
+def select_transactions(account_id: int = None, skip: int = 0, limit: int = 100, after_id: int = None):
+    # Keyset pagination over the primary key; skip is only a legacy fallback
+    stmt = select(models.Transaction).order_by(models.Transaction.id).limit(limit)
     if account_id:
-        query = query.filter(models.Transaction.account_id == account_id)
-    return query.offset(skip).limit(limit).all()
+        stmt = stmt.where(models.Transaction.account_id == account_id)
+    if after_id is not None:
+        return stmt.where(models.Transaction.id > after_id)
+    return stmt.offset(skip)
+
+def get_transaction(db: Session, transaction_id: int):
+    return db.scalars(select_transaction(transaction_id)).first()
+
+def get_transactions(db: Session, account_id: int = None, skip: int = 0, limit: int = 100, after_id: int = None):
+    return db.scalars(select_transactions(account_id, skip, limit, after_id)).all()
+
+def _history_filters(account_column, account_id: int, transaction_type: str = None, start=None, end=None):
+    filters = [account_column == account_id]
+    if transaction_type:
+        filters.append(models.Transaction.type == transaction_type)
+    if start:
+        filters.append(models.Transaction.timestamp >= start)
+    if end:
+        filters.append(models.Transaction.timestamp < end)
+    return filters
+
+def _history_statement(account_column, account_id: int, transaction_type: str = None,
+                       start=None, end=None, before=None, limit: int = 100):
+    # One side of the history, ordered to match its (account, timestamp) index
+    stmt = select(models.Transaction).where(*_history_filters(account_column, account_id, transaction_type, start, end))
+    if before:
+        before_timestamp, before_id = before
+        stmt = stmt.where(or_(
+            models.Transaction.timestamp < before_timestamp,
+            and_(models.Transaction.timestamp == before_timestamp, models.Transaction.id < before_id)
+        ))
+    return stmt.order_by(models.Transaction.timestamp.desc(), models.Transaction.id.desc()).limit(limit)
+
+def select_transaction_history(account_id: int, direction: str = "all", transaction_type: str = None,
+                               start=None, end=None, before=None, limit: int = 100):
+    """One index-ordered statement per side of the history requested by direction"""
+    statements = []
+    if direction in ("all", "outgoing"):
+        statements.append(_history_statement(models.Transaction.account_id, account_id, transaction_type, start, end, before, limit))
+    if direction in ("all", "incoming"):
+        statements.append(_history_statement(models.Transaction.target_account_id, account_id, transaction_type, start, end, before, limit))
+    return statements
+
+def merge_transaction_history(sides: list, limit: int = 100):
+    merged = heapq.merge(*sides, key=lambda t: (t.timestamp, t.id), reverse=True)
+    return list(merged)[:limit]
+
+def get_transaction_history(db: Session, account_id: int, direction: str = "all", transaction_type: str = None,
+                            start=None, end=None, before=None, limit: int = 100):
+    """Transactions touching an account, newest first.
+
+    direction selects outgoing (account is the source), incoming (account is
+    the transfer target) or all. "all" runs one index-ordered query per side
+    and merges them instead of an OR that cannot use either index for order.
+    """
+    statements = select_transaction_history(account_id, direction, transaction_type, start, end, before, limit)
+    return merge_transaction_history([db.scalars(stmt).all() for stmt in statements], limit)
 
-def create_transaction(db: Session, transaction: schemas.TransactionCreate):
+def stream_transaction_history(db: Session, account_id: int, direction: str = "all", transaction_type: str = None,
+                               start=None, end=None, batch_size: int = 1000):
+    """Yield every transaction touching an account, oldest first, as plain rows.
+
+    Each side is read through a server-side cursor (yield_per) and the two
+    ordered streams are merged lazily, so memory stays bounded by batch_size
+    regardless of how many rows the account has.
+    """
+    sides = []
+    for side, account_column in (("outgoing", models.Transaction.account_id), ("incoming", models.Transaction.target_account_id)):
+        if direction in ("all", side):
+            stmt = (
+                select(*models.Transaction.__table__.c)
+                .where(*_history_filters(account_column, account_id, transaction_type, start, end))
+                .order_by(models.Transaction.timestamp, models.Transaction.id)
+                .execution_options(yield_per=batch_size)
+            )
+            sides.append(db.execute(stmt))
+    yield from heapq.merge(*sides, key=lambda t: (t.timestamp, t.id))
+
+def _add_to_daily_totals(db: Session, transactions, sign: int = 1):
+    """Fold transactions into transaction_daily_totals (sign=-1 takes them out).
+
+    Runs inside the caller's DB transaction, so the totals always match the
+    committed rows. Rows are upserted in key order so concurrent writers lock
+    them in the same order.
+    """
+    totals = {}
+    for t in transactions:
+        key = (t.timestamp.date(), t.type, t.account_id % TRANSACTION_STATS_SHARDS)
+        count, amount = totals.get(key, (0, ZERO))
+        totals[key] = (count + sign, amount + sign * t.amount)
+    if not totals:
+        return
+    rows = [
+        {"day": day, "type": transaction_type, "shard": shard, "transaction_count": count, "total_amount": amount}
+        for (day, transaction_type, shard), (count, amount) in sorted(totals.items())
+    ]
+    table = models.TransactionDailyTotal
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        upsert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = upsert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["day", "type", "shard"],
+            set_={
+                "transaction_count": table.transaction_count + stmt.excluded.transaction_count,
+                "total_amount": table.total_amount + stmt.excluded.total_amount
+            }
+        )
+        db.execute(stmt)
+        return
+    for row in rows:
+        updated = (
+            db.query(table)
+            .filter(table.day == row["day"], table.type == row["type"], table.shard == row["shard"])
+            .update({
+                table.transaction_count: table.transaction_count + row["transaction_count"],
+                table.total_amount: table.total_amount + row["total_amount"]
+            }, synchronize_session=False)
+        )
+        if not updated:
+            db.add(table(**row))
+
+def select_daily_totals(start_day, end_day, transaction_type: str = None):
+    """Per-day, per-type count and sum between two UTC days (inclusive), read from the rollup"""
+    table = models.TransactionDailyTotal
+    stmt = (
+        select(
+            table.day,
+            table.type,
+            func.sum(table.transaction_count).label("count"),
+            func.sum(table.total_amount).label("total")
+        )
+        .where(table.day >= start_day, table.day <= end_day)
+        .group_by(table.day, table.type)
+        .having(func.sum(table.transaction_count) > 0)
+        .order_by(table.day, table.type)
+    )
+    if transaction_type:
+        stmt = stmt.where(table.type == transaction_type)
+    return stmt
+
+def _outbox_rows(transaction_id: int, events: list):
+    # Events describe the transaction they were written with, so they carry its
+    # id, and the trace of the request, so consumers join that trace
+    headers = current_trace_headers()
+    return [
+        {
+            "routing_key": routing_key,
+            "payload": json.dumps({**payload, "transaction_id": transaction_id}),
+            "headers": json.dumps(headers) if headers else None
+        }
+        for routing_key, payload in events
+    ]
+
+def create_transaction(db: Session, transaction: schemas.TransactionCreate, events: list = (),
+                       idempotency_key: str = None, owner: str = None):
+    """Insert a transaction and its outbox events (routing_key, payload) in one commit.
+
+    If an idempotency key is given, its stored response is completed in the
+    same commit, so a retry can never miss a transaction that was recorded.
+    Returns None, recording nothing, if owner no longer holds the key because
+    a retry took it over; that retry records the transaction instead.
+    """
     db_transaction = models.Transaction(
         account_id=transaction.account_id,
         type=transaction.type,
@@ -18,11 +192,209 @@ def create_transaction(db: Session, transaction: schemas.TransactionCreate):
         target_account_id=transaction.target_account_id
     )
     db.add(db_transaction)
+    db.flush()
+    _add_to_daily_totals(db, [db_transaction])
+    if events:
+        db.execute(insert(models.OutboxEvent), _outbox_rows(db_transaction.id, events))
+    if idempotency_key:
+        response = schemas.TransactionResponse(**{
+            column.name: getattr(db_transaction, column.name) for column in models.Transaction.__table__.c
+        })
+        if not _complete_idempotency_key(db, idempotency_key, owner, 200, response.json()):
+            db.rollback()
+            return None
     db.commit()
     db.refresh(db_transaction)
     return db_transaction
+
+def create_transactions_bulk(db: Session, transactions: list, events: list = None, operation_keys: list = None):
+    """Insert many transactions with a single multi-row INSERT and one commit.
+
+    events, if given, holds one list of outbox events per transaction; they are
+    bulk-inserted in the same commit. operation_keys, if given, holds the key
+    each transaction's balance change was sent to Account Service with; a
+    transaction already recorded under its key is returned as it is instead
+    of being inserted (and its events written) again.
+    """
+    if not transactions:
+        return []
+    keys = operation_keys or [None] * len(transactions)
+    try:
+        recorded = {}
+        if operation_keys:
+            recorded = {
+                row.operation_key: row
+                for row in db.execute(
+                    select(*models.Transaction.__table__.c).where(models.Transaction.operation_key.in_(operation_keys))
+                ).all()
+            }
+        new = [index for index, key in enumerate(keys) if key not in recorded]
+        rows = [
+            {
+                "account_id": transactions[index].account_id,
+                "type": transactions[index].type,
+                "amount": transactions[index].amount,
+                "target_account_id": transactions[index].target_account_id,
+                "operation_key": keys[index]
+            }
+            for index in new
+        ]
+        # Return plain rows rather than ORM instances so nothing is expired (and
+        # lazily re-fetched row by row) after the commit
+        inserted = []
+        if rows:
+            inserted = db.execute(
+                insert(models.Transaction).returning(*models.Transaction.__table__.c, sort_by_parameter_order=True),
+                rows
+            ).all()
+            _add_to_daily_totals(db, inserted)
+        if events:
+            outbox_rows = []
+            for index, db_transaction in zip(new, inserted):
+                outbox_rows.extend(_outbox_rows(db_transaction.id, events[index]))
+            if outbox_rows:
+                db.execute(insert(models.OutboxEvent), outbox_rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    db_transactions = [recorded.get(key) for key in keys]
+    for index, db_transaction in zip(new, inserted):
+        db_transactions[index] = db_transaction
+    return db_transactions
+
+def _held_by(owner: str):
+    if owner is None:
+        return models.IdempotencyKey.owner.is_(None)
+    return models.IdempotencyKey.owner == owner
+
+def claim_idempotency_key(db: Session, key: str, request_hash: str, owner: str, ttl: float, lease: float):
+    """Reserve an idempotency key for the request identified by owner.
+
+    Returns (None, operation_id) when owner now holds the key, otherwise
+    (record, None) with the live record another request holds (pending or
+    completed). A pending key is only taken over once its lease ran out,
+    because its owner died and stopped renewing it or released it; the
+    operation id is kept, so Account Service recognises a balance change the
+    previous owner already applied. Expired records are replaced.
+    """
+    now = datetime.utcnow()
+    existing = db.get(models.IdempotencyKey, key)
+    if existing is not None and existing.expires_at > now:
+        abandoned = existing.status == "pending" and (existing.lease_expires_at is None or existing.lease_expires_at <= now)
+        if not abandoned or existing.request_hash != request_hash:
+            return existing, None
+        operation_id = existing.operation_id or uuid.uuid4().hex
+        # Conditional on the previous owner, so two retries cannot both take it over
+        taken = db.query(models.IdempotencyKey).filter(
+            models.IdempotencyKey.key == key,
+            models.IdempotencyKey.status == "pending",
+            _held_by(existing.owner)
+        ).update({
+            models.IdempotencyKey.owner: owner,
+            models.IdempotencyKey.lease_expires_at: now + timedelta(seconds=lease),
+            models.IdempotencyKey.operation_id: operation_id
+        }, synchronize_session=False)
+        db.commit()
+        if not taken:
+            db.refresh(existing)
+            return existing, None
+        return None, operation_id
+    if existing is not None:
+        db.delete(existing)
+        db.flush()
+    operation_id = uuid.uuid4().hex
+    db.add(models.IdempotencyKey(
+        key=key,
+        request_hash=request_hash,
+        status="pending",
+        owner=owner,
+        lease_expires_at=now + timedelta(seconds=lease),
+        operation_id=operation_id,
+        created_at=now,
+        expires_at=now + timedelta(seconds=ttl)
+    ))
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent request with the same key claimed it first
+        db.rollback()
+        return db.get(models.IdempotencyKey, key), None
+    return None, operation_id
+
+def renew_idempotency_lease(db: Session, key: str, owner: str, lease: float) -> bool:
+    """Extend owner's lease on a pending key; False if owner no longer holds it"""
+    renewed = db.query(models.IdempotencyKey).filter(
+        models.IdempotencyKey.key == key,
+        models.IdempotencyKey.status == "pending",
+        _held_by(owner)
+    ).update(
+        {models.IdempotencyKey.lease_expires_at: datetime.utcnow() + timedelta(seconds=lease)},
+        synchronize_session=False
+    )
+    db.commit()
+    return renewed > 0
+
+def _complete_idempotency_key(db: Session, key: str, owner: str, response_code: int, response_body: str) -> bool:
+    completed = db.query(models.IdempotencyKey).filter(
+        models.IdempotencyKey.key == key,
+        models.IdempotencyKey.status == "pending",
+        _held_by(owner)
+    ).update(
+        {
+            models.IdempotencyKey.status: "completed",
+            models.IdempotencyKey.response_code: response_code,
+            models.IdempotencyKey.response_body: response_body
+        },
+        synchronize_session=False
+    )
+    return completed > 0
+
+def complete_idempotency_key(db: Session, key: str, owner: str, response_code: int, response_body: str):
+    _complete_idempotency_key(db, key, owner, response_code, response_body)
+    db.commit()
+
+def release_idempotency_key(db: Session, key: str, owner: str):
+    """End owner's lease on a pending key so a retry can take it over at once.
+
+    The record and its operation id stay, so Account Service answers the
+    retry's balance change from its stored response if it was applied.
+    """
+    db.query(models.IdempotencyKey).filter(
+        models.IdempotencyKey.key == key,
+        models.IdempotencyKey.status == "pending",
+        _held_by(owner)
+    ).update({models.IdempotencyKey.lease_expires_at: datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+
+def purge_expired_idempotency_keys(db: Session, limit: int = 1000) -> int:
+    expired_keys = (
+        select(models.IdempotencyKey.key)
+        .where(models.IdempotencyKey.expires_at < datetime.utcnow())
+        .limit(limit)
+    )
+    purged = db.query(models.IdempotencyKey).filter(
+        models.IdempotencyKey.key.in_(expired_keys)
+    ).delete(synchronize_session=False)
+    db.commit()
+    return purged
+
+def claim_outbox_events(db: Session, limit: int = 500):
+    """Lock the oldest outbox events; replicas skip rows another relay holds"""
+    return (
+        db.query(models.OutboxEvent)
+        .order_by(models.OutboxEvent.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+
+def delete_outbox_events(db: Session, event_ids: list):
+    db.query(models.OutboxEvent).filter(models.OutboxEvent.id.in_(event_ids)).delete(synchronize_session=False)
+
 def delete_transaction(db: Session, transaction_id: int):
     transaction = db.query(models.Transaction).filter(models.Transaction.id == transaction_id).first()
     if transaction:
+        _add_to_daily_totals(db, [transaction], sign=-1)
         db.delete(transaction)
         db.commit()
@@ -0,0 +1,142 @@
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from prometheus_client import Counter
+from . import crud
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Seconds a stored response is replayed for retries carrying the same key
+IDEMPOTENCY_KEY_TTL = float(os.getenv("IDEMPOTENCY_KEY_TTL", "86400"))
+# Seconds a pending key stays held without its owner renewing the lease. A
+# running request renews it every third of that, so a retry only takes over
+# a key whose request died (or released it after an unknown outcome).
+IDEMPOTENCY_LEASE_TIMEOUT = float(os.getenv("IDEMPOTENCY_LEASE_TIMEOUT", "30"))
+# Seconds between sweeps that delete expired keys
+IDEMPOTENCY_PURGE_INTERVAL = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL", "300"))
+
+IDEMPOTENCY_PURGE_BATCH_SIZE = 1000
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+IDEMPOTENT_REPLAYS = Counter("idempotency_replays_total", "POST /transactions and /transactions/batch retries answered from a stored response")
+IDEMPOTENT_CONFLICTS = Counter("idempotency_conflicts_total", "Idempotency-Key requests rejected", ["reason"])
+
+def request_fingerprint(transaction) -> str:
+    """Hash of the request body, so a key cannot be reused for a different request"""
+    return hashlib.sha256(json.dumps(transaction.dict(), sort_keys=True, default=str).encode()).hexdigest()
+
+def batch_fingerprint(items: list) -> str:
+    """Hash of a batch body, so a key cannot be reused for a different batch"""
+    return hashlib.sha256(json.dumps(items, sort_keys=True, default=str).encode()).hexdigest()
+
+def validate_key(key: str):
+    if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Idempotency-Key must be between 1 and {IDEMPOTENCY_KEY_MAX_LENGTH} characters"
+        )
+
+def replay(record, request_hash: str):
+    """Answer a request whose key is already held by another request"""
+    if record.request_hash != request_hash:
+        IDEMPOTENT_CONFLICTS.labels(reason="mismatch").inc()
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    if record.status != "completed":
+        IDEMPOTENT_CONFLICTS.labels(reason="in_progress").inc()
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+    IDEMPOTENT_REPLAYS.inc()
+    return JSONResponse(
+        status_code=record.response_code,
+        content=json.loads(record.response_body),
+        headers={REPLAYED_HEADER: "true"}
+    )
+
+def new_owner() -> str:
+    """Token identifying one request while it holds a key"""
+    return uuid.uuid4().hex
+
+def new_operation_id() -> str:
+    """Operation id for a batch sent without an Idempotency-Key"""
+    return uuid.uuid4().hex
+
+def operation_key(operation_id: str) -> str:
+    """Idempotency-Key sent to Account Service for a key's balance change"""
+    return f"transaction-{operation_id}"
+
+def item_operation_key(operation_id: str, index: int) -> str:
+    """Operation key sent to Account Service for the balance change of one batch item"""
+    return f"{operation_key(operation_id)}-{index}"
+
+def _renew_lease(session_factory, key: str, owner: str) -> bool:
+    db = session_factory()
+    try:
+        return crud.renew_idempotency_lease(db, key, owner, IDEMPOTENCY_LEASE_TIMEOUT)
+    finally:
+        db.close()
+
+@asynccontextmanager
+async def hold_lease(session_factory, key: str, owner: str):
+    """Keep renewing owner's lease on key while the block runs"""
+    async def renew():
+        while True:
+            await asyncio.sleep(IDEMPOTENCY_LEASE_TIMEOUT / 3)
+            try:
+                if not await run_in_threadpool(_renew_lease, session_factory, key, owner):
+                    return
+            except Exception as e:
+                logger.error(f"Idempotency key lease renewal failed: {e}")
+
+    task = asyncio.get_running_loop().create_task(renew())
+    try:
+        yield
+    finally:
+        task.cancel()
+
+class IdempotencyKeyPurger:
+    """Background thread that deletes expired idempotency keys in batches"""
+
+    def __init__(self, session_factory, interval: float = IDEMPOTENCY_PURGE_INTERVAL):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='idempotency-purger', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def purge_once(self) -> int:
+        db = self.session_factory()
+        try:
+            purged = 0
+            while not self._stopping.is_set():
+                batch = crud.purge_expired_idempotency_keys(db, limit=IDEMPOTENCY_PURGE_BATCH_SIZE)
+                purged += batch
+                if batch < IDEMPOTENCY_PURGE_BATCH_SIZE:
+                    return purged
+            return purged
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.purge_once()
+            except Exception as e:
+                logger.error(f"Idempotency key purge failed: {e}")
@@ -0,0 +1,200 @@
+from contextlib import asynccontextmanager
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import create_engine, text
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# "sharded" runs transactions touching the same account one at a time;
+# "concurrent" relies only on Account Service's conditional updates
+TRANSACTION_EXECUTION_MODE = os.getenv("TRANSACTION_EXECUTION_MODE", "concurrent")
+TRANSACTION_LANE_COUNT = int(os.getenv("TRANSACTION_LANE_COUNT", "64"))
+# "process" serializes within one replica; "cluster" also takes a Postgres
+# advisory lock per lane so every replica shares the same lanes
+TRANSACTION_LANE_SCOPE = os.getenv("TRANSACTION_LANE_SCOPE", "process")
+# Dedicated Postgres sessions per worker that hold the cluster lane locks
+TRANSACTION_LANE_LOCK_SESSIONS = int(os.getenv("TRANSACTION_LANE_LOCK_SESSIONS", "4"))
+# Longest backoff, in seconds, between attempts on a lane another replica holds
+TRANSACTION_LANE_LOCK_MAX_BACKOFF = float(os.getenv("TRANSACTION_LANE_LOCK_MAX_BACKOFF", "0.05"))
+LANE_LOCK_MIN_BACKOFF = 0.002
+
+# First key of the two-key advisory lock, keeping lane locks apart from any other user
+LANE_LOCK_NAMESPACE = 7478
+
+LANE_WAIT_SECONDS = Histogram("transaction_lane_wait_seconds", "Time spent waiting to enter account lanes")
+LANES_HELD = Gauge("transaction_lanes_held", "Account lanes currently held by in-flight transactions")
+LANE_LOCKS_LOST = Counter("transaction_lane_locks_lost_total", "Cluster lane locks dropped with their session and taken by another worker before it reconnected")
+
+class _LockSession:
+    """One dedicated connection and the lanes whose advisory locks it holds"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.connection = None
+        self.held = set()
+        self.lost = set()  # held lanes another worker took while the session was down
+        self.mutex = threading.Lock()
+
+    def _connect(self):
+        self.connection = self.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        owned = sorted(self.held - self.lost)
+        if owned:
+            # The server dropped every lock of the old session; take them back
+            # unless another worker got there first
+            retaken = set(self.connection.execute(
+                text("SELECT lane FROM unnest(:lanes) AS lane WHERE pg_try_advisory_lock(:namespace, lane)"),
+                {"namespace": LANE_LOCK_NAMESPACE, "lanes": owned}
+            ).scalars())
+            lost = set(owned) - retaken
+            if lost:
+                LANE_LOCKS_LOST.inc(len(lost))
+                logger.error(f"Cluster lanes {sorted(lost)} were taken by another worker while their lock session reconnected")
+                self.lost |= lost
+
+    def execute(self, statement: str, **params):
+        """Run statement on the session; the caller holds mutex"""
+        try:
+            if self.connection is None:
+                self._connect()
+            return self.connection.execute(text(statement), {"namespace": LANE_LOCK_NAMESPACE, **params}).scalar()
+        except Exception:
+            # The server drops the locks of a lost session; the next call
+            # reconnects and takes back the lanes still held
+            if self.connection is not None:
+                self.connection.invalidate()
+                self.connection = None
+            raise
+
+class ClusterLaneLocks:
+    """Advisory locks that share lanes between replicas.
+
+    Within a process a lane already has one holder at a time, so a few
+    sessions can hold the locks of every lane the process is using: each lane
+    belongs to one of TRANSACTION_LANE_LOCK_SESSIONS dedicated connections
+    outside the request pool, and lanes on different sessions are locked in
+    parallel. Locks are taken with pg_try_advisory_lock and a jittered
+    backoff, so waiting for a lane that another replica holds ties up
+    neither a connection nor a thread.
+
+    A session that drops loses its locks on the server. The next call on it
+    reconnects and takes back the lanes it still holds; a lane another worker
+    took in the meantime is reported by lost_lanes() until it is unlocked.
+    """
+
+    def __init__(self, url, sessions: int = TRANSACTION_LANE_LOCK_SESSIONS):
+        self.engine = create_engine(url, pool_size=sessions, max_overflow=0, pool_pre_ping=True)
+        self._sessions = [_LockSession(self.engine) for _ in range(sessions)]
+
+    def _session_for(self, lane: int) -> _LockSession:
+        return self._sessions[lane % len(self._sessions)]
+
+    def try_lock(self, lane: int) -> bool:
+        session = self._session_for(lane)
+        with session.mutex:
+            locked = session.execute("SELECT pg_try_advisory_lock(:namespace, :lane)", lane=lane)
+            if locked:
+                session.held.add(lane)
+                session.lost.discard(lane)
+            return locked
+
+    def lost_lanes(self, lanes) -> list:
+        """Those of lanes this process holds but whose lock another worker took"""
+        # Set lookups only, so the event loop never waits on a session's mutex
+        return [lane for lane in lanes if lane in self._session_for(lane).lost]
+
+    def unlock(self, lanes):
+        """Release whichever of lanes this process holds"""
+        by_session = {}
+        for lane in lanes:
+            by_session.setdefault(self._session_for(lane), []).append(lane)
+        for session, session_lanes in by_session.items():
+            with session.mutex:
+                owned = [lane for lane in session_lanes if lane in session.held and lane not in session.lost]
+                session.held.difference_update(session_lanes)
+                session.lost.difference_update(session_lanes)
+                # A session that is down already lost its locks on the server
+                if owned and session.connection is not None:
+                    session.execute(
+                        "SELECT count(pg_advisory_unlock(:namespace, lane)) FROM unnest(:lanes) AS lane", lanes=owned
+                    )
+
+class AccountLanes:
+    """Single-writer lanes for transactions, chosen by account id.
+
+    Each account maps to one of lane_count lanes and a transaction holds the
+    lanes of every account it touches while it calls Account Service and
+    records itself. Lanes are always entered in ascending order, so a
+    transfer holding two lanes cannot deadlock against another transfer.
+    """
+
+    def __init__(self, lane_count: int = TRANSACTION_LANE_COUNT, enabled: bool = True, cluster_locks: ClusterLaneLocks = None):
+        self.lane_count = lane_count
+        self.enabled = enabled
+        self.cluster_locks = cluster_locks  # set for cluster scope
+        self._locks = [asyncio.Lock() for _ in range(lane_count)]
+
+    def lane_for(self, account_id: int) -> int:
+        return hash(account_id) % self.lane_count
+
+    async def _lock_cluster_lane(self, lane: int):
+        backoff = LANE_LOCK_MIN_BACKOFF
+        while not await run_in_threadpool(self.cluster_locks.try_lock, lane):
+            await asyncio.sleep(random.uniform(0, backoff))
+            backoff = min(backoff * 2, TRANSACTION_LANE_LOCK_MAX_BACKOFF)
+
+    async def _lock_cluster_lanes(self, lanes):
+        while True:
+            for lane in lanes:
+                await self._lock_cluster_lane(lane)
+            if not self.cluster_locks.lost_lanes(lanes):
+                return
+            # A reconnect lost a lane taken earlier to another worker. Start
+            # over in lane order, so two workers never wait on each other
+            await run_in_threadpool(self.cluster_locks.unlock, lanes)
+
+    @asynccontextmanager
+    async def serialize(self, account_ids):
+        if not self.enabled:
+            yield
+            return
+
+        lanes = sorted({self.lane_for(account_id) for account_id in account_ids if account_id is not None})
+        started = time.perf_counter()
+        acquired = []
+        try:
+            for lane in lanes:
+                await self._locks[lane].acquire()
+                acquired.append(lane)
+            if self.cluster_locks is not None:
+                await self._lock_cluster_lanes(lanes)
+            LANE_WAIT_SECONDS.observe(time.perf_counter() - started)
+            LANES_HELD.inc(len(lanes))
+            try:
+                yield
+            finally:
+                LANES_HELD.dec(len(lanes))
+        finally:
+            if self.cluster_locks is not None and acquired:
+                lost = self.cluster_locks.lost_lanes(acquired)
+                if lost:
+                    logger.warning(f"Cluster lanes {lost} were lost while held; another worker may have used them at the same time")
+                try:
+                    await run_in_threadpool(self.cluster_locks.unlock, acquired)
+                except Exception as e:
+                    logger.error(f"Failed to release cluster lanes {acquired}: {e}")
+            for lane in acquired:
+                self._locks[lane].release()
+
+def build_account_lanes(engine) -> AccountLanes:
+    enabled = TRANSACTION_EXECUTION_MODE == "sharded"
+    cluster = enabled and TRANSACTION_LANE_SCOPE == "cluster"
+    if cluster and engine.dialect.name != "postgresql":
+        logger.warning("Cluster-wide transaction lanes need PostgreSQL; using process scope")
+        cluster = False
+    return AccountLanes(TRANSACTION_LANE_COUNT, enabled=enabled, cluster_locks=ClusterLaneLocks(engine.url) if cluster else None)
@@ -1,25 +1,79 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
+from typing import Optional
 from prometheus_fastapi_instrumentator import Instrumentator
-import requests
-from . import models, schemas, crud
-from .database import Base, engine, SessionLocal
+from prometheus_client import Gauge
+import httpx
+import csv
+import io
+import json
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from . import models, schemas, crud, account_client, idempotency, lifecycle, metrics, resilience
+from .account_cache import AccountCache
+from .outbox import OutboxRelay
+from .lanes import build_account_lanes
+from .money import ZERO, money_json, to_money
+from .pagination import resolve_after_id, set_next_cursor, encode_history_cursor, decode_history_cursor, NEXT_CURSOR_HEADER
+from .database import engine, async_engine, SessionLocal, fetch_all, fetch_first, fetch_rows, dispose_async_engine
+from .tracing import setup_tracing, shutdown_tracing
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from rabbitmq_utils import RabbitMQPublisher
+from rabbitmq_utils import RabbitMQPublisher, RabbitMQConsumer
+
+# Upper bound on the number of items accepted by POST /transactions/batch
+TRANSACTION_BATCH_MAX_SIZE = int(os.getenv("TRANSACTION_BATCH_MAX_SIZE", "50000"))
+
+# Rows fetched per server-side cursor round trip by GET /transactions/export
+TRANSACTION_EXPORT_BATCH_SIZE = int(os.getenv("TRANSACTION_EXPORT_BATCH_SIZE", "1000"))
+
+# Longest date range, in days, accepted by GET /transactions/stats
+TRANSACTION_STATS_MAX_DAYS = int(os.getenv("TRANSACTION_STATS_MAX_DAYS", "366"))
+
+# Worker processes per pod that run the idempotency key purger
+MAINTENANCE_WORKERS = int(os.getenv("MAINTENANCE_WORKERS", "1"))
+
+EXPORT_COLUMNS = ["id", "account_id", "type", "amount", "target_account_id", "timestamp"]
 
 app = FastAPI(title="Transaction Service", version="1.0.0")
 
 # Prometheus metrics instrumentation
 Instrumentator().instrument(app).expose(app)
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# Spans for requests, Account Service calls and DB queries (TRACING_EXPORTER)
+setup_tracing(app, [engine] + ([async_engine.sync_engine] if async_engine is not None else []))
 
 # Initialize RabbitMQ Publisher
 rabbitmq_publisher = RabbitMQPublisher()
 
+# Publisher queue depth and outcome counts, read at scrape time
+for stat, description in (
+    ('queue_depth', 'Events queued for RabbitMQ but not yet confirmed'),
+    ('published', 'Events confirmed by RabbitMQ'),
+    ('failed', 'Events dropped after exhausting publish retries'),
+    ('rejected', 'Events rejected because the publish queue was full'),
+):
+    Gauge(f"rabbitmq_publisher_{stat}", description).set_function(lambda stat=stat: rabbitmq_publisher.stats()[stat])
+
+# Relays transaction.completed events from the outbox table to RabbitMQ
+outbox_relay = OutboxRelay(SessionLocal, rabbitmq_publisher)
+
+# Per-account single-writer lanes (TRANSACTION_EXECUTION_MODE=sharded)
+account_lanes = build_account_lanes(engine)
+
+# Deletes idempotency keys whose replay window has passed
+idempotency_purger = idempotency.IdempotencyKeyPurger(SessionLocal)
+
+# Accounts known not to exist, cleared by account.created events from Account Service
+account_cache = AccountCache()
+account_events_consumer = RabbitMQConsumer()
+
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
@@ -32,124 +86,557 @@ def get_db():
 def read_root():
     return {"message": "Transaction Service is running"}
 
-def get_account_from_service(account_id: int):
-    """Helper function to get account data from Account Service"""
-    try:
-        account_service_url = f"http://account-service:8002/accounts/{account_id}"
-        response = requests.get(account_service_url, timeout=5)
-        if response.status_code == 404:
-            raise HTTPException(status_code=404, detail=f"Account {account_id} not found")
-        elif response.status_code != 200:
-            raise HTTPException(status_code=500, detail=f"Account Service error: {response.status_code}")
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Cannot connect to Account Service: {str(e)}")
+@app.get("/ready")
+def read_ready(response: Response):
+    """Readiness probe: 200 once this worker's database pool is warm and reachable"""
+    return lifecycle.readiness(
+        response,
+        {"database": lifecycle.database_ready(engine), "pool_warm": pool_warmup.done},
+        maintenance=runs_maintenance
+    )
 
-def update_account_balance_in_service(account_id: int, new_balance: float):
-    """Helper function to update account balance in Account Service"""
+async def call_account_service(method: str, path: str, payload: dict, operation: str, idempotency_key: str = None,
+                               idempotent: bool = False):
+    """Helper function to send a balance change to Account Service"""
+    started = time.perf_counter()
+    status = "error"
     try:
-        account_service_url = f"http://account-service:8002/accounts/{account_id}"
-        update_data = {"balance": new_balance}
-        response = requests.put(account_service_url, json=update_data, timeout=5)
-        if response.status_code == 404:
-            raise HTTPException(status_code=404, detail=f"Account {account_id} not found")
+        with metrics.observe_stage("account_service"):
+            response = await account_client.request(method, path, payload, idempotency_key, idempotent)
+        status = str(response.status_code)
+        if response.status_code in (400, 404):
+            raise HTTPException(status_code=response.status_code, detail=response.json().get('detail'))
         elif response.status_code != 200:
             raise HTTPException(status_code=500, detail=f"Failed to update account balance: {response.status_code}")
         return response.json()
-    except requests.exceptions.RequestException as e:
+    except resilience.CircuitOpenError:
+        status = "circuit_open"
+        # Shed load instead of queueing calls behind a failing Account Service
+        raise HTTPException(status_code=503, detail="Account Service unavailable: circuit open")
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Cannot connect to Account Service: {str(e)}")
+    finally:
+        metrics.ACCOUNT_SERVICE_CALL_SECONDS.labels(operation=operation, status=status).observe(time.perf_counter() - started)
 
-def publish_notification_event(user_id: int, message: str, transaction_id: int, transaction_type: str):
-    """Publish notification event to RabbitMQ"""
+async def adjust_account_balance_in_service(account_id: int, amount: Decimal, operation_key: str = None):
+    """Atomically add amount (negative to debit) to an account in one round trip"""
     try:
-        event_data = {
-            'user_id': user_id,
-            'message': message,
-            'transaction_id': transaction_id,
-            'transaction_type': transaction_type
-        }
-        rabbitmq_publisher.publish_message('transaction.completed', event_data)
+        # Amounts travel as decimal strings so they never pass through a float
+        return await call_account_service("POST", f"/accounts/{account_id}/adjust", {"amount": str(amount)}, "adjust", operation_key)
+    except HTTPException as e:
+        if e.status_code == 404:
+            account_cache.mark_missing(account_id)
+        raise
+
+async def transfer_in_account_service(source_account_id: int, target_account_id: int, amount: Decimal, operation_key: str = None):
+    """Atomically move amount between two accounts in one round trip"""
+    return await call_account_service("POST", "/accounts/transfer", {
+        "source_account_id": source_account_id,
+        "target_account_id": target_account_id,
+        "amount": str(amount)
+    }, "transfer", operation_key)
+
+def reject_known_missing_account(account_id: int):
+    """Fail fast, without a round trip, for accounts cached as not existing"""
+    if account_cache.is_missing(account_id):
+        raise HTTPException(status_code=404, detail=f"Account {account_id} not found")
+
+def process_account_event(ch, method, properties, body):
+    """Keep the known-missing account cache in line with account events"""
+    try:
+        data = json.loads(body)
+        account_id = data.get('account_id')
+        if account_id:
+            if method.routing_key == 'account.deleted':
+                account_cache.mark_missing(account_id)
+            else:
+                # A new account clears a stale "not found" entry for its id
+                account_cache.invalidate(account_id, reason=method.routing_key)
+        ch.basic_ack(delivery_tag=method.delivery_tag)
     except Exception as e:
-        print(f"Failed to publish notification event: {e}")  # Don't fail transaction for notification errors
+        print(f"Error processing account event: {e}")
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+
+def start_account_events_consumer():
+    """Consume account events on a queue private to this replica"""
+    try:
+        queue_name = account_events_consumer.setup_exclusive_queue(['account.created', 'account.deleted'])
+        account_events_consumer.start_consuming(queue_name, process_account_event)
+    except Exception as e:
+        print(f"Error in account events consumer: {e}")
+
+# Connections opened at startup; GET /ready waits for them
+pool_warmup = lifecycle.PoolWarmup(engine, async_engine)
+runs_maintenance = False
+
+@app.on_event("startup")
+async def startup_event():
+    global runs_maintenance
+    # Every worker has its own account cache, so every worker consumes account events
+    threading.Thread(target=start_account_events_consumer, daemon=True).start()
+    # Every worker relays too: notify() only wakes the relay in its own process,
+    # and SKIP LOCKED keeps relays from sending the same rows
+    outbox_relay.start()
+    runs_maintenance = lifecycle.claim_worker_slot("transaction-maintenance", MAINTENANCE_WORKERS)
+    if runs_maintenance:
+        idempotency_purger.start()
+    pool_warmup.start()
+
+def notification_event(user_id: int, message: str, transaction_type: str):
+    """Build a transaction.completed outbox event; transaction_id is filled in on insert"""
+    return ('transaction.completed', {
+        'user_id': user_id,
+        'message': message,
+        'transaction_type': transaction_type,
+        'timestamp': datetime.utcnow().isoformat()
+    })
 
 # --- CRUD Endpoints ---
 @app.post("/transactions", response_model=schemas.TransactionResponse)
-def create_transaction(transaction: schemas.TransactionCreate, db: Session = Depends(get_db)):
+async def create_transaction(transaction: schemas.TransactionCreate, idempotency_key: Optional[str] = Header(None),
+                             db: Session = Depends(get_db)):
+    """Apply a transaction; retries sending the same Idempotency-Key get the stored response"""
+    if idempotency_key is None:
+        return await apply_transaction(transaction, db)
+
+    idempotency.validate_key(idempotency_key)
+    request_hash = idempotency.request_fingerprint(transaction)
+    owner = idempotency.new_owner()
+    existing, operation_id = await run_in_threadpool(
+        crud.claim_idempotency_key, db, idempotency_key, request_hash, owner,
+        idempotency.IDEMPOTENCY_KEY_TTL, idempotency.IDEMPOTENCY_LEASE_TIMEOUT
+    )
+    if existing is not None:
+        return idempotency.replay(existing, request_hash)
+
     try:
-        # Validate account exists and get current balance
-        account_data = get_account_from_service(transaction.account_id)
-        current_balance = account_data['balance']
-        user_id = account_data['user_id']
-
-        # Process transaction based on type
-        if transaction.type == "deposit":
-            new_balance = current_balance + transaction.amount
-            message = f"Deposit of ${transaction.amount:.2f} completed. New balance: ${new_balance:.2f}"
-            
-        elif transaction.type == "withdraw":
-            if current_balance < transaction.amount:
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"Insufficient balance. Current balance: ${current_balance:.2f}, Requested: ${transaction.amount:.2f}"
-                )
-            new_balance = current_balance - transaction.amount
-            message = f"Withdrawal of ${transaction.amount:.2f} completed. New balance: ${new_balance:.2f}"
-            
-        elif transaction.type == "transfer":
-            if current_balance < transaction.amount:
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"Insufficient balance for transfer. Current balance: ${current_balance:.2f}, Requested: ${transaction.amount:.2f}"
+        async with idempotency.hold_lease(SessionLocal, idempotency_key, owner):
+            return await apply_transaction(transaction, db, idempotency_key, owner, idempotency.operation_key(operation_id))
+    except HTTPException as e:
+        if e.status_code < 500:
+            # Rejections are final for this request, so retries get the same answer
+            body = json.dumps({"detail": e.detail})
+            await run_in_threadpool(crud.complete_idempotency_key, db, idempotency_key, owner, e.status_code, body)
+        else:
+            # The outcome is unknown: the balance change may have been applied.
+            # A retry may take the key over now; it resends the same operation
+            # key, so Account Service replays the change instead of repeating it
+            await run_in_threadpool(crud.release_idempotency_key, db, idempotency_key, owner)
+        raise
+
+async def apply_transaction(transaction: schemas.TransactionCreate, db: Session, idempotency_key: str = None,
+                            owner: str = None, operation_key: str = None):
+    started = time.perf_counter()
+    try:
+        reject_known_missing_account(transaction.account_id)
+        if transaction.type == "transfer":
+            reject_known_missing_account(transaction.target_account_id)
+
+        # In sharded mode, transactions on the same account run one at a time
+        async with account_lanes.serialize([transaction.account_id, transaction.target_account_id]):
+            events = []
+            # Apply the balance change server-side; Account Service validates the
+            # account(s) and rejects overdrafts in the same conditional update
+            if transaction.type == "deposit":
+                account_data = await adjust_account_balance_in_service(transaction.account_id, transaction.amount, operation_key)
+                message = f"Deposit of ${transaction.amount:.2f} completed. New balance: ${to_money(account_data['balance']):.2f}"
+
+            elif transaction.type == "withdraw":
+                account_data = await adjust_account_balance_in_service(transaction.account_id, -transaction.amount, operation_key)
+                message = f"Withdrawal of ${transaction.amount:.2f} completed. New balance: ${to_money(account_data['balance']):.2f}"
+
+            elif transaction.type == "transfer":
+                transfer_data = await transfer_in_account_service(
+                    transaction.account_id, transaction.target_account_id, transaction.amount, operation_key
                 )
-            
-            # Validate target account exists
-            target_account_data = get_account_from_service(transaction.target_account_id)
-            target_user_id = target_account_data['user_id']
-            target_current_balance = target_account_data['balance']
-            
-            # Update both accounts
-            new_balance = current_balance - transaction.amount
-            target_new_balance = target_current_balance + transaction.amount
-            
-            # Update target account first (in case of failure, source account remains unchanged)
-            update_account_balance_in_service(transaction.target_account_id, target_new_balance)
-            
-            message = f"Transfer of ${transaction.amount:.2f} to account {transaction.target_account_id} completed. New balance: ${new_balance:.2f}"
-            
-            # Send notification to target account user
-            target_message = f"Received transfer of ${transaction.amount:.2f} from account {transaction.account_id}. New balance: ${target_new_balance:.2f}"
-            publish_notification_event(target_user_id, target_message, 0, transaction.type)
-
-        # Update source account balance
-        update_account_balance_in_service(transaction.account_id, new_balance)
-
-        # Create transaction record in database
-        db_transaction = crud.create_transaction(db, transaction)
-
-        # Publish notification event to RabbitMQ
-        publish_notification_event(user_id, message, db_transaction.id, transaction.type)
+                account_data = transfer_data['source']
+                target_account_data = transfer_data['target']
+                message = f"Transfer of ${transaction.amount:.2f} to account {transaction.target_account_id} completed. New balance: ${to_money(account_data['balance']):.2f}"
+
+                # Notify the target account user as well
+                target_message = f"Received transfer of ${transaction.amount:.2f} from account {transaction.account_id}. New balance: ${to_money(target_account_data['balance']):.2f}"
+                events.append(notification_event(target_account_data['user_id'], target_message, transaction.type))
 
+            events.insert(0, notification_event(account_data['user_id'], message, transaction.type))
+
+            # Record the transaction and its notification events in one commit;
+            # the outbox relay publishes them to RabbitMQ
+            with metrics.observe_stage("db_commit"):
+                db_transaction = await run_in_threadpool(crud.create_transaction, db, transaction, events, idempotency_key, owner)
+            if db_transaction is None:
+                raise HTTPException(status_code=409, detail="A retry with this Idempotency-Key took the request over")
+            outbox_relay.notify()
+
+        metrics.record_transaction(transaction.type, transaction.amount, started)
         return db_transaction
 
-    except HTTPException:
+    except HTTPException as e:
+        metrics.record_failure(transaction.type, metrics.failure_reason(e), started)
         raise
     except Exception as e:
+        metrics.record_failure(transaction.type, "internal", started)
         raise HTTPException(status_code=500, detail=f"Transaction failed: {str(e)}")
 
+async def parse_transaction_batch(request: Request):
+    """Read a batch body as a JSON array or as NDJSON (one object per line)"""
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+            return [json.loads(line) for line in body.splitlines() if line.strip()]
+        items = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch body: {str(e)}")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Batch body must be a JSON array or NDJSON")
+    return items
+
+@app.post("/transactions/batch", response_model=schemas.TransactionBatchResponse)
+async def create_transactions_batch(request: Request, idempotency_key: Optional[str] = Header(None),
+                                    db: Session = Depends(get_db)):
+    """Apply a batch; a retry sending the same Idempotency-Key gets the stored response,
+    or finishes a batch whose outcome was left unknown without applying any item twice"""
+    try:
+        items = await parse_transaction_batch(request)
+        if len(items) > TRANSACTION_BATCH_MAX_SIZE:
+            raise HTTPException(status_code=400, detail=f"Batch size must not exceed {TRANSACTION_BATCH_MAX_SIZE}")
+        if idempotency_key is None:
+            return await apply_transaction_batch(items, db, idempotency.new_operation_id())
+
+        idempotency.validate_key(idempotency_key)
+        request_hash = idempotency.batch_fingerprint(items)
+        owner = idempotency.new_owner()
+        existing, operation_id = await run_in_threadpool(
+            crud.claim_idempotency_key, db, idempotency_key, request_hash, owner,
+            idempotency.IDEMPOTENCY_KEY_TTL, idempotency.IDEMPOTENCY_LEASE_TIMEOUT
+        )
+        if existing is not None:
+            return idempotency.replay(existing, request_hash)
+
+        try:
+            async with idempotency.hold_lease(SessionLocal, idempotency_key, owner):
+                batch = await apply_transaction_batch(items, db, operation_id)
+            if any(result["status"] == "unknown" for result in batch["results"]):
+                # A retry may take the key over now; it resends the same operation
+                # keys, so Account Service replays what was applied
+                await run_in_threadpool(crud.release_idempotency_key, db, idempotency_key, owner)
+            else:
+                body = schemas.TransactionBatchResponse(**batch).json()
+                await run_in_threadpool(crud.complete_idempotency_key, db, idempotency_key, owner, 200, body)
+        except Exception:
+            await run_in_threadpool(crud.release_idempotency_key, db, idempotency_key, owner)
+            raise
+        return batch
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch transaction failed: {str(e)}")
+
+async def apply_transaction_batch(items: list, db: Session, operation_id: str):
+    started = time.perf_counter()
+    results = [None] * len(items)
+    valid = {}
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("Item must be a JSON object")
+            transaction = schemas.TransactionCreate(**item)
+        except (ValidationError, ValueError) as e:
+            results[index] = {"index": index, "status": "failed", "error": str(e)}
+            continue
+        try:
+            reject_known_missing_account(transaction.account_id)
+            if transaction.type == "transfer":
+                reject_known_missing_account(transaction.target_account_id)
+        except HTTPException as e:
+            metrics.record_failure(transaction.type, metrics.failure_reason(e))
+            results[index] = {"index": index, "status": "failed", "error": e.detail}
+            continue
+        valid[index] = transaction
+
+    # Items are applied in request order. Each run of consecutive deposits and
+    # withdrawals goes to Account Service in one call, one ledger entry per
+    # item, so an item that would overdraw fails alone. Transfers touch two
+    # accounts and keep their own atomic call between the runs. Each call
+    # holds only the lanes of the accounts it touches, and only while it runs.
+    # What a call applied is recorded as soon as it returns. Every item is
+    # sent with an operation key derived from its index, so Account Service
+    # applies it at most once however often the batch is retried under the
+    # same Idempotency-Key, and its transaction is recorded only once.
+    pending = []
+    stopped = None  # why the rest of the batch was not sent
+
+    def call_failed(e: HTTPException, called: list):
+        """Fail the items of a call that raised; a 5xx stops the batch"""
+        nonlocal stopped
+        reason = metrics.failure_reason(e)
+        for index, transaction in called:
+            metrics.record_failure(transaction.type, reason)
+            # A call that failed after it was sent may still have been applied
+            unknown = e.status_code >= 500 and reason != "account_service_circuit_open"
+            results[index] = {"index": index, "status": "unknown" if unknown else "failed", "error": e.detail}
+        if e.status_code >= 500:
+            stopped = e.detail
+
+    async def record(applied: list):
+        """Record applied (index, transaction, outbox events) items in one commit"""
+        nonlocal stopped
+        try:
+            with metrics.observe_stage("db_commit"):
+                db_transactions = await run_in_threadpool(
+                    crud.create_transactions_bulk, db,
+                    [transaction for _, transaction, _ in applied],
+                    [events for _, _, events in applied],
+                    [idempotency.item_operation_key(operation_id, index) for index, _, _ in applied]
+                )
+        except Exception as e:
+            for index, transaction, _ in applied:
+                metrics.record_failure(transaction.type, "internal")
+                results[index] = {"index": index, "status": "unknown", "error": f"Applied but not recorded: {str(e)}"}
+            stopped = f"Failed to record transactions: {str(e)}"
+            return
+        outbox_relay.notify()
+        for (index, transaction, _), db_transaction in zip(applied, db_transactions):
+            metrics.record_transaction(transaction.type, transaction.amount)
+            results[index] = {"index": index, "status": "completed", "transaction": schemas.TransactionResponse(**db_transaction._mapping)}
+
+    async def apply_adjustments():
+        if not pending:
+            return
+        called = list(pending)
+        pending.clear()
+        adjustments = [
+            {"account_id": transaction.account_id,
+             "amount": str(transaction.amount if transaction.type == "deposit" else -transaction.amount),
+             "operation_key": idempotency.item_operation_key(operation_id, index)}
+            for index, transaction in called
+        ]
+        try:
+            async with account_lanes.serialize({transaction.account_id for _, transaction in called}):
+                account_results = await call_account_service(
+                    "POST", "/accounts/batch-adjust", {"adjustments": adjustments}, "batch_adjust", idempotent=True
+                )
+        except HTTPException as e:
+            call_failed(e, called)
+            return
+        applied = []
+        for (index, transaction), account_result in zip(called, account_results):
+            if account_result['status'] == "not_found":
+                account_cache.mark_missing(account_result['account_id'])
+            if account_result['status'] != "applied":
+                metrics.record_failure(transaction.type, account_result['status'])
+                results[index] = {"index": index, "status": "failed", "error": account_result['detail']}
+                continue
+            action = "Deposit" if transaction.type == "deposit" else "Withdrawal"
+            applied.append((index, transaction, [
+                notification_event(account_result['user_id'], f"{action} of ${transaction.amount:.2f} completed. New balance: ${to_money(account_result['balance']):.2f}", transaction.type)
+            ]))
+        await record(applied)
+
+    for index, transaction in valid.items():
+        if transaction.type != "transfer":
+            pending.append((index, transaction))
+            continue
+        await apply_adjustments()
+        if stopped:
+            break
+        try:
+            async with account_lanes.serialize([transaction.account_id, transaction.target_account_id]):
+                transfer_data = await transfer_in_account_service(
+                    transaction.account_id, transaction.target_account_id, transaction.amount,
+                    idempotency.item_operation_key(operation_id, index)
+                )
+        except HTTPException as e:
+            call_failed(e, [(index, transaction)])
+            if stopped:
+                break
+            continue
+        await record([(index, transaction, [
+            notification_event(transfer_data['source']['user_id'], f"Transfer of ${transaction.amount:.2f} to account {transaction.target_account_id} completed. New balance: ${to_money(transfer_data['source']['balance']):.2f}", transaction.type),
+            notification_event(transfer_data['target']['user_id'], f"Received transfer of ${transaction.amount:.2f} from account {transaction.account_id}. New balance: ${to_money(transfer_data['target']['balance']):.2f}", transaction.type)
+        ])])
+        if stopped:
+            break
+    if not stopped:
+        await apply_adjustments()
+
+    for index, transaction in valid.items():
+        if results[index] is None:
+            # Never sent to Account Service, so safe to resubmit
+            metrics.record_failure(transaction.type, "batch_stopped")
+            results[index] = {"index": index, "status": "failed", "error": f"Not applied, batch stopped: {stopped}"}
+
+    elapsed = time.perf_counter() - started
+    succeeded = sum(1 for result in results if result["status"] == "completed")
+    return {
+        "total": len(items),
+        "succeeded": succeeded,
+        "failed": len(items) - succeeded,
+        "elapsed_ms": round(elapsed * 1000, 3),
+        "throughput_per_second": round(len(items) / elapsed, 3) if elapsed > 0 else 0.0,
+        "results": results
+    }
+
 @app.get("/transactions", response_model=list[schemas.TransactionResponse])
-def read_transactions(account_id: int = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+async def read_transactions(response: Response, account_id: int = None, skip: int = 0, limit: int = 100, after_id: Optional[int] = None, cursor: Optional[str] = None):
     try:
-        return crud.get_transactions(db, account_id=account_id, skip=skip, limit=limit)
+        if skip < 0:
+            raise HTTPException(status_code=400, detail="Skip parameter must be non-negative")
+        if limit <= 0 or limit > 1000:
+            raise HTTPException(status_code=400, detail="Limit must be between 1 and 1000")
+
+        transactions = await fetch_all(crud.select_transactions(
+            account_id=account_id, skip=skip, limit=limit, after_id=resolve_after_id(after_id, cursor)
+        ))
+        set_next_cursor(response, transactions, limit)
+        return transactions
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve transactions: {str(e)}")
 
+@app.get("/transactions/history", response_model=list[schemas.TransactionResponse])
+async def read_transaction_history(
+    response: Response,
+    account_id: int,
+    direction: str = "all",
+    type: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None
+):
+    try:
+        if account_id <= 0:
+            raise HTTPException(status_code=400, detail="Account ID must be a positive integer")
+        if direction not in ("all", "outgoing", "incoming"):
+            raise HTTPException(status_code=400, detail="Direction must be all, outgoing, or incoming")
+        if type is not None and type not in ("deposit", "withdraw", "transfer"):
+            raise HTTPException(status_code=400, detail="Transaction type must be deposit, withdraw, or transfer")
+        if limit <= 0 or limit > 1000:
+            raise HTTPException(status_code=400, detail="Limit must be between 1 and 1000")
+
+        before = decode_history_cursor(cursor) if cursor else None
+        statements = crud.select_transaction_history(
+            account_id, direction=direction, transaction_type=type,
+            start=start, end=end, before=before, limit=limit
+        )
+        transactions = crud.merge_transaction_history([await fetch_all(stmt) for stmt in statements], limit)
+        if len(transactions) == limit:
+            last = transactions[-1]
+            response.headers[NEXT_CURSOR_HEADER] = encode_history_cursor(last.timestamp, last.id)
+        return transactions
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve transaction history: {str(e)}")
+
+def export_transaction_rows(account_id: int, format: str, direction: str, transaction_type: Optional[str],
+                            start: Optional[datetime], end: Optional[datetime]):
+    """Generate the export body chunk by chunk using its own DB session"""
+    db = SessionLocal()
+    try:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if format == "csv":
+            writer.writerow(EXPORT_COLUMNS)
+        rows = crud.stream_transaction_history(
+            db, account_id, direction=direction, transaction_type=transaction_type,
+            start=start, end=end, batch_size=TRANSACTION_EXPORT_BATCH_SIZE
+        )
+        for count, row in enumerate(rows, start=1):
+            record = {column: row._mapping[column] for column in EXPORT_COLUMNS}
+            record["timestamp"] = row.timestamp.isoformat()
+            if format != "csv":
+                # Same form as the API returns; CSV keeps the exact decimal text
+                record["amount"] = money_json(row.amount)
+            if format == "csv":
+                writer.writerow(record.values())
+            else:
+                buffer.write(json.dumps(record) + "\n")
+            # Flush one chunk per server-side batch
+            if count % TRANSACTION_EXPORT_BATCH_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        db.close()
+
+@app.get("/transactions/export")
+def export_transactions(
+    account_id: int,
+    format: str = "csv",
+    direction: str = "all",
+    type: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+):
+    if account_id <= 0:
+        raise HTTPException(status_code=400, detail="Account ID must be a positive integer")
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="Format must be csv or ndjson")
+    if direction not in ("all", "outgoing", "incoming"):
+        raise HTTPException(status_code=400, detail="Direction must be all, outgoing, or incoming")
+    if type is not None and type not in ("deposit", "withdraw", "transfer"):
+        raise HTTPException(status_code=400, detail="Transaction type must be deposit, withdraw, or transfer")
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_transaction_rows(account_id, format, direction, type, start, end),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=account_{account_id}_transactions.{format}"}
+    )
+
+@app.get("/transactions/stats", response_model=schemas.TransactionStatsResponse)
+async def read_transaction_stats(
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+    type: Optional[str] = None
+):
+    """Service-wide counts and sums per type and per UTC day, served from the daily rollup"""
+    try:
+        end = end or datetime.utcnow().date()
+        start = start or end - timedelta(days=29)
+        if start > end:
+            raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+        if (end - start).days >= TRANSACTION_STATS_MAX_DAYS:
+            raise HTTPException(status_code=400, detail=f"Date range cannot exceed {TRANSACTION_STATS_MAX_DAYS} days")
+        if type is not None and type not in ("deposit", "withdraw", "transfer"):
+            raise HTTPException(status_code=400, detail="Transaction type must be deposit, withdraw, or transfer")
+
+        daily = await fetch_rows(crud.select_daily_totals(start, end, transaction_type=type))
+        by_type = {}
+        for bucket in daily:
+            count, total = by_type.get(bucket.type, (0, ZERO))
+            by_type[bucket.type] = (count + bucket.count, total + bucket.total)
+        return {
+            "start": start,
+            "end": end,
+            "count": sum(count for count, _ in by_type.values()),
+            "total": sum((total for _, total in by_type.values()), ZERO),
+            "by_type": [
+                {"type": transaction_type, "count": count, "total": total}
+                for transaction_type, (count, total) in sorted(by_type.items())
+            ],
+            "daily": [
+                {"day": bucket.day, "type": bucket.type, "count": bucket.count, "total": bucket.total}
+                for bucket in daily
+            ]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve transaction stats: {str(e)}")
+
 @app.get("/transactions/{transaction_id}", response_model=schemas.TransactionResponse)
-def read_transaction(transaction_id: int, db: Session = Depends(get_db)):
+async def read_transaction(transaction_id: int):
     try:
         if transaction_id <= 0:
             raise HTTPException(status_code=400, detail="Transaction ID must be a positive integer")
         
-        db_transaction = crud.get_transaction(db, transaction_id)
+        db_transaction = await fetch_first(crud.select_transaction(transaction_id))
         if db_transaction is None:
             raise HTTPException(status_code=404, detail="Transaction not found")
         return db_transaction
@@ -177,5 +664,12 @@ def delete_transaction(transaction_id: int, db: Session = Depends(get_db)):
 
 # Graceful shutdown
 @app.on_event("shutdown")
-def shutdown_event():
-    rabbitmq_publisher.close()
\ No newline at end of file
+async def shutdown_event():
+    await account_client.close_client()
+    await dispose_async_engine()
+    outbox_relay.stop()
+    idempotency_purger.stop()
+    rabbitmq_publisher.close()
+    account_events_consumer.stop_consuming()
+    account_events_consumer.close()
+    shutdown_tracing()
\ No newline at end of file
@@ -0,0 +1,67 @@
+from contextlib import contextmanager
+from fastapi import HTTPException
+from prometheus_client import Counter, Histogram
+import time
+
+# Buckets from 1 ms to 10 s; the hops of a transaction are mostly in the low milliseconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+TRANSACTION_STAGE_SECONDS = Histogram(
+    "transaction_stage_duration_seconds",
+    "Time spent in one stage of applying a transaction",
+    ["stage"],  # account_service, db_commit, publish
+    buckets=LATENCY_BUCKETS
+)
+TRANSACTION_SECONDS = Histogram(
+    "transaction_duration_seconds",
+    "End-to-end time to apply a transaction",
+    ["type", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+ACCOUNT_SERVICE_CALL_SECONDS = Histogram(
+    "account_service_call_duration_seconds",
+    "Latency of balance-changing calls to Account Service",
+    ["operation", "status"],
+    buckets=LATENCY_BUCKETS
+)
+TRANSACTIONS_TOTAL = Counter("transactions_total", "Transactions applied", ["type"])
+TRANSACTION_AMOUNT_TOTAL = Counter("transaction_amount_total", "Money moved by applied transactions", ["type"])
+TRANSACTION_FAILURES = Counter("transaction_failures_total", "Transactions rejected or failed", ["type", "reason"])
+
+@contextmanager
+def observe_stage(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        TRANSACTION_STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - started)
+
+def failure_reason(error: Exception) -> str:
+    """Bucket a failure into a low-cardinality reason label"""
+    if not isinstance(error, HTTPException):
+        return "internal"
+    detail = str(error.detail)
+    if error.status_code == 404:
+        return "account_not_found"
+    if error.status_code == 400 and detail.startswith("Insufficient balance"):
+        return "insufficient_balance"
+    if error.status_code < 500:
+        return "rejected"
+    if detail.startswith("Account Service unavailable"):
+        return "account_service_circuit_open"
+    if detail.startswith("Cannot connect to Account Service"):
+        return "account_service_unavailable"
+    if detail.startswith("Failed to update account balance"):
+        return "account_service_error"
+    return "internal"
+
+def record_transaction(transaction_type: str, amount, started: float = None):
+    TRANSACTIONS_TOTAL.labels(type=transaction_type).inc()
+    TRANSACTION_AMOUNT_TOTAL.labels(type=transaction_type).inc(float(amount))
+    if started is not None:
+        TRANSACTION_SECONDS.labels(type=transaction_type, outcome="completed").observe(time.perf_counter() - started)
+
+def record_failure(transaction_type: str, reason: str, started: float = None):
+    TRANSACTION_FAILURES.labels(type=transaction_type, reason=reason).inc()
+    if started is not None:
+        TRANSACTION_SECONDS.labels(type=transaction_type, outcome="failed").observe(time.perf_counter() - started)
@@ -1,12 +1,56 @@
-from sqlalchemy import Column, Integer, Float, String, DateTime
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, Index
 from datetime import datetime
 from .database import Base
+from .money import Money
 
 class Transaction(Base):
     __tablename__ = "transactions"
     id = Column(Integer, primary_key=True, index=True)
     account_id = Column(Integer)
     type = Column(String)
-    amount = Column(Float)
+    amount = Column(Money())
     timestamp = Column(DateTime, default=datetime.utcnow)
     target_account_id = Column(Integer, nullable=True)
+    operation_key = Column(String(255), nullable=True, unique=True)  # sent to Account Service by batch items
+
+    # History lookups by source or target account, newest first
+    __table_args__ = (
+        Index("ix_transactions_account_id_timestamp", "account_id", "timestamp"),
+        Index("ix_transactions_target_account_id_timestamp", "target_account_id", "timestamp"),
+    )
+
+class TransactionDailyTotal(Base):
+    """Count and sum of one day's transactions of one type, kept current by every insert.
+
+    Each (day, type) is split over shard rows chosen by account id so that
+    concurrent transactions do not all update the same row.
+    """
+    __tablename__ = "transaction_daily_totals"
+    day = Column(Date, primary_key=True)  # UTC day of the transaction timestamp
+    type = Column(String, primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    transaction_count = Column(Integer, nullable=False, default=0)
+    total_amount = Column(Money(), nullable=False)
+
+class OutboxEvent(Base):
+    """Event waiting to be relayed to RabbitMQ, written in the same commit as its transaction"""
+    __tablename__ = "outbox_events"
+    id = Column(Integer, primary_key=True)
+    routing_key = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)  # JSON message body
+    headers = Column(Text, nullable=True)  # JSON message headers: trace context of the request that wrote it
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class IdempotencyKey(Base):
+    """Outcome of a POST /transactions or /transactions/batch request, replayed to retries that send the same key"""
+    __tablename__ = "idempotency_keys"
+    key = Column(String(255), primary_key=True)
+    request_hash = Column(String(64), nullable=False)  # sha256 of the request body
+    status = Column(String, nullable=False)  # pending, completed
+    response_code = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)  # JSON response body
+    owner = Column(String(32), nullable=True)  # request currently holding a pending key
+    lease_expires_at = Column(DateTime, nullable=True)  # renewed by the owner while it runs
+    operation_id = Column(String(32), nullable=True)  # sent to Account Service, kept across takeovers
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
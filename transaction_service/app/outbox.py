@@ -0,0 +1,96 @@
+from concurrent.futures import wait
+from prometheus_client import Counter
+from . import crud
+from .metrics import observe_stage
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_RELAY_BATCH_SIZE = int(os.getenv("OUTBOX_RELAY_BATCH_SIZE", "500"))
+# Seconds between outbox polls when nothing signals new events
+OUTBOX_RELAY_POLL_INTERVAL = float(os.getenv("OUTBOX_RELAY_POLL_INTERVAL", "1"))
+# Seconds to wait for the broker to confirm a relayed batch
+OUTBOX_RELAY_CONFIRM_TIMEOUT = float(os.getenv("OUTBOX_RELAY_CONFIRM_TIMEOUT", "30"))
+
+OUTBOX_RELAYED = Counter("outbox_events_relayed_total", "Outbox events confirmed by RabbitMQ and removed")
+OUTBOX_RELAY_ERRORS = Counter("outbox_relay_errors_total", "Outbox relay iterations that failed")
+
+class OutboxRelay:
+    """Background thread that moves outbox_events rows to RabbitMQ.
+
+    Rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED, handed to the
+    publisher in bulk, and deleted in the same DB transaction only once the
+    broker has confirmed them. A crash in between re-sends the rows on the
+    next pass, so delivery is at-least-once.
+    """
+
+    def __init__(self, session_factory, publisher, batch_size: int = OUTBOX_RELAY_BATCH_SIZE,
+                 poll_interval: float = OUTBOX_RELAY_POLL_INTERVAL):
+        self.session_factory = session_factory
+        self.publisher = publisher
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='outbox-relay', daemon=True)
+            self._thread.start()
+
+    def notify(self):
+        """Wake the relay right away after new events were committed"""
+        self._wakeup.set()
+
+    def stop(self, timeout: float = 10.0):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def relay_once(self) -> int:
+        """Relay one batch; returns the number of events confirmed"""
+        db = self.session_factory()
+        try:
+            events = crud.claim_outbox_events(db, limit=self.batch_size)
+            if not events:
+                db.rollback()
+                return 0
+            # Publish latency: handing the batch to the publisher until the broker confirms it
+            with observe_stage("publish"):
+                futures = self.publisher.publish_messages([
+                    (event.routing_key, json.loads(event.payload), json.loads(event.headers) if event.headers else {})
+                    for event in events
+                ])
+                wait(futures, timeout=OUTBOX_RELAY_CONFIRM_TIMEOUT)
+            confirmed_ids = [
+                event.id for event, future in zip(events, futures)
+                if future.done() and future.exception() is None
+            ]
+            if confirmed_ids:
+                crud.delete_outbox_events(db, confirmed_ids)
+            db.commit()
+            OUTBOX_RELAYED.inc(len(confirmed_ids))
+            return len(confirmed_ids)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            try:
+                # Keep draining while full batches go through
+                if self.relay_once() >= self.batch_size:
+                    continue
+            except Exception as e:
+                OUTBOX_RELAY_ERRORS.inc()
+                logger.error(f"Outbox relay failed: {e}")
+            self._wakeup.wait(self.poll_interval)
@@ -0,0 +1,48 @@
+from fastapi import HTTPException, Response
+from datetime import datetime
+from typing import Optional
+import base64
+
+# Response header carrying the opaque cursor for the next page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(last_id: int) -> str:
+    """Encode the id of the last row on a page as an opaque cursor"""
+    return base64.urlsafe_b64encode(f"id:{last_id}".encode()).decode()
+
+def decode_cursor(cursor: str) -> int:
+    """Decode a cursor produced by encode_cursor back into a row id"""
+    try:
+        prefix, value = base64.urlsafe_b64decode(cursor.encode()).decode().split(":", 1)
+        if prefix != "id":
+            raise ValueError(prefix)
+        return int(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def encode_history_cursor(timestamp: datetime, last_id: int) -> str:
+    """Encode the (timestamp, id) keyset position of the last history row"""
+    return base64.urlsafe_b64encode(f"ts:{timestamp.isoformat()}|id:{last_id}".encode()).decode()
+
+def decode_history_cursor(cursor: str) -> tuple:
+    """Decode a cursor produced by encode_history_cursor"""
+    try:
+        timestamp_part, id_part = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        if not timestamp_part.startswith("ts:") or not id_part.startswith("id:"):
+            raise ValueError(cursor)
+        return datetime.fromisoformat(timestamp_part[3:]), int(id_part[3:])
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def resolve_after_id(after_id: Optional[int], cursor: Optional[str]) -> Optional[int]:
+    """Keyset position from either ?cursor= or ?after_id= (cursor wins)"""
+    if cursor:
+        return decode_cursor(cursor)
+    if after_id is not None and after_id < 0:
+        raise HTTPException(status_code=400, detail="after_id must be non-negative")
+    return after_id
+
+def set_next_cursor(response: Response, items: list, limit: int):
+    """Advertise the next page only when this page came back full"""
+    if items and len(items) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(items[-1].id)
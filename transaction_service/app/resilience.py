@@ -0,0 +1,134 @@
+from collections import deque
+from prometheus_client import Counter, Gauge
+import math
+import os
+import random
+import threading
+import time
+
+# Guards for calls to another service: a circuit breaker that fails fast
+# while the dependency keeps failing, a retry budget that caps retries and
+# hedges at a fraction of normal traffic, and a timeout that follows the
+# dependency's observed latency instead of always waiting the maximum.
+
+# Consecutive failures that open the circuit, and how long it stays open
+# before a single trial call is let through
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "10"))
+# Every call earns RETRY_BUDGET_RATIO of a retry, saved up to RETRY_BUDGET_MAX_TOKENS
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.1"))
+RETRY_BUDGET_MAX_TOKENS = float(os.getenv("RETRY_BUDGET_MAX_TOKENS", "10"))
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "2"))
+RETRY_BACKOFF = float(os.getenv("RETRY_BACKOFF", "0.05"))
+# Send a second copy of a GET that is slower than the dependency's p95
+HEDGE_GETS = os.getenv("HEDGE_GETS", "false").lower() == "true"
+# Timeout is ADAPTIVE_TIMEOUT_MULTIPLIER x the recent p99, between
+# ADAPTIVE_TIMEOUT_MIN and the configured timeout for the dependency
+ADAPTIVE_TIMEOUT_MULTIPLIER = float(os.getenv("ADAPTIVE_TIMEOUT_MULTIPLIER", "4"))
+ADAPTIVE_TIMEOUT_MIN = float(os.getenv("ADAPTIVE_TIMEOUT_MIN", "1"))
+LATENCY_WINDOW = int(os.getenv("LATENCY_WINDOW", "200"))
+LATENCY_MIN_SAMPLES = 20
+
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+CIRCUIT_STATE = Gauge("dependency_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ["target"])
+CIRCUIT_REJECTIONS = Counter("dependency_circuit_rejections_total", "Calls failed fast by an open circuit", ["target"])
+RETRIES = Counter("dependency_retries_total", "Retries and hedged requests sent", ["target", "kind"])
+RETRY_BUDGET_EXHAUSTED = Counter("dependency_retry_budget_exhausted_total", "Retries and hedges skipped for lack of budget", ["target", "kind"])
+HEDGE_WINS = Counter("dependency_hedge_wins_total", "Hedged requests that answered before the original", ["target"])
+TIMEOUT_SECONDS = Gauge("dependency_timeout_seconds", "Current adaptive timeout", ["target"])
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open"""
+
+def _quantile(ordered, q: float) -> float:
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+class Dependency:
+    """Circuit breaker, retry budget and latency window for one downstream service.
+
+    Callers run acquire() before a call and then exactly one of
+    record_success() or record_failure() for it.
+    """
+
+    def __init__(self, name: str, max_timeout: float):
+        self.name = name
+        self.max_timeout = max_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started = None  # when the half-open trial call was let through
+        self._tokens = RETRY_BUDGET_MAX_TOKENS
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.labels(target=name).set(CLOSED)
+        TIMEOUT_SECONDS.labels(target=name).set(max_timeout)
+
+    def _set_state(self, state: int):
+        self._state = state
+        CIRCUIT_STATE.labels(target=self.name).set(state)
+
+    def acquire(self):
+        """Admit a call, or raise CircuitOpenError while the circuit is open"""
+        with self._lock:
+            now = time.monotonic()
+            if self._state == OPEN and now - self._opened_at >= CIRCUIT_RESET_TIMEOUT:
+                self._set_state(HALF_OPEN)
+                self._trial_started = None
+            # While half-open only one trial call is in flight; a trial that
+            # never reported back is replaced after CIRCUIT_RESET_TIMEOUT
+            if self._state == HALF_OPEN and (self._trial_started is None or now - self._trial_started >= CIRCUIT_RESET_TIMEOUT):
+                self._trial_started = now
+            elif self._state != CLOSED:
+                CIRCUIT_REJECTIONS.labels(target=self.name).inc()
+                raise CircuitOpenError(f"{self.name} circuit is open")
+            self._tokens = min(RETRY_BUDGET_MAX_TOKENS, self._tokens + RETRY_BUDGET_RATIO)
+
+    def record_success(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+            self._failures = 0
+            if self._state != CLOSED:
+                self._set_state(CLOSED)
+        TIMEOUT_SECONDS.labels(target=self.name).set(self.timeout())
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= CIRCUIT_FAILURE_THRESHOLD:
+                self._opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def try_retry(self, kind: str = "retry") -> bool:
+        """Spend one retry from the budget; False when it is used up"""
+        with self._lock:
+            if self._tokens < 1:
+                RETRY_BUDGET_EXHAUSTED.labels(target=self.name, kind=kind).inc()
+                return False
+            self._tokens -= 1
+        RETRIES.labels(target=self.name, kind=kind).inc()
+        return True
+
+    def retry_delay(self, attempt: int) -> float:
+        """Jittered backoff before retry number attempt"""
+        return RETRY_BACKOFF * attempt * random.uniform(0.5, 1.5)
+
+    def _recent_latencies(self):
+        with self._lock:
+            if len(self._latencies) < LATENCY_MIN_SAMPLES:
+                return None
+            return sorted(self._latencies)
+
+    def timeout(self) -> float:
+        """Seconds to wait for a call, from the recent p99 of successful calls"""
+        ordered = self._recent_latencies()
+        if ordered is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(ADAPTIVE_TIMEOUT_MIN, ADAPTIVE_TIMEOUT_MULTIPLIER * _quantile(ordered, 0.99)))
+
+    def hedge_delay(self):
+        """Seconds after which a GET gets a hedged copy, or None to not hedge"""
+        if not HEDGE_GETS:
+            return None
+        ordered = self._recent_latencies()
+        return None if ordered is None else _quantile(ordered, 0.95)
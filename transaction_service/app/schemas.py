@@ -1,11 +1,13 @@
 from pydantic import BaseModel, validator
 from typing import Optional
-from datetime import datetime
+from datetime import date, datetime
+from decimal import Decimal
+from .money import MONEY_JSON_ENCODERS, validate_money
 
 class TransactionCreate(BaseModel):
     account_id: int
     type: str  # deposit, withdraw, transfer
-    amount: float
+    amount: Decimal
     target_account_id: Optional[int] = None
 
     @validator('type')
@@ -16,6 +18,7 @@ class TransactionCreate(BaseModel):
 
     @validator('amount')
     def validate_amount(cls, v):
+        v = validate_money(v)
         if v <= 0:
             raise ValueError('Amount must be greater than 0')
         return v
@@ -24,15 +27,60 @@ class TransactionCreate(BaseModel):
     def validate_target_account(cls, v, values):
         if values.get('type') == 'transfer' and v is None:
             raise ValueError('Target account ID is required for transfer transactions')
+        if values.get('type') == 'transfer' and v == values.get('account_id'):
+            raise ValueError('Cannot transfer to the same account')
         return v
 
 class TransactionResponse(BaseModel):
     id: int
     account_id: int
     type: str
-    amount: float
+    amount: Decimal
     target_account_id: Optional[int]
     timestamp: datetime
 
     class Config:
         orm_mode = True
+        json_encoders = MONEY_JSON_ENCODERS
+
+class TransactionBatchItemResult(BaseModel):
+    index: int
+    status: str  # completed, failed, unknown (may have been applied; retry with the same Idempotency-Key)
+    transaction: Optional[TransactionResponse] = None
+    error: Optional[str] = None
+
+class TransactionBatchResponse(BaseModel):
+    total: int
+    succeeded: int
+    failed: int
+    elapsed_ms: float
+    throughput_per_second: float
+    results: list[TransactionBatchItemResult]
+
+class TransactionTypeTotal(BaseModel):
+    type: str
+    count: int
+    total: Decimal
+
+    class Config:
+        json_encoders = MONEY_JSON_ENCODERS
+
+class TransactionDailyBucket(BaseModel):
+    day: date
+    type: str
+    count: int
+    total: Decimal
+
+    class Config:
+        json_encoders = MONEY_JSON_ENCODERS
+
+class TransactionStatsResponse(BaseModel):
+    start: date
+    end: date
+    count: int
+    total: Decimal
+    by_type: list[TransactionTypeTotal]
+    daily: list[TransactionDailyBucket]
+
+    class Config:
+        json_encoders = MONEY_JSON_ENCODERS
@@ -0,0 +1,34 @@
+"""create transactions table
+
+Revision ID: 0001
+Revises:
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases bootstrapped by the old import-time create_all already have
+    # this table; adopt it as-is instead of failing
+    if sa.inspect(op.get_bind()).has_table('transactions'):
+        return
+    op.create_table(
+        'transactions',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('account_id', sa.Integer()),
+        sa.Column('type', sa.String()),
+        sa.Column('amount', sa.Float()),
+        sa.Column('timestamp', sa.DateTime()),
+        sa.Column('target_account_id', sa.Integer(), nullable=True)
+    )
+    op.create_index('ix_transactions_id', 'transactions', ['id'])
+
+
+def downgrade():
+    op.drop_index('ix_transactions_id', table_name='transactions')
+    op.drop_table('transactions')
@@ -0,0 +1,21 @@
+"""add transaction history indexes
+
+Revision ID: 0002
+Revises: 0001
+"""
+from alembic import op
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_transactions_account_id_timestamp', 'transactions', ['account_id', 'timestamp'])
+    op.create_index('ix_transactions_target_account_id_timestamp', 'transactions', ['target_account_id', 'timestamp'])
+
+
+def downgrade():
+    op.drop_index('ix_transactions_target_account_id_timestamp', table_name='transactions')
+    op.drop_index('ix_transactions_account_id_timestamp', table_name='transactions')
@@ -0,0 +1,27 @@
+"""store transaction amounts as NUMERIC(18, 2)
+
+Revision ID: 0005
+Revises: 0004
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('transactions') as batch_op:
+        batch_op.alter_column(
+            'amount',
+            type_=sa.Numeric(18, 2),
+            existing_type=sa.Float(),
+            postgresql_using='round(amount::numeric, 2)'
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('transactions') as batch_op:
+        batch_op.alter_column('amount', type_=sa.Float(), existing_type=sa.Numeric(18, 2))
@@ -0,0 +1,34 @@
+"""add transaction_daily_totals rollup
+
+Revision ID: 0006
+Revises: 0005
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'transaction_daily_totals',
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('type', sa.String(), primary_key=True),
+        sa.Column('shard', sa.Integer(), primary_key=True),
+        sa.Column('transaction_count', sa.Integer(), nullable=False),
+        sa.Column('total_amount', sa.Numeric(18, 2), nullable=False)
+    )
+    # Existing history goes into shard 0; new transactions spread over all
+    # shards and stats add the shards of a day back together
+    op.execute(
+        "INSERT INTO transaction_daily_totals (day, type, shard, transaction_count, total_amount) "
+        "SELECT date(timestamp), type, 0, COUNT(*), SUM(amount) FROM transactions "
+        "WHERE timestamp IS NOT NULL GROUP BY date(timestamp), type"
+    )
+
+
+def downgrade():
+    op.drop_table('transaction_daily_totals')
@@ -0,0 +1,22 @@
+"""add headers to outbox_events
+
+Revision ID: 0007
+Revises: 0006
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('outbox_events') as batch_op:
+        batch_op.add_column(sa.Column('headers', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('outbox_events') as batch_op:
+        batch_op.drop_column('headers')
@@ -0,0 +1,26 @@
+"""add owner leases and operation ids to idempotency_keys
+
+Revision ID: 0008
+Revises: 0007
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('idempotency_keys') as batch_op:
+        batch_op.add_column(sa.Column('owner', sa.String(32), nullable=True))
+        batch_op.add_column(sa.Column('lease_expires_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('operation_id', sa.String(32), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('idempotency_keys') as batch_op:
+        batch_op.drop_column('operation_id')
+        batch_op.drop_column('lease_expires_at')
+        batch_op.drop_column('owner')
@@ -0,0 +1,24 @@
+"""add operation keys to transactions
+
+Revision ID: 0009
+Revises: 0008
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('transactions') as batch_op:
+        batch_op.add_column(sa.Column('operation_key', sa.String(255), nullable=True))
+    op.create_index('ix_transactions_operation_key', 'transactions', ['operation_key'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_transactions_operation_key', table_name='transactions')
+    with op.batch_alter_table('transactions') as batch_op:
+        batch_op.drop_column('operation_key')
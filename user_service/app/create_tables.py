@@ -0,0 +1,9 @@
+"""Create User Service's tables. Run once before starting the server workers:
+
+    python -m app.create_tables
+"""
+from .database import Base, engine
+from . import models  # registers the tables on Base
+
+if __name__ == "__main__":
+    Base.metadata.create_all(bind=engine)
@@ -1,14 +1,31 @@
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from . import models, schemas
 
+# select_* build read statements that run on either the sync Session or,
+# through database.fetch_all, the optional AsyncSession
+
+def select_user(user_id: int):
+    return select(models.User).where(models.User.id == user_id)
+
+def select_users(skip: int = 0, limit: int = 100, after_id: int = None, ids: list = None):
+    # Keyset pagination over the primary key; skip is only a legacy fallback
+    stmt = select(models.User).order_by(models.User.id).limit(limit)
+    if ids is not None:
+        # Bulk lookup: one IN (...) query instead of a GET per user
+        stmt = stmt.where(models.User.id.in_(ids))
+    if after_id is not None:
+        return stmt.where(models.User.id > after_id)
+    return stmt.offset(skip)
+
 def get_user(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+    return db.scalars(select_user(user_id)).first()
 
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.User).offset(skip).limit(limit).all()
+def get_users(db: Session, skip: int = 0, limit: int = 100, after_id: int = None):
+    return db.scalars(select_users(skip, limit, after_id)).all()
 
 def create_user(db: Session, user: schemas.UserCreate):
     db_user = models.User(name=user.name, email=user.email, phone=user.phone)
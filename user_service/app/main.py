@@ -1,17 +1,36 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 from prometheus_fastapi_instrumentator import Instrumentator
-from . import models, schemas, crud
-from .database import Base, engine, SessionLocal
+from typing import Optional
+from . import models, schemas, crud, lifecycle
+from .pagination import parse_ids, resolve_after_id, set_next_cursor
+from .database import Base, engine, async_engine, SessionLocal, fetch_all, fetch_first, dispose_async_engine
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rabbitmq_utils import RabbitMQPublisher
 
-app = FastAPI(title="User Service", version="1.0.0")
+# Single-process servers create tables on startup; the production image runs
+# python -m app.create_tables once before it starts the workers instead
+CREATE_TABLES_ON_STARTUP = os.getenv("USER_SERVICE_CREATE_TABLES_ON_STARTUP", "true").lower() == "true"
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+app = FastAPI(title="User Service", version="1.0.0")
 
 # Prometheus metrics instrumentation
 Instrumentator().instrument(app).expose(app)
 
+# Initialize RabbitMQ Publisher
+rabbitmq_publisher = RabbitMQPublisher()
+
+# Connections opened at startup; GET /ready waits for them
+pool_warmup = lifecycle.PoolWarmup(engine, async_engine)
+
+@app.on_event("startup")
+async def startup_event():
+    if CREATE_TABLES_ON_STARTUP:
+        Base.metadata.create_all(bind=engine)
+    pool_warmup.start()
+
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
@@ -24,6 +43,21 @@ def get_db():
 def read_root():
     return {"message": "User Service is running"}
 
+@app.get("/ready")
+def read_ready(response: Response):
+    """Readiness probe: 200 once this worker's database pool is warm and reachable"""
+    return lifecycle.readiness(
+        response,
+        {"database": lifecycle.database_ready(engine), "pool_warm": pool_warmup.done}
+    )
+
+def publish_user_event(routing_key: str, user_id: int):
+    """Publish user lifecycle event so Account Service can keep its user cache current"""
+    try:
+        rabbitmq_publisher.publish_message(routing_key, {'user_id': user_id})
+    except Exception as e:
+        print(f"Failed to publish user event: {e}")  # Don't fail the request for event errors
+
 # CRUD Endpoints
 @app.post("/users", response_model=schemas.UserResponse)
 def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
@@ -34,6 +68,7 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
             raise HTTPException(status_code=400, detail="Email already registered")
         
         db_user = crud.create_user(db, user)
+        publish_user_event('user.created', db_user.id)
         return db_user
     except HTTPException:
         raise
@@ -41,14 +76,18 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Failed to create user: {str(e)}")
 
 @app.get("/users", response_model=list[schemas.UserResponse])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+async def read_users(response: Response, skip: int = 0, limit: int = 100, after_id: Optional[int] = None, cursor: Optional[str] = None, ids: Optional[str] = None):
     try:
         if skip < 0:
             raise HTTPException(status_code=400, detail="Skip parameter must be non-negative")
         if limit <= 0 or limit > 1000:
             raise HTTPException(status_code=400, detail="Limit must be between 1 and 1000")
         
-        users = crud.get_users(db, skip=skip, limit=limit)
+        # ?ids=1,2,3 returns just those users (unknown ids are left out)
+        users = await fetch_all(crud.select_users(
+            skip=skip, limit=limit, after_id=resolve_after_id(after_id, cursor), ids=parse_ids(ids)
+        ))
+        set_next_cursor(response, users, limit)
         return users
     except HTTPException:
         raise
@@ -56,12 +95,12 @@ def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Failed to retrieve users: {str(e)}")
 
 @app.get("/users/{user_id}", response_model=schemas.UserResponse)
-def read_user(user_id: int, db: Session = Depends(get_db)):
+async def read_user(user_id: int):
     try:
         if user_id <= 0:
             raise HTTPException(status_code=400, detail="User ID must be a positive integer")
         
-        db_user = crud.get_user(db, user_id)
+        db_user = await fetch_first(crud.select_user(user_id))
         if db_user is None:
             raise HTTPException(status_code=404, detail="User not found")
         return db_user
@@ -85,9 +124,15 @@ def delete_user(user_id: int, db: Session = Depends(get_db)):
         # In a real application, you might want to prevent deletion of users with active accounts
         
         crud.delete_user(db, user_id)
+        publish_user_event('user.deleted', user_id)
         return {"message": f"User {user_id} deleted successfully"}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete user: {str(e)}")
     
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    rabbitmq_publisher.close()
+    await dispose_async_engine()
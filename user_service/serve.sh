@@ -0,0 +1,13 @@
+#!/bin/sh
+# Serve app.main:app on port $1 with WEB_CONCURRENCY uvicorn worker processes.
+# Schema changes are applied once before this script runs, never per worker.
+set -e
+WEB_CONCURRENCY="${WEB_CONCURRENCY:-1}"
+if [ "$WEB_CONCURRENCY" -gt 1 ]; then
+    # Each worker writes its metrics to files that /metrics merges, so a
+    # scrape sees the whole pod whichever worker answers it
+    export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus-multiproc}"
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+exec uvicorn app.main:app --host 0.0.0.0 --port "$1" --workers "$WEB_CONCURRENCY"